@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: capturetool.py
+# PURPOSE: Display, check and replay modbus capture files written by
+#          genmon (see capturefile in genmon.conf)
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+# Free software. Use at your own risk.
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, sys, time, datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from genmonlib import mycapture, mycrc, mymodbus
+
+#------------------- Usage -----------------#
+def Usage():
+
+    print("Usage: capturetool.py dump|check|replay <capture file> [log location]")
+    print("   dump    display each frame in the capture file")
+    print("   check   verify the CRC of each frame and show response time statistics")
+    print("   replay  replay the capture through the modbus protocol layer at full speed")
+    sys.exit(2)
+
+#------------------- Dump -----------------#
+def Dump(FileName):
+
+    Reader = mycapture.CaptureReader(FileName)
+    print("Capture created " + str(datetime.datetime.fromtimestamp(Reader.Created)))
+    for Type, Flags, Timestamp, Latency, Frame in Reader.Records():
+        Time = datetime.datetime.fromtimestamp(Timestamp).strftime("%H:%M:%S.%f")
+        Status = "" if Flags & mycapture.CAPTURE_CRC_OK else " CRC Error"
+        if Type == mycapture.CAPTURE_MASTER:
+            Latency = ""
+        else:
+            Latency = "%7.1fms" % (Latency * 1000)
+        print("%s %-7s %9s %s%s" % (Time, mycapture.CAPTURE_TYPE_NAMES[Type], Latency, " ".join("%02x" % x for x in Frame), Status))
+    Reader.Close()
+
+#------------------- Check -----------------#
+def Check(FileName):
+
+    Reader = mycapture.CaptureReader(FileName)
+    Frames = []
+    Latencies = []
+    Counts = [0] * len(mycapture.CAPTURE_TYPE_NAMES)
+    for Type, Flags, Timestamp, Latency, Frame in Reader.Records():
+        Counts[Type] += 1
+        if Type == mycapture.CAPTURE_MASTER or Type == mycapture.CAPTURE_SLAVE:
+            Frames.append(Frame)
+        if Type == mycapture.CAPTURE_SLAVE:
+            Latencies.append(Latency)
+    Reader.Close()
+
+    Results = mycrc.CheckFrames(Frames)
+    for Index in range(0, len(Counts)):
+        print("%-8s frames: %d" % (mycapture.CAPTURE_TYPE_NAMES[Index], Counts[Index]))
+    print("CRC errors: %d" % Results.count(False))
+    if len(Latencies):
+        print("Response time (min/avg/max): %.1f / %.1f / %.1f ms" % (min(Latencies) * 1000, sum(Latencies) * 1000 / len(Latencies), max(Latencies) * 1000))
+
+#------------------- Replay -----------------#
+def Replay(FileName, LogLocation):
+
+    Reader = mycapture.CaptureReader(FileName)
+    MasterFrames = [list(Frame) for Type, Flags, Timestamp, Latency, Frame in Reader.Records() if Type == mycapture.CAPTURE_MASTER]
+    Reader.Close()
+    if not len(MasterFrames):
+        print("No master frames in capture file")
+        return
+
+    Updates = [0]
+    def UpdateRegisterList(Register, Value):
+        Updates[0] += 1
+
+    # the capture holds any retries genmon sent, so the replay must not add its own
+    ModBus = mymodbus.ModbusProtocol(UpdateRegisterList, MasterFrames[0][mymodbus.MBUS_ADDRESS], mycapture.REPLAY_PREFIX + FileName, loglocation = LogLocation, retries = 0)
+    ModBus.Slave.StartReadThread()
+    Failed = 0
+    StartTime = time.time()
+    for MasterPacket in MasterFrames:
+        if not ModBus.ProcessOneTransaction(MasterPacket):
+            Failed += 1
+    Elapsed = time.time() - StartTime
+    ModBus.Close()
+
+    print("%d transactions in %.3f sec, %.0f transactions/sec" % (len(MasterFrames), Elapsed, len(MasterFrames) / max(Elapsed, 0.000001)))
+    print("%d register updates, %d failed transactions, %d frames not found in capture" % (Updates[0], Failed, ModBus.Slave.ReplayMismatch))
+
+#------------------- Command-line interface for capturetool -----------------#
+if __name__=='__main__':
+
+    if len(sys.argv) < 3:
+        Usage()
+
+    Command = sys.argv[1]
+    FileName = sys.argv[2]
+    LogLocation = "/var/log/" if len(sys.argv) < 4 else sys.argv[3]
+
+    if Command == "dump":
+        Dump(FileName)
+    elif Command == "check":
+        Check(FileName)
+    elif Command == "replay":
+        Replay(FileName, LogLocation)
+    else:
+        Usage()
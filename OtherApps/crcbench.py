@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: crcbench.py
+# PURPOSE: Compare the speed of the built in table CRC16 and the crcmod
+#          C extension, and measure frame validation throughput
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+# Free software. Use at your own risk.
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, sys, time, random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from genmonlib import mycrc
+
+#------------------- MakeFrames -----------------#
+# build valid modbus read response frames with a random payload
+def MakeFrames(count, registers):
+
+    Frames = []
+    for i in range(0, count):
+        Frame = bytearray([0x9d, 0x03, registers * 2])
+        Frame += bytearray(random.randint(0, 255) for x in range(0, registers * 2))
+        CRCValue = mycrc.TableCRC16(Frame)
+        Frame.append(CRCValue & 0x00FF)
+        Frame.append(CRCValue >> 8)
+        Frames.append(Frame)
+    return Frames
+
+#------------------- Measure -----------------#
+def Measure(Name, CRCFunction, Frames):
+
+    StartTime = time.time()
+    for Frame in Frames:
+        CRCFunction(Frame)
+    Elapsed = time.time() - StartTime
+    print("%-10s %8d frames %8.3f sec %10.0f frames/sec" % (Name, len(Frames), Elapsed, len(Frames) / Elapsed))
+
+#------------------- Command-line interface for crcbench -----------------#
+if __name__=='__main__':
+
+    Count = 10000
+    if len(sys.argv) > 1:
+        Count = int(sys.argv[1])
+
+    print("CRC engine in use: " + mycrc.CRC_ENGINE)
+    for Registers in [1, 16, 125]:
+        Frames = MakeFrames(Count, Registers)
+        print("\nResponse frames with %d registers (%d bytes):" % (Registers, len(Frames[0])))
+
+        Measure("table", mycrc.TableCRC16, Frames)
+        if mycrc.CrcmodCRC16 != None:
+            Measure("crcmod", mycrc.CrcmodCRC16, Frames)
+        Measure("memoryview", mycrc.CRC16, [memoryview(Frame) for Frame in Frames])
+
+        StartTime = time.time()
+        Results = mycrc.CheckFrames(Frames)
+        Elapsed = time.time() - StartTime
+        print("%-10s %8d frames %8.3f sec %10.0f frames/sec, %d invalid" % ("validate", len(Frames), Elapsed, len(Frames) / Elapsed, Results.count(False)))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: gensim.py
+# PURPOSE: Run a simulated generator controller on a pseudo-terminal so
+#          genmon can be tested without a generator
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+# Free software. Use at your own risk.
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, sys, time, getopt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from genmonlib import mysimulator
+
+#------------------- Usage -----------------#
+def Usage():
+
+    print("Usage: gensim.py [-p product] [-l latency ms] [-j jitter ms] [-c crc error rate] [-n noise rate] [-e events] [-s link] [-o log location]")
+    print("   -p  evoac, evolc, nexusac or nexuslc (default evoac)")
+    print("   -l  response latency in milliseconds (default 30)")
+    print("   -j  random extra latency in milliseconds (default 0)")
+    print("   -c  fraction of responses sent with a bad CRC, i.e. 0.01 (default 0)")
+    print("   -n  fraction of responses sent after a burst of noise, i.e. 0.01 (default 0)")
+    print("   -e  scripted events seconds:event[:value],... events are outage, utility,")
+    print("       alarm:<code>, clearalarm, exercise, start and stop")
+    print("       i.e. 30:outage,120:utility,200:alarm:2720,300:clearalarm")
+    print("   -s  create a symbolic link to the pseudo-terminal, i.e. /tmp/gensim")
+    print("   -o  log file location (default /var/log/)")
+    print("Set port in genmon.conf to the pseudo-terminal name (or the link) to use the simulator.")
+    sys.exit(2)
+
+#------------------- Command-line interface for gensim -----------------#
+if __name__=='__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:l:j:c:n:e:s:o:")
+    except getopt.GetoptError:
+        Usage()
+
+    Product = "evoac"
+    Latency = 30
+    Jitter = 0
+    CrcErrorRate = 0.0
+    NoiseRate = 0.0
+    Events = None
+    Link = None
+    LogLocation = "/var/log/"
+    for opt, arg in opts:
+        if opt == "-h":
+            Usage()
+        elif opt == "-p":
+            Product = arg.lower()
+        elif opt == "-l":
+            Latency = float(arg)
+        elif opt == "-j":
+            Jitter = float(arg)
+        elif opt == "-c":
+            CrcErrorRate = float(arg)
+        elif opt == "-n":
+            NoiseRate = float(arg)
+        elif opt == "-e":
+            Events = arg
+        elif opt == "-s":
+            Link = arg
+        elif opt == "-o":
+            LogLocation = arg
+
+    Simulator = mysimulator.ControllerSimulator(Product, Latency = Latency / 1000.0, Jitter = Jitter / 1000.0,
+                CrcErrorRate = CrcErrorRate, Events = Events, NoiseRate = NoiseRate, loglocation = LogLocation)
+
+    if Link != None:
+        if os.path.islink(Link):
+            os.remove(Link)
+        os.symlink(Simulator.PortName, Link)
+
+    Simulator.Start()
+    print("Simulating %s controller on %s" % (Product, Simulator.PortName if Link == None else Link + " (" + Simulator.PortName + ")"))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+    Simulator.Close()
+    if Link != None and os.path.islink(Link):
+        os.remove(Link)
+    print("\n".join(Simulator.GetStats()))
@@ -12,7 +12,7 @@
 
 import datetime, time, sys, signal, os, threading, socket
 import atexit
-from genmonlib import myclient, mylog
+from genmonlib import myclient, mylog, myalarms
 import RPi.GPIO as GPIO
 
 
@@ -91,6 +91,17 @@ if __name__=='__main__': # usage program.py [server_address]
         GPIO.setup(ER_GOVERNOR, GPIO.OUT, initial=GPIO.LOW)
         GPIO.setup(ER_WARNING, GPIO.OUT, initial=GPIO.LOW)
 
+        # output for each alarm code family
+        FamilyPins = {  myalarms.FAMILY_SPEED : ER_SPEED,
+                        myalarms.FAMILY_LOW_OIL : ER_LOW_OIL,
+                        myalarms.FAMILY_HIGH_TEMP : ER_HIGH_TEMP,
+                        myalarms.FAMILY_RPM_SENSE : ER_RPM_SENSE,
+                        myalarms.FAMILY_VOLTAGE : ER_VOLTAGE,
+                        myalarms.FAMILY_OVERCRANK : ER_OVERCRANK,
+                        myalarms.FAMILY_OVERLOAD : ER_OVERLOAD,
+                        myalarms.FAMILY_GOVERNOR : ER_GOVERNOR,
+                        myalarms.FAMILY_WARNING : ER_WARNING}
+
         LastEvent = ""
 
         data = MyClientInterface.ProcessMonitorCommand("generator: monitor")
@@ -148,41 +159,10 @@ if __name__=='__main__': # usage program.py [server_address]
                     data = MyClientInterface.ProcessMonitorCommand("generator: getregvalue=05f1")
                     LastErrorCode = int(data,16)
 
-                    # Overspeed/Underspeed (alarms 1200-1206, 1600-1603)
-                    if 1200 <= LastErrorCode <= 1206 or 1600 <= LastErrorCode <= 1603:
-                        GPIO.output(ER_SPEED,GPIO.HIGH)
-
-                    # Low Oil (alarm 1300)
-                    if LastErrorCode == 1300:
-                        GPIO.output(ER_LOW_OIL,GPIO.HIGH)
-
-                    # High Temp (alarm 1400)
-                    if LastErrorCode == 1400:
-                        GPIO.output(ER_HIGH_TEMP,GPIO.HIGH)
-
-                    # RPM Sensor (alarm 1500-1521)
-                    if 1500 <= LastErrorCode <= 1521:
-                        GPIO.output(ER_RPM_SENSE,GPIO.HIGH)
-
-                    # Overvoltage/Undervoltage (alarm 1800-1803, 1900-1906)
-                    if 1800 <= LastErrorCode <= 1803 or 1900 <= LastErrorCode <= 1906:
-                        GPIO.output(ER_VOLTAGE,GPIO.HIGH)
-
-                    # Overcrank (alarm 1100-1101)
-                    if 1100 <= LastErrorCode <= 1101:
-                        GPIO.output(ER_OVERCRANK,GPIO.HIGH)
-
-                    # Overload (alarm 2100-2103)
-                    if 2100 <= LastErrorCode <= 2103:
-                        GPIO.output(ER_OVERLOAD,GPIO.HIGH)
-
-                    # Governor (alarm 2500-2502)
-                    if 2500 <= LastErrorCode <= 2502:
-                        GPIO.output(ER_GOVERNOR,GPIO.HIGH)
-
-                    # Warning (alarm 0000)
-                    if 0000 == LastErrorCode:
-                        GPIO.output(ER_WARNING,GPIO.HIGH)
+                    # alarm code families (i.e. RPM Sensor is alarm 1500-1521) are in myalarms
+                    Family = myalarms.GetAlarmFamily(LastErrorCode)
+                    if Family in FamilyPins:
+                        GPIO.output(FamilyPins[Family],GPIO.HIGH)
 
                 else:
                     GPIO.output(ER_SPEED,GPIO.LOW)
@@ -27,7 +27,7 @@ try:
 except ImportError as e:
     from configparser import RawConfigParser
 
-from genmonlib import myserial, mymail, mylog, mythread, mymodbus
+from genmonlib import myserial, mymail, mylog, mythread, mymodbus, myregisters, myscheduler, mymodbusserver, myscanner, mywrite, myeventloop, myevents, myhistory, myalarms
 
 
 GENMON_VERSION = "V1.6.5"
@@ -52,14 +52,42 @@ NEXUS_ALARM_LOG_STRIDE          = 4
 NEXUS_ALARM_LOG_END_REG         = ((NEXUS_ALARM_LOG_STARTING_REG + (NEXUS_ALARM_LOG_STRIDE * LOG_DEPTH)) - NEXUS_ALARM_LOG_STRIDE)
 
 DEFAULT_THRESHOLD_VOLTAGE = 143
+COMM_TIMEOUT            = 4         # seconds without a valid response before communications are reported lost
+MONITOR_INTERVAL        = 5         # minimum seconds between console displays
+# registers read by CheckForAlarms and CheckForOutage
+ALARM_CHECK_REGISTERS   = ["0001", "05f1", "0009", "0011", "023b", "0053"]
+# registers read by GetPowerOutput
+POWER_REGISTERS         = ["0001", "05f1", "0012", "0058", "05f4", "05f5"]
 DEFAULT_PICKUP_VOLTAGE = 190
+
+# read planner defaults, registers are merged into range reads (lengths in words)
+DEFAULT_READ_SPAN       = 32        # max number of registers in one range read
+DEFAULT_READ_GAP        = 8         # max number of unused registers bridged in a range read
+MAX_READ_SPAN           = 125       # modbus limit for registers in one read request
+DEFAULT_POLL_MIN_INTERVAL = 1.0     # fastest poll interval (seconds) for base registers that change
+DEFAULT_POLL_MAX_INTERVAL = 30.0    # slowest poll interval (seconds) for base registers that do not change
+READ_PLAN_MAX_FAILURES  = 3         # split a range read into single reads after N failures
+DEFAULT_LOG_READ_SPAN   = 100       # max registers (words) in one log range read
+READ_REQUEST_TIMEOUT    = 10        # seconds a readregvalue request may wait in the transaction queue
+SCAN_REFRESH_INTERVAL   = 10        # seconds between reads of the registers found by the register scan (enabledebug)
+MAX_UNITS               = 16        # max generators (config sections GenMon, GenMon2 ... GenMon16) in one genmon
+# options in the GenMon section that are not used for the other units, all other options
+# not in a unit section (i.e. GenMon2) are taken from the GenMon section
+UNIT_LOCAL_OPTIONS      = ["port", "tcpaddress", "sitename", "capturefile", "kwlog", "outagelog", "modbusserverport", "modbusserverwrite",
+                            "evolutioncontroller", "liquidcooled", "nominalfrequency", "nominalrpm", "nominalkw", "model", "fueltype"]
 #------------ GeneratorDevice class --------------------------------------------
 class GeneratorDevice:
 
-    def __init__(self):
+    def __init__(self, Unit = 1, Parent = None):
         self.ProgramName = "Generator Monitor"
+        self.Unit = Unit            # unit number, 1 is read from the GenMon section, N from GenMonN
+        self.Parent = Parent        # GeneratorDevice of unit 1, None for unit 1
+        self.Units = {Unit : self}  # unit number : GeneratorDevice, all units are managed by unit 1
+        self.UnitNumbers = []       # unit numbers (other than 1) found in the config file
+        self.UnitSuffix = "" if Unit == 1 else "%d" % Unit     # added to file names of units other than 1
         self.BaudRate = 9600        # data rate of the serial port (default 9600)
-        self.Registers = {}         # dict for registers and values
+        self.Registers = myregisters.RegisterFile()     # register values, hex string dict compatible
+        self.DecodeCache = myregisters.DecodeCache(self.Registers)  # values decoded from the registers (engine state, alarms)
         self.RegistersUnderTest = {}# dict for registers we are testing
         self.RegistersUnderTestData = ""
         self.NotChanged = 0         # stats for registers
@@ -72,9 +100,9 @@ class GeneratorDevice:
         self.GeneratorInAlarm = False       # Flag to let the heartbeat thread know there is a problem
         self.SystemInOutage = False         # Flag to signal utility power is out
         self.TransferActive = False         # Flag to signal transfer switch is allowing gen supply power
-        self.CommunicationsActive = False   # Flag to let the heartbeat thread know we are communicating
         self.CommAccessLock = threading.RLock()  # lock to synchronize access to the serial port comms
-        self.CheckForAlarmEvent = threading.Event() # Event to signal checking for alarm
+        self.EventBus = myevents.EventBus()         # register changes published by UpdateRegisterList
+        self.EventQueues = {}       # thread name : myevents.EventQueue of the thread
         self.UtilityVoltsMin = 0    # Minimum reported utility voltage above threshold
         self.UtilityVoltsMax = 0    # Maximum reported utility voltage above pickup
         self.MailInit = False       # set to true once mail is init
@@ -192,6 +220,8 @@ class GeneratorDevice:
         self.REGLEN = 0
         self.REGMONITOR = 1
 
+        self.RegisterMap = self.BuildRegisterMap()  # length, class and controller of each register by address
+
         self.Address = 0x9d
         self.LogLocation = "/var/log/"
         self.SiteName = "Home"
@@ -215,21 +245,52 @@ class GeneratorDevice:
         self.NominalKW = "Unknown"
         self.Model = "Unknown"
         self.PowerLogMaxSize = 15       # 15 MB max size
-        self.PowerLog =  os.path.dirname(os.path.realpath(__file__)) + "/kwlog.txt"
-        self.OutageLog = os.path.dirname(os.path.realpath(__file__)) + "/outage.txt"
-        self.FeedbackLogFile = os.path.dirname(os.path.realpath(__file__)) + "/feedback.json"
+        self.PowerLog =  os.path.dirname(os.path.realpath(__file__)) + "/kwlog" + self.UnitSuffix + ".txt"
+        self.OutageLog = os.path.dirname(os.path.realpath(__file__)) + "/outage" + self.UnitSuffix + ".txt"
+        self.FeedbackLogFile = os.path.dirname(os.path.realpath(__file__)) + "/feedback" + self.UnitSuffix + ".json"
         self.DisableOutageCheck = False
         self.bSyncTime = False          # Sync gen to system time
         self.bSyncDST = False           # sync time at DST change
         self.bDST = False               # Daylight Savings Time active if True
         self.bEnhancedExerciseFrequency = False     # True if controller supports biweekly and monthly exercise times
+        self.ReadSpan = DEFAULT_READ_SPAN   # max registers (words) in one range read
+        self.ReadGap = DEFAULT_READ_GAP     # max unused registers (words) bridged in one range read
+        self.BaseReadPlan = []              # list of range reads for base registers
+        self.PrimeReadPlan = []             # list of range reads for prime registers
+        self.PollMinInterval = DEFAULT_POLL_MIN_INTERVAL
+        self.PollMaxInterval = DEFAULT_POLL_MAX_INTERVAL
+        self.Scheduler = None               # adaptive poll schedule for base and prime registers
+        self.LastStatusSequence = 0         # sequence number of the status register (0001) when last checked
+        self.CycleBlocks = set()            # ids of the read plan blocks read since the registers were last published
+        self.LogRefreshIncremental = 0      # log refreshes that read only the new log entries
+        self.LogRefreshFull = 0             # log refreshes that read the whole log
+        self.LogReadSpan = DEFAULT_LOG_READ_SPAN    # max registers (words) in one log range read, reduced if the controller rejects it
+        self.CaptureFile = None             # file to capture modbus traffic to, None if not capturing
+        self.Transport = mymodbus.TRANSPORT_SERIAL  # serial or tcp (modbus RTU over TCP)
+        self.TcpAddress = None              # host name or address of the serial to ethernet converter
+        self.TcpPort = 502
+        self.ModbusServer = None            # Modbus TCP server for other clients (i.e. a BMS)
+        self.ModbusServerPort = 0           # port of the Modbus TCP server, zero if disabled
+        self.ModbusServerWriteList = []     # registers (int) the Modbus TCP server clients may write
+        self.Scanner = None                 # register discovery (enabledebug)
+        self.RegisterMapFile = os.path.dirname(os.path.realpath(__file__)) + "/registermap.json"
+        self.TimeoutSlack = mymodbus.DEFAULT_TIMEOUT_SLACK  # seconds added to the wire time of a transaction for the controller to respond
+        self.ReadRetries = mymodbus.DEFAULT_RETRIES         # retries of a failed read
+        self.ModbusEngine = mymodbus.ENGINE_THREAD          # thread, or eventloop to service the transports of all units from one thread
+        self.EventLoop = None               # myeventloop.EventLoop shared by the units, owned by unit 1
+        self.HistoryDepth = myhistory.DEFAULT_HISTORY_DEPTH # samples of each register kept in memory, zero to disable
+        self.HistoryInterval = myhistory.DEFAULT_HISTORY_INTERVAL   # minimum seconds between samples of a register
+        self.History = None                 # myhistory.RegisterHistory of the base and prime registers
 
         # read config file
         if not self.GetConfig():
             return None
 
+        if self.HistoryDepth:
+            self.History = myhistory.RegisterHistory(self.HistoryDepth, self.HistoryInterval)
+
         # log errors in this module to a file
-        self.log = mylog.SetupLogger("genmon", self.LogLocation + "genmon.log")
+        self.log = mylog.SetupLogger("genmon" + self.UnitSuffix, self.LogLocation + "genmon" + self.UnitSuffix + ".log")
 
         if self.NewInstall:
             self.LogError("New version detected: Old = %s, New = %s" % (self.Version, GENMON_VERSION))
@@ -244,70 +305,125 @@ class GeneratorDevice:
 
         try:
             #Starting device connection
-            self.ModBus = mymodbus.ModbusProtocol(self.UpdateRegisterList, self.Address, self.SerialPort, self.BaudRate, loglocation = self.LogLocation)
-            self.Threads["SerialReadThread"] = self.ModBus.Slave.StartReadThread()
+            self.OpenModbus()
 
         except Exception as e1:
             self.FatalError("Error opening serial device: " + str(e1))
             return None
 
-        # init mail, start processing incoming email
-        self.mail = mymail.MyMail(monitor=True, incoming_folder = self.IncomingEmailFolder, processed_folder =self.ProcessedEmailFolder,incoming_callback = self.ProcessCommand)
+        # init mail, start processing incoming email, the other units use the mail of unit 1
+        if self.Parent == None:
+            self.mail = mymail.MyMail(monitor=True, incoming_folder = self.IncomingEmailFolder, processed_folder =self.ProcessedEmailFolder,incoming_callback = self.ProcessCommand)
+        else:
+            self.mail = self.Parent.mail
         self.MailInit = True
 
         # send mail to tell we are starting
         self.mail.sendEmail("Generator Monitor Starting at " + self.SiteName, "Generator Monitor Starting at " + self.SiteName , msgtype = "info")
 
-        # check for ALARM.txt file present
+        # check for ALARM.txt file present, read it into the alarm catalogue
         try:
             self.AlarmFile = os.path.dirname(os.path.realpath(__file__)) + "/ALARMS.txt"
-            with open(self.AlarmFile,"r") as AlarmFile:     #
-                self.printToScreen("Validated alarm file present")
+            self.AlarmCatalogue = myalarms.AlarmCatalogue(self.AlarmFile)
+            self.printToScreen("Validated alarm file present")
         except Exception as e1:
             self.FatalError("Unable to open alarm file: " + str(e1))
 
-        if self.mail.GetSendEmailThreadObject():
-            self.Threads["SendMailThread"] = self.mail.GetSendEmailThreadObject()
-        if self.mail.GetEmailMonitorThreadObject():
-            self.Threads["EmailCommandThread"] = self.mail.GetEmailMonitorThreadObject()
+        if self.Parent == None:
+            if self.mail.GetSendEmailThreadObject():
+                self.Threads["SendMailThread"] = self.mail.GetSendEmailThreadObject()
+            if self.mail.GetEmailMonitorThreadObject():
+                self.Threads["EmailCommandThread"] = self.mail.GetEmailMonitorThreadObject()
 
         self.ProcessFeedbackInfo()
         self.StartThreads()
 
         self.LogError("GenMon Loadded for site: " + self.SiteName)
 
+        if self.Parent == None:
+            self.StartUnits()
+
+    # ---------- GeneratorDevice::OpenModbus------------------
+    # open the transport and start the read and bus threads, or service the
+    # transport from the event loop shared by all units
+    def OpenModbus(self):
+
+        self.Threads.pop("SerialReadThread", None)
+        self.Threads.pop("ModbusBusThread", None)
+        EventLoop = None
+        if self.ModbusEngine == mymodbus.ENGINE_EVENTLOOP:
+            EventLoop = self.GetEventLoop()
+
+        self.ModBus = mymodbus.ModbusProtocol(self.UpdateRegisterList, self.Address, self.SerialPort, self.BaudRate, loglocation = self.LogLocation, capturefile = self.CaptureFile,
+            transport = self.Transport, tcpaddress = self.TcpAddress, tcpport = self.TcpPort, slack = self.TimeoutSlack, retries = self.ReadRetries,
+            eventloop = EventLoop)
+        if self.ModBus.Loop == None:
+            self.Threads["SerialReadThread"] = self.ModBus.Slave.StartReadThread()
+            self.Threads["ModbusBusThread"] = self.ModBus.StartBusThread()
+
+    # ---------- GeneratorDevice::GetEventLoop------------------
+    # the event loop is started by the first unit that uses it and remains open during a reload
+    def GetEventLoop(self):
+
+        if self.Parent != None:
+            return self.Parent.GetEventLoop()
+        if self.EventLoop == None:
+            self.EventLoop = myeventloop.EventLoop(loglocation = self.LogLocation)
+            self.Threads["ModbusEventLoop"] = self.EventLoop.Start()
+        return self.EventLoop
+
+    # ---------- GeneratorDevice::StartUnits------------------
+    # start the other generators, each unit has its own transport, bus thread,
+    # registers and monitor threads, they share the process, mail and the command server
+    def StartUnits(self):
+
+        for Unit in self.UnitNumbers:
+            try:
+                self.Units[Unit] = GeneratorDevice(Unit = Unit, Parent = self)
+            except Exception as e1:
+                self.LogError("Error starting generator unit %d: " % Unit + str(e1))
+
     # ---------- GeneratorDevice::StartThreads------------------
     def StartThreads(self, reload = False):
 
+        # the threads that act on register changes wait for them on an event queue
+        self.EventQueues["CheckForAlarmThread"] = myevents.EventQueue(self.EventBus, Registers = ALARM_CHECK_REGISTERS)
+        self.EventQueues["PowerMeter"] = myevents.EventQueue(self.EventBus, Registers = POWER_REGISTERS)
+
         self.Threads["CheckForAlarmThread"] = mythread.MyThread(self.CheckForAlarmThread, Name = "CheckForAlarmThread")
 
         # start read thread to process incoming data commands
         self.Threads["ProcessThread"] = mythread.MyThread(self.ProcessThread, Name = "ProcessThread")
 
-        # start thread to accept incoming sockets for nagios heartbeat
-        self.Threads["ComWatchDog"] = mythread.MyThread(self.ComWatchDog, Name = "ComWatchDog")
-
-        if not reload:
+        if not reload and self.Parent == None:
             # This thread remains open during a reload
             # start thread to accept incoming sockets for nagios heartbeat and command / status clients
             self.Threads["InterfaceServerThread"] = mythread.MyThread(self.InterfaceServerThread, Name = "InterfaceServerThread")
+            if self.ModbusServerPort:
+                self.StartModbusServer()
 
         # start thread to accept incoming sockets for nagios heartbeat
         self.Threads["PowerMeter"] = mythread.MyThread(self.PowerMeter, Name = "PowerMeter")
 
         # start read thread to monitor registers as they change
-        self.Threads["MonitorThread"] = mythread.MyThread(self.MonitorThread, Name = "MonitorThread")
+        if self.bDisplayMonitor or self.bDisplayRegisters or self.bDisplayStatus or self.bDisplayMaintenance:
+            self.EventQueues["MonitorThread"] = myevents.EventQueue(self.EventBus)
+            self.Threads["MonitorThread"] = mythread.MyThread(self.MonitorThread, Name = "MonitorThread")
 
         if self.bSyncDST or self.bSyncTime:     # Sync time thread
             self.Threads["TimeSyncThread"] = mythread.MyThread(self.TimeSyncThread, Name = "TimeSyncThread")
 
         if self.EnableDebug:        # for debugging registers
             self.Threads["DebugThread"] = mythread.MyThread(self.DebugThread, Name = "DebugThread")
+            self.Threads["ScannerThread"] = mythread.MyThread(self.ScannerThread, Name = "ScannerThread")
 
     # ---------- GeneratorDevice::KillThread------------------
     def KillThread(self, Name, CleanupSelf = False):
 
         try:
+            Queue = self.EventQueues.pop(Name, None)
+            if Queue != None:
+                Queue.Close()           # wakes the thread if it is waiting for events
             MyThreadObj = self.Threads.get(Name, None)
             if MyThreadObj == None:
                 del self.Threads[Name]
@@ -341,13 +457,13 @@ class GeneratorDevice:
             self.KillThread("MonitorThread")
             self.KillThread("CheckForAlarmThread")
             self.KillThread("PowerMeter")
-            self.KillThread("ComWatchDog")
             if self.bSyncDST or self.bSyncTime:
                 self.KillThread("TimeSyncThread")
             if self.EnableDebug:
                 self.KillThread("DebugThread")
+                self.KillThread("ScannerThread")
 
-            if self.MailInit:
+            if self.MailInit and self.Parent == None:
                 self.mail.Cleanup()
                 try:
                     del self.Threads["SendMailThread"]
@@ -359,31 +475,34 @@ class GeneratorDevice:
             self.MailInit = False
 
             if self.ModBus.DeviceInit:
-                self.ModBus.Slave.Close()
+                self.ModBus.Close()
 
             self.ModBus.DeviceInit = False
 
             if not self.GetConfig(reload = True):
                 RetStr =  "Error reloading, error reading config file"
+            self.DecodeCache.Invalidate()
 
             # log errors in this module to a file
-            self.log = mylog.SetupLogger("genmon", self.LogLocation + "genmon.log")
+            self.log = mylog.SetupLogger("genmon" + self.UnitSuffix, self.LogLocation + "genmon" + self.UnitSuffix + ".log")
             try:
                 #Starting device connection
-                self.ModBus = mymodbus.ModbusProtocol(self.UpdateRegisterList, self.Address, self.SerialPort, self.BaudRate, loglocation = self.LogLocation)
-                self.Threads["SerialReadThread"] = self.ModBus.Slave.StartReadThread()
+                self.OpenModbus()
             except Exception as e1:
                 self.LogError("Error in Reload (serial): " + str(e1))
                 RetStr = "Failed to reload serial port."
 
             # init mail, start processing incoming email
-            self.mail = mymail.MyMail(monitor=True, incoming_folder = self.IncomingEmailFolder, processed_folder =self.ProcessedEmailFolder,incoming_callback = self.ProcessCommand)
-            self.MailInit = True
+            if self.Parent == None:
+                self.mail = mymail.MyMail(monitor=True, incoming_folder = self.IncomingEmailFolder, processed_folder =self.ProcessedEmailFolder,incoming_callback = self.ProcessCommand)
 
-            if self.mail.GetSendEmailThreadObject():
-                self.Threads["SendMailThread"] = self.mail.GetSendEmailThreadObject()
-            if self.mail.GetEmailMonitorThreadObject():
-                self.Threads["EmailCommandThread"] = self.mail.GetEmailMonitorThreadObject()
+                if self.mail.GetSendEmailThreadObject():
+                    self.Threads["SendMailThread"] = self.mail.GetSendEmailThreadObject()
+                if self.mail.GetEmailMonitorThreadObject():
+                    self.Threads["EmailCommandThread"] = self.mail.GetEmailMonitorThreadObject()
+            else:
+                self.mail = self.Parent.mail
+            self.MailInit = True
 
             # send mail to tell we are starting again
             self.mail.sendEmail("Generator Monitor Reload at " + self.SiteName, "Generator Monitor Reload at " + self.SiteName , msgtype = "info")
@@ -391,6 +510,13 @@ class GeneratorDevice:
             self.StartThreads(reload = True)
             self.LogError("RELOAD COMPLETE")
 
+            # the other units use the mail of unit 1, reload them so they get the new one
+            # note: units added to the config file are started on the next restart
+            if self.Parent == None:
+                for Unit, Device in self.Units.items():
+                    if Device != self:
+                        Device.Reload()
+
             if RetStr == "":
                 return "Genmon reloaded"
             else:
@@ -403,7 +529,7 @@ class GeneratorDevice:
     # ---------- GeneratorDevice::GetConfig------------------
     def GetConfig(self, reload = False):
 
-        ConfigSection = "GenMon"
+        ConfigSection = self.GetConfigSection()
         try:
             # read config file
             config = RawConfigParser()
@@ -411,6 +537,21 @@ class GeneratorDevice:
             # not defined so we specify the full path
             config.read('/etc/genmon.conf')
 
+            if self.Unit == 1:
+                # other generators are in the sections GenMon2, GenMon3 ...
+                self.UnitNumbers = []
+                for Section in config.sections():
+                    Match = re.match(r"^GenMon(\d+)$", Section)
+                    if Match and int(Match.group(1)) > 1 and int(Match.group(1)) <= MAX_UNITS:
+                        self.UnitNumbers.append(int(Match.group(1)))
+                self.UnitNumbers.sort()
+            else:
+                # options not in the unit section are taken from the GenMon section
+                for Option, Value in config.items("GenMon"):
+                    if not Option in UNIT_LOCAL_OPTIONS and not config.has_option(ConfigSection, Option):
+                        config.set(ConfigSection, Option, Value)
+                self.SiteName = "%s Unit %d" % (self.Parent.SiteName, self.Unit)
+
             # getfloat() raises an exception if the value is not a float
             # getint() and getboolean() also do this for their respective types
 
@@ -465,6 +606,62 @@ class GeneratorDevice:
                 self.bSyncTime = config.getboolean(ConfigSection, 'synctime')
             if config.has_option(ConfigSection, 'enhancedexercise'):
                 self.bEnhancedExerciseFrequency = config.getboolean(ConfigSection, 'enhancedexercise')
+            if config.has_option(ConfigSection, 'readspan'):
+                self.ReadSpan = config.getint(ConfigSection, 'readspan')
+                if self.ReadSpan < 1 or self.ReadSpan > MAX_READ_SPAN:
+                    self.ReadSpan = DEFAULT_READ_SPAN
+            if config.has_option(ConfigSection, 'readgap'):
+                self.ReadGap = config.getint(ConfigSection, 'readgap')
+                if self.ReadGap < 0:
+                    self.ReadGap = 0
+            if config.has_option(ConfigSection, 'logreadspan'):
+                self.LogReadSpan = config.getint(ConfigSection, 'logreadspan')
+                if self.LogReadSpan < 1 or self.LogReadSpan > MAX_READ_SPAN:
+                    self.LogReadSpan = DEFAULT_LOG_READ_SPAN
+            if config.has_option(ConfigSection, 'pollmininterval'):
+                self.PollMinInterval = config.getfloat(ConfigSection, 'pollmininterval')
+                if self.PollMinInterval < 0:
+                    self.PollMinInterval = DEFAULT_POLL_MIN_INTERVAL
+            if config.has_option(ConfigSection, 'pollmaxinterval'):
+                self.PollMaxInterval = config.getfloat(ConfigSection, 'pollmaxinterval')
+                if self.PollMaxInterval < self.PollMinInterval:
+                    self.PollMaxInterval = self.PollMinInterval
+            if config.has_option(ConfigSection, 'timeoutslack'):
+                self.TimeoutSlack = config.getint(ConfigSection, 'timeoutslack') / 1000.0
+                if self.TimeoutSlack <= 0:
+                    self.TimeoutSlack = mymodbus.DEFAULT_TIMEOUT_SLACK
+            if config.has_option(ConfigSection, 'readretries'):
+                self.ReadRetries = config.getint(ConfigSection, 'readretries')
+                if self.ReadRetries < 0:
+                    self.ReadRetries = mymodbus.DEFAULT_RETRIES
+            if config.has_option(ConfigSection, 'capturefile'):
+                self.CaptureFile = config.get(ConfigSection, 'capturefile')
+            if config.has_option(ConfigSection, 'historydepth'):
+                self.HistoryDepth = config.getint(ConfigSection, 'historydepth')
+                if self.HistoryDepth < 0 or self.HistoryDepth > myhistory.MAX_HISTORY_DEPTH:
+                    self.HistoryDepth = myhistory.DEFAULT_HISTORY_DEPTH
+            if config.has_option(ConfigSection, 'historyinterval'):
+                self.HistoryInterval = config.getfloat(ConfigSection, 'historyinterval')
+                if self.HistoryInterval <= 0 or self.HistoryInterval > myhistory.MAX_HISTORY_INTERVAL:
+                    self.HistoryInterval = myhistory.DEFAULT_HISTORY_INTERVAL
+            if config.has_option(ConfigSection, 'modbusengine'):
+                self.ModbusEngine = config.get(ConfigSection, 'modbusengine').lower()
+                if not self.ModbusEngine in mymodbus.ENGINES:
+                    raise Exception("Invalid modbusengine: " + self.ModbusEngine)
+            if config.has_option(ConfigSection, 'transport'):
+                self.Transport = config.get(ConfigSection, 'transport').lower()
+                if not self.Transport in mymodbus.TRANSPORTS:
+                    raise Exception("Invalid transport: " + self.Transport)
+            if config.has_option(ConfigSection, 'tcpaddress'):
+                self.TcpAddress = config.get(ConfigSection, 'tcpaddress')
+            if config.has_option(ConfigSection, 'tcpport'):
+                self.TcpPort = config.getint(ConfigSection, 'tcpport')
+            if self.Transport == mymodbus.TRANSPORT_TCP and (self.TcpAddress == None or not len(self.TcpAddress)):
+                raise Exception("tcpaddress is required for the tcp transport")
+            if config.has_option(ConfigSection, 'modbusserverport'):
+                self.ModbusServerPort = config.getint(ConfigSection, 'modbusserverport')
+            if config.has_option(ConfigSection, 'modbusserverwrite'):
+                self.ModbusServerWriteList = [int(Register, 16) for Register in config.get(ConfigSection, 'modbusserverwrite').split(",") if len(Register.strip())]
 
             if config.has_option(ConfigSection, 'nominalfrequency'):
                 self.NominalFreq = config.get(ConfigSection, 'nominalfrequency')
@@ -478,19 +675,25 @@ class GeneratorDevice:
             if config.has_option(ConfigSection, 'fueltype'):
                 self.FuelType = config.get(ConfigSection, 'fueltype')
 
-            if config.has_option(ConfigSection, 'version'):
-                self.Version = config.get(ConfigSection, 'version')
-                if not self.Version == GENMON_VERSION:
+            # version and autofeedback are kept in the GenMon section
+            if self.Parent != None:
+                self.Version = GENMON_VERSION
+                if config.has_option(ConfigSection, "autofeedback"):
+                    self.FeedbackEnabled = config.getboolean(ConfigSection, 'autofeedback')
+            else:
+                if config.has_option(ConfigSection, 'version'):
+                    self.Version = config.get(ConfigSection, 'version')
+                    if not self.Version == GENMON_VERSION:
+                        self.AddItemToConfFile('version', GENMON_VERSION)
+                        self.NewInstall = True
+                else:
                     self.AddItemToConfFile('version', GENMON_VERSION)
                     self.NewInstall = True
-            else:
-                self.AddItemToConfFile('version', GENMON_VERSION)
-                self.NewInstall = True
-            if config.has_option(ConfigSection, "autofeedback"):
-                self.FeedbackEnabled = config.getboolean(ConfigSection, 'autofeedback')
-            else:
-                self.AddItemToConfFile('autofeedback', "False")
-                self.FeedbackEnabled = False
+                if config.has_option(ConfigSection, "autofeedback"):
+                    self.FeedbackEnabled = config.getboolean(ConfigSection, 'autofeedback')
+                else:
+                    self.AddItemToConfFile('autofeedback', "False")
+                    self.FeedbackEnabled = False
             # Load saved feedback log if log is present
             if os.path.isfile(self.FeedbackLogFile):
                 with open(self.FeedbackLogFile) as infile:
@@ -504,6 +707,14 @@ class GeneratorDevice:
             return False
 
         return True
+    # ---------- GeneratorDevice::GetConfigSection------------------
+    # config file section of this unit
+    def GetConfigSection(self):
+
+        if self.Unit == 1:
+            return "GenMon"
+        return "GenMon%d" % self.Unit
+
     #------------------------------------------------------------
     # Add or update config item
     def AddItemToConfFile(self, Entry, Value):
@@ -516,10 +727,18 @@ class GeneratorDevice:
             ConfigFile.close()
 
             ConfigFile = open(FileName,'w')
+            Section = None
+            UnitSection = "[" + self.GetConfigSection() + "]"
             for line in FileString.splitlines():
                 if not line.isspace():                  # blank lines
                     newLine = line.strip()              # strip leading spaces
-                    if len(newLine):
+                    if len(newLine) and newLine[0] == "[":
+                        # a new entry is added at the end of the section of this unit
+                        if Section == UnitSection and not Found:
+                            ConfigFile.write(Entry + " = " + Value + "\n")
+                            Found = True
+                        Section = newLine
+                    elif len(newLine) and Section == UnitSection:
                         if not newLine[0] == "#":           # not a comment
                             items = newLine.split(' ')      # split items in line by spaces
                             for strings in items:           # loop thru items
@@ -541,17 +760,17 @@ class GeneratorDevice:
 
 
     # ---------- GeneratorDevice::CheckForAlarmThread------------------
-    #  When signaled, this thread will check for alarms
+    #  When the alarm, outage or transfer switch registers change, this thread will check for alarms
     def CheckForAlarmThread(self):
 
+        Queue = self.EventQueues["CheckForAlarmThread"]
         while True:
             try:
-                time.sleep(0.25)
-                if self.IsStopSignaled("CheckForAlarmThread"):
-                    break
-                if self.CheckForAlarmEvent.is_set():
-                    self.CheckForAlarmEvent.clear()
-                    self.CheckForAlarms()
+                if Queue.Get() == None:
+                    break               # closed, the thread was stopped
+                if not self.InitComplete:
+                    continue            # InitDevice wakes the queue when all registers have been read
+                self.CheckForAlarms()
 
             except Exception as e1:
                 self.FatalError("Error in  CheckForAlarmThread" + str(e1))
@@ -570,8 +789,6 @@ class GeneratorDevice:
                     break
                 try:
                     self.MasterEmulation()
-                    if self.EnableDebug:
-                        self.DebugRegisters()
                 except Exception as e1:
                     self.LogError("Error in GeneratorDevice:ProcessThread (1), continue: " + str(e1))
         except Exception as e1:
@@ -579,13 +796,14 @@ class GeneratorDevice:
 
     # ---------- GeneratorDevice::MonitorThread------------------
     # This thread will analyze the cached registers. It should not write to the serial port(s)
+    # It is only started if a display option is set and displays when registers have changed
     def MonitorThread(self):
 
+        Queue = self.EventQueues["MonitorThread"]
         while True:
             try:
-                time.sleep(5)
-                if self.IsStopSignaled("MonitorThread"):
-                    break
+                if Queue.Get() == None:
+                    break               # closed, the thread was stopped
                 if self.bDisplayMonitor:
                     self.DisplayMonitor()       # display communication stats
                 if self.bDisplayRegisters:
@@ -596,6 +814,7 @@ class GeneratorDevice:
                     self.DisplayMaintenance()   # display Maintenance
             except Exception as e1:
                 self.LogError("Error in GeneratorDevice:MonitorThread " + str(e1))
+            time.sleep(MONITOR_INTERVAL)    # changes meanwhile are displayed together
 
     #-------------GeneratorDevice::InitDevice------------------------------------
     # One time reads, and read all registers once
@@ -605,6 +824,17 @@ class GeneratorDevice:
 
         self.DetectController()
 
+        self.BaseReadPlan = self.BuildReadPlan(self.BaseRegisters)
+        self.PrimeReadPlan = self.BuildReadPlan(self.PrimeRegisters)
+
+        # base registers are polled at a rate that follows how often they change,
+        # prime registers (status and alarms) are polled as often as possible
+        self.Scheduler = myscheduler.PollScheduler(self.PollMinInterval, self.PollMaxInterval)
+        for Register in self.BaseRegisters.keys():
+            self.Scheduler.AddRegister(Register)
+        for Register in self.PrimeRegisters.keys():
+            self.Scheduler.AddRegister(Register, Fixed = 0)
+
         if self.EvolutionController:
             self.ModBus.ProcessMasterSlaveTransaction("%04x" % ALARM_LOG_STARTING_REG, ALARM_LOG_STRIDE)
         else:
@@ -615,23 +845,26 @@ class GeneratorDevice:
         if self.EvolutionController:
             self.ModBus.ProcessMasterSlaveTransaction("%04x" % SERVICE_LOG_STARTING_REG, SERVICE_LOG_STRIDE)
 
-        for PrimeReg, PrimeInfo in self.PrimeRegisters.items():
-            self.ModBus.ProcessMasterSlaveTransaction(PrimeReg, int(PrimeInfo[self.REGLEN] / 2))
+        for Block in self.PrimeReadPlan[:]:
+            self.ReadRegisterBlock(self.PrimeReadPlan, Block)
+            self.Scheduler.BlockRead(Block[2], self.Registers)
 
-        for Reg, Info in self.BaseRegisters.items():
+        for Block in self.BaseReadPlan[:]:
+            self.ReadRegisterBlock(self.BaseReadPlan, Block)
+            self.Scheduler.BlockRead(Block[2], self.Registers)
 
-            #The divide by 2 is due to the diference in the values in our dict are bytes
-            # but modbus makes register request in word increments so the request needs to
-            # in word multiples, not bytes
-            self.ModBus.ProcessMasterSlaveTransaction(Reg, int(Info[self.REGLEN] / 2))
+        self.LastStatusSequence = self.Registers.GetSequence("0001")
 
         # check for model specific info in read from conf file, if not there then add some defaults
         self.CheckModelSpecificInfo()
 
+        self.Registers.Publish()
         self.InitComplete = True
 
          # check for unknown events (i.e. events we are not decoded) and send an email if they occur
-        self.CheckForAlarmEvent.set()
+        # the threads waiting for register changes start from the values read
+        for Queue in list(self.EventQueues.values()):
+            Queue.Wake()
 
     #------------------------------------------------------------
     def ProcessFeedbackInfo(self):
@@ -783,11 +1016,11 @@ class GeneratorDevice:
             LookUp = ModelLookUp_NexusLC
             return "Unknown"    # Nexus LC is not known
 
-        Value = self.GetRegisterValueFromList(Register)
-        if not len(Value):
+        Value = self.Registers.GetU16(Register)
+        if Value is None:
             return "Unknown"
 
-        ModelInfo = LookUp.get(int(Value,16), UnknownList)
+        ModelInfo = LookUp.get(Value, UnknownList)
 
         if Request.lower() == "frequency":
             if ModelInfo[1] == "60" or ModelInfo[1] == "50":
@@ -928,10 +1161,9 @@ class GeneratorDevice:
         self.ModBus.ProcessMasterSlaveTransaction("0000", 1)
 
         # read register from cached list.
-        Value = self.GetRegisterValueFromList("0000")
-        if len(Value) != 4:
+        ProductModel = self.Registers.GetU16("0000")
+        if ProductModel is None:
             return ""
-        ProductModel = int(Value,16)
 
         # 0x03  Nexus, Air Cooled
         # 0x06  Nexus, Liquid Cooled
@@ -985,6 +1217,8 @@ class GeneratorDevice:
         if not self.EvolutionController:        # if we are using a Nexus Controller, force legacy writes
             self.bUseLegacyWrite = True
 
+        self.DecodeCache.Invalidate()           # values decoded before the controller type was known
+
     #----------  GeneratorDevice:GetController  ---------------------------------
     def GetController(self, Actual = True):
 
@@ -999,10 +1233,9 @@ class GeneratorDevice:
                 0x0c :  "Evolution, Liquid Cooled"
             }
 
-            Value = self.GetRegisterValueFromList("0000")
-            if len(Value) != 4:
+            ProductModel = self.Registers.GetU16("0000")
+            if ProductModel is None:
                 return ""
-            ProductModel = int(Value,16)
 
             return ControllerDecoder.get(ProductModel, "Unknown 0x%02X" % ProductModel)
         else:
@@ -1018,56 +1251,243 @@ class GeneratorDevice:
 
         return outstr
 
-    #-------------GeneratorDevice::DebugRegisters------------------------------------
-    def DebugRegisters(self):
+    #-------------GeneratorDevice::ScannerThread------------------------------------
+    # find the registers the controller implements (or load them from the cache for
+    # this controller model) and read them periodically so changes in registers
+    # that are not decoded are reported
+    def ScannerThread(self):
+
+        while not self.InitComplete:
+            time.sleep(1)
+            if self.IsStopSignaled("ScannerThread"):
+                return
+
+        StopCallback = lambda : self.IsStopSignaled("ScannerThread")
+        self.Scanner = myscanner.RegisterScanner(self.ModBus, self.RegisterMapFile, UpdateCallback = self.ScannerUpdate, loglocation = self.LogLocation)
+        Key = "%s, %s" % (self.GetController(), self.Model)
+        if not self.Scanner.LoadCache(Key):
+            if not self.Scanner.Scan(Key, StopCallback):
+                return
+            self.Scanner.SaveCache()
+
+        while True:
+            self.Scanner.Refresh(StopCallback)
+            for x in range(0, SCAN_REFRESH_INTERVAL):
+                time.sleep(1)
+                if self.IsStopSignaled("ScannerThread"):
+                    return
+
+    #-------------GeneratorDevice::ScannerUpdate------------------------------------
+    # values read by the register scan, the registers genmon reads are updated by the normal poll
+    def ScannerUpdate(self, Register, Value):
+
+        if not self.RegisterIsKnown(Register):
+            self.UpdateRegisterList(Register, Value)
+
+    #-------------GeneratorDevice::DisplayRegisterMap------------------------------------
+    def DisplayRegisterMap(self):
 
-        # reg 200 - -3e7 and 4af - 4e2 and 5af - 600 (already got 5f1 5f4 and 5f5?
-        for Reg in range(0x05 , 0x700):
-            RegStr = "%04x" % Reg
-            if not self.RegisterIsKnown(RegStr):
-                self.ModBus.ProcessMasterSlaveTransaction(RegStr, 1)
+        if self.Scanner == None:
+            return "Register scan is not running, set enabledebug in genmon.conf to enable it\n"
+        return self.Scanner.GetReport(list(self.BaseRegisters.keys()) + list(self.PrimeRegisters.keys()))
 
     #-------------GeneratorDevice::MasterEmulation------------------------------------
+    # read the block of registers that is due next in the poll schedule. The
+    # registers are published for the displays once per poll cycle: when nothing
+    # is due or the next block due was already read in this cycle, so a snapshot
+    # has the prime registers and the base registers that were due read together
     def MasterEmulation(self):
 
-        counter = 0
-        for Reg, Info in self.BaseRegisters.items():
+        Plan, Block, Delay = self.Scheduler.GetNextBlock([self.PrimeReadPlan, self.BaseReadPlan])
 
-            if counter % 6 == 0:
-                for PrimeReg, PrimeInfo in self.PrimeRegisters.items():
-                    self.ModBus.ProcessMasterSlaveTransaction(PrimeReg, int(PrimeInfo[self.REGLEN] / 2))
-                # check for unknown events (i.e. events we are not decoded) and send an email if they occur
-                self.CheckForAlarmEvent.set()
+        if Block is None or Delay > 0 or id(Block) in self.CycleBlocks:
+            self.Registers.Publish()
+            self.CycleBlocks = set()
+        if Block is None:
+            time.sleep(1)
+            return
+        if Delay > 0:
+            time.sleep(min(Delay, 1))       # nothing is due yet
+            return
+
+        if Plan is self.PrimeReadPlan:
+            self.ReadRegisterBlock(Plan, Block, Priority = mymodbus.PRIORITY_PRIME)
+        else:
+            self.ReadRegisterBlock(Plan, Block)
+        self.Scheduler.BlockRead(Block[2], self.Registers)
+        self.CycleBlocks.add(id(Block))
+
+        if Plan is self.PrimeReadPlan:
+            # a change in the status register (i.e. engine starting, switch state) means the
+            # other registers are likely to change, so poll them at the fastest rate for a while
+            Sequence = self.Registers.GetSequence("0001")
+            if Sequence != self.LastStatusSequence:
+                self.LastStatusSequence = Sequence
+                self.Scheduler.Tighten()
+                # hold publishing until the base registers have been read again, so the
+                # displays do not show the new status with the old engine values (i.e. RPM)
+                self.CycleBlocks = set([id(Block)])
+
+    #-------------GeneratorDevice::BuildReadPlan------------------------------------
+    # Sort the register map and merge neighbouring registers into range reads. The
+    # returned list contains one entry per modbus read request:
+    #       [Start Register, Length in words, [[Register, Offset, Length], ...], Failures]
+    # where Offset and Length of each register are in words from the start register
+    def BuildReadPlan(self, RegisterDict):
 
+        RegList = []
+        for Reg, Info in RegisterDict.items():
             #The divide by 2 is due to the diference in the values in our dict are bytes
             # but modbus makes register request in word increments so the request needs to
             # in word multiples, not bytes
-            self.ModBus.ProcessMasterSlaveTransaction(Reg, int(Info[self.REGLEN] / 2))
-            counter += 1
+            RegList.append([int(Reg, 16), int(Info[self.REGLEN] / 2)])
+        RegList.sort()
+
+        Plan = []
+        for Address, Length in RegList:
+            if len(Plan):
+                Block = Plan[-1]
+                Gap = Address - (Block[0] + Block[1])
+                NewLength = (Address + Length) - Block[0]
+                if Gap >= 0 and Gap <= self.ReadGap and NewLength <= self.ReadSpan:
+                    Block[2].append(["%04x" % Address, Address - Block[0], Length])
+                    Block[1] = NewLength
+                    continue
+            Plan.append([Address, Length, [["%04x" % Address, 0, Length]], 0])
+
+        return Plan
+
+    #-------------GeneratorDevice::ReadRegisterBlock------------------------------------
+    # Issue one range read for a block in a read plan and split the response into
+    # individual register updates. If the controller does not answer the range read
+    # the registers are read individually, and after repeated failures the block is
+    # split in the plan so the controller is no longer asked for that range.
+    def ReadRegisterBlock(self, Plan, Block, Priority = mymodbus.PRIORITY_BASE):
+
+        StartReg, Length, RegList, Failures = Block
+
+        if len(RegList) == 1:
+            return self.ModBus.ProcessMasterSlaveTransaction(RegList[0][0], RegList[0][2], Priority = Priority)
+
+        Value = self.ModBus.ProcessMasterSlaveTransaction("%04x" % StartReg, Length, ReturnValue = True, Priority = Priority)
+
+        if not isinstance(Value, str) or len(Value) != (Length * 4):
+            for Reg, Offset, RegLength in RegList:
+                self.ModBus.ProcessMasterSlaveTransaction(Reg, RegLength, Priority = Priority)
+            Block[3] += 1
+            if Block[3] >= READ_PLAN_MAX_FAILURES and Block in Plan:
+                self.LogError("Range read failed at register %04x (length %d), using single reads" % (StartReg, Length))
+                Index = Plan.index(Block)
+                Plan[Index:Index + 1] = [[int(Reg, 16), RegLength, [[Reg, 0, RegLength]], 0] for Reg, Offset, RegLength in RegList]
+            return False
+
+        Block[3] = 0
+        # each word is 4 hex chars in the response string
+        for Reg, Offset, RegLength in RegList:
+            self.UpdateRegisterList(Reg, Value[Offset * 4:(Offset + RegLength) * 4])
+
+        return True
 
      #-------------GeneratorDevice::UpdateLogRegistersAsMaster
     def UpdateLogRegistersAsMaster(self):
 
         # Start / Stop Log
-        for Register in self.LogRange(START_LOG_STARTING_REG , LOG_DEPTH,START_LOG_STRIDE):
-            RegStr = "%04x" % Register
-            self.ModBus.ProcessMasterSlaveTransaction(RegStr, START_LOG_STRIDE)
+        self.UpdateLogAsMaster(START_LOG_STARTING_REG, START_LOG_STRIDE)
 
         if self.EvolutionController:
             # Service Log
-            for Register in self.LogRange(SERVICE_LOG_STARTING_REG , LOG_DEPTH, SERVICE_LOG_STRIDE):
-                RegStr = "%04x" % Register
-                self.ModBus.ProcessMasterSlaveTransaction(RegStr, SERVICE_LOG_STRIDE)
-
+            self.UpdateLogAsMaster(SERVICE_LOG_STARTING_REG, SERVICE_LOG_STRIDE)
             # Alarm Log
-            for Register in self.LogRange(ALARM_LOG_STARTING_REG , LOG_DEPTH, ALARM_LOG_STRIDE):
-                RegStr = "%04x" % Register
-                self.ModBus.ProcessMasterSlaveTransaction(RegStr, ALARM_LOG_STRIDE)
+            self.UpdateLogAsMaster(ALARM_LOG_STARTING_REG, ALARM_LOG_STRIDE)
         else:
             # Alarm Log
-            for Register in self.LogRange(NEXUS_ALARM_LOG_STARTING_REG , LOG_DEPTH, NEXUS_ALARM_LOG_STRIDE):
-                RegStr = "%04x" % Register
-                self.ModBus.ProcessMasterSlaveTransaction(RegStr, NEXUS_ALARM_LOG_STRIDE)
+            self.UpdateLogAsMaster(NEXUS_ALARM_LOG_STARTING_REG, NEXUS_ALARM_LOG_STRIDE)
+
+     #-------------GeneratorDevice::UpdateLogAsMaster
+    # The newest entry of a log is at the starting register and each new entry moves
+    # the older entries down one stride. The second byte of an entry is a number that
+    # increments with each new entry, so the head entry tells us how far the log has
+    # moved since it was last read. Only the new entries are read from the controller
+    # and the rest of the cached log is moved down. The whole log is read if the cache
+    # is not complete or the log is not where we expect it to be.
+    def UpdateLogAsMaster(self, LogBase, Stride):
+
+        Cached = [self.Registers.GetHex(Register) for Register in self.LogRange(LogBase, LOG_DEPTH, Stride)]
+
+        if not self.ReadLogEntry(LogBase, Stride):
+            return
+        NewHead = self.Registers.GetHex(LogBase)
+
+        Shift = self.GetLogShift(Cached, NewHead)
+        if Shift == 0:
+            self.LogRefreshIncremental += 1
+            return                  # nothing new in the log
+
+        if Shift != None:
+            # the old head entry should now be Shift entries down the log
+            Register = LogBase + (Shift * Stride)
+            if self.ReadLogEntry(Register, Stride) and self.Registers.GetHex(Register) == Cached[0]:
+                for Index in range(Shift + 1, LOG_DEPTH):
+                    self.UpdateRegisterList("%04x" % (LogBase + (Index * Stride)), Cached[Index - Shift])
+                self.ReadLogEntries(LogBase + Stride, Stride, Shift - 1)
+                self.LogRefreshIncremental += 1
+                return
+
+        # read the whole log
+        self.LogRefreshFull += 1
+        self.ReadLogEntries(LogBase + Stride, Stride, LOG_DEPTH - 1)
+
+     #-------------GeneratorDevice::ReadLogEntries
+    # Read Count consecutive log entries starting at Register, several entries per
+    # range read (up to LogReadSpan registers). The response is split into one cache
+    # entry per log entry. If the controller rejects a range read (exception response)
+    # the span is halved and the read is retried, down to one log entry per read. Any
+    # other failure (i.e. a timeout on a noisy link) does not change the span, the
+    # entries of that read are read one at a time.
+    def ReadLogEntries(self, Register, Stride, Count):
+
+        while Count > 0:
+            Entries = min(Count, max(1, self.LogReadSpan // Stride))
+            Value = None
+            if Entries > 1:
+                Length = Entries * Stride
+                Transaction = self.ModBus.ReadRegisters("%04x" % Register, Length, Priority = mymodbus.PRIORITY_LOG, Update = False)
+                Value = Transaction.Wait()
+                if not isinstance(Value, str) or len(Value) != (Length * 4):
+                    Value = None
+                    if Transaction.ResultCode == mymodbus.RESULT_EXCEPTION:
+                        self.LogReadSpan = max(Stride, (Entries // 2) * Stride)
+                        self.LogError("Log range read rejected at register %04x (length %d), log read span now %d" % (Register, Length, self.LogReadSpan))
+                        continue
+            if Value == None:
+                # one entry per read, or the range read failed for another reason
+                for Index in range(0, Entries):
+                    self.ReadLogEntry(Register + (Index * Stride), Stride)
+            else:
+                # each word is 4 hex chars in the response string
+                for Index in range(0, Entries):
+                    self.UpdateRegisterList("%04x" % (Register + (Index * Stride)), Value[Index * Stride * 4:(Index + 1) * Stride * 4])
+            Register += Entries * Stride
+            Count -= Entries
+
+     #-------------GeneratorDevice::GetLogShift
+    # return the number of new entries in a log given the cached log entries and the
+    # new head entry, or None if this can not be determined from the cache
+    def GetLogShift(self, Cached, NewHead):
+
+        if "" in Cached or len(NewHead) < 4:
+            return None
+        if NewHead == Cached[0]:
+            return 0
+        Shift = (int(NewHead[2:4], 16) - int(Cached[0][2:4], 16)) & 0xFF   # entry number is one byte
+        if Shift == 0 or Shift >= LOG_DEPTH:
+            return None             # the head changed but not the number, or the log wrapped
+        return Shift
+
+     #-------------GeneratorDevice::ReadLogEntry
+    def ReadLogEntry(self, Register, Stride):
+
+        return self.ModBus.ProcessMasterSlaveTransaction("%04x" % Register, Stride, Priority = mymodbus.PRIORITY_LOG)
 
      #----------  GeneratorDevice::SetGeneratorRemoteStartStop-------------------------------
     def SetGeneratorRemoteStartStop(self, CmdString):
@@ -1110,23 +1530,14 @@ class GeneratorDevice:
         else:
             return "Invalid command syntax for command setremote (2)"
 
-        with self.CommAccessLock:
-            #
-            LowByte = Value & 0x00FF
-            HighByte = Value >> 8
-            Data= []
-            Data.append(HighByte)           # Value for indexed register (High byte)
-            Data.append(LowByte)            # Value for indexed register (Low byte)
-
-            self.ModBus.ProcessMasterSlaveWriteTransaction("0004", len(Data) / 2, Data)
+        # the value must be written before the index register, the index is not sent if the value fails
+        Writes = mywrite.WriteTransaction(self.ModBus, "Remote command")
+        Writes.AddValue("0004", Value, Verify = False)      # Value for indexed register
+        Writes.AddValue("0003", Register, Verify = False)   # indexed register to be written
 
-            LowByte = Register & 0x00FF
-            HighByte = Register >> 8
-            Data= []
-            Data.append(HighByte)           # indexed register to be written (High byte)
-            Data.append(LowByte)            # indexed register to be written (Low byte)
-
-            self.ModBus.ProcessMasterSlaveWriteTransaction("0003", len(Data) / 2, Data)
+        with self.CommAccessLock:
+            if not Writes.Execute():
+                return Writes.GetReport()
 
         return "Remote command sent successfully"
 
@@ -1262,22 +1673,15 @@ class GeneratorDevice:
 
         WriteValue = self.CalculateExerciseTime(total_delta_min)
 
-        with self.CommAccessLock:
-            #  have seen the following values 0cf6,0f8c,0f5e
-            Last = WriteValue & 0x00FF
-            First = WriteValue >> 8
-            Data= []
-            Data.append(First)             # Hour 0 - 23
-            Data.append(Last)             # Min 0 - 59
-
-            self.ModBus.ProcessMasterSlaveWriteTransaction("0004", len(Data) / 2, Data)
+        #  have seen the following values 0cf6,0f8c,0f5e
+        Writes = mywrite.WriteTransaction(self.ModBus, "Set Exercise Time")
+        Writes.AddValue("0004", WriteValue, Verify = False)     # Hour 0 - 23, Min 0 - 59
+        # The value for reg 0003 is always 0006. This appears to be an indexed register
+        Writes.AddValue("0003", 0x0006, Verify = False)
 
-            #
-            Data= []
-            Data.append(0)                  # The value for reg 0003 is always 0006. This appears
-            Data.append(6)                  # to be an indexed register
-
-            self.ModBus.ProcessMasterSlaveWriteTransaction("0003", len(Data) / 2, Data)
+        with self.CommAccessLock:
+            if not Writes.Execute():
+                return Writes.GetReport()
         return  "Set Exercise Time Command sent (using legacy write)"
 
     #----------  GeneratorDevice::GetDeltaTimeMinutes-------------------------------
@@ -1329,34 +1733,29 @@ class GeneratorDevice:
                 self.LogError("Validation Error: Biweekly and Monthly Exercises are not supported. " + CmdString)
                 return msgbody
 
-        with self.CommAccessLock:
-
-            if self.bEnhancedExerciseFrequency:
-                Data = []
-                Data.append(0x00)
-                if ModeStr.lower() == "weekly":
-                    Data.append(0x00)
-                elif ModeStr.lower() == "biweekly":
-                    Data.append(0x01)
-                elif ModeStr.lower() == "monthly":
-                    Data.append(0x02)
-                else:
-                    self.LogError("Validation Error: Invalid exercise frequency. " + CmdString)
-                    return msgbody
-                self.ModBus.ProcessMasterSlaveWriteTransaction("002d", len(Data) / 2, Data)
-
-            Data = []
-            Data.append(0x00)               #
-            Data.append(Day)                # Day
+        # the registers are written in the same order as the single writes this replaces,
+        # the time (002c) last. 002d and 002e are sent in one frame, 002c is a lower
+        # register so it is always sent in its own frame after them
+        Writes = mywrite.WriteTransaction(self.ModBus, "Set Exercise Time")
 
-            self.ModBus.ProcessMasterSlaveWriteTransaction("002e", len(Data) / 2, Data)
+        if self.bEnhancedExerciseFrequency:
+            if ModeStr.lower() == "weekly":
+                Frequency = 0x00
+            elif ModeStr.lower() == "biweekly":
+                Frequency = 0x01
+            elif ModeStr.lower() == "monthly":
+                Frequency = 0x02
+            else:
+                self.LogError("Validation Error: Invalid exercise frequency. " + CmdString)
+                return msgbody
+            Writes.AddValue("002d", Frequency)
 
-            #
-            Data = []
-            Data.append(Hour)                  #
-            Data.append(Minute)                #
+        Writes.AddValue("002e", Day)                    # Day
+        Writes.AddWrite("002c", [Hour, Minute])         # Hour, Minute
 
-            self.ModBus.ProcessMasterSlaveWriteTransaction("002c", len(Data) / 2, Data)
+        with self.CommAccessLock:
+            if not Writes.Execute():
+                return Writes.GetReport()
 
         return  "Set Exercise Time Command sent"
 
@@ -1480,11 +1879,11 @@ class GeneratorDevice:
             self.LogError( str(e1))
             return msgbody
 
-        Data= []
-        Data.append(0x00)
-        Data.append(ModeValue)
+        Writes = mywrite.WriteTransaction(self.ModBus, "Set Quiet Mode")
+        Writes.AddValue("002f", ModeValue)
         with self.CommAccessLock:
-            self.ModBus.ProcessMasterSlaveWriteTransaction("002f", len(Data) / 2, Data)
+            if not Writes.Execute():
+                return Writes.GetReport()
 
         return "Set Quiet Mode Command sent"
 
@@ -1502,100 +1901,68 @@ class GeneratorDevice:
             time.sleep(60 - d.second)       # sleep until seconds are zero
             d = datetime.datetime.now()
 
-        # We will write three registers at once: 000e - 0010.
-        Data= []
-        Data.append(d.hour)             #000e
-        Data.append(d.minute)
-        Data.append(d.month)            #000f
-        Data.append(d.day)
-        # Note: Day of week should always be zero when setting time
-        Data.append(0)                  #0010
-        Data.append(d.year - 2000)
+        # We will write three registers at once: 000e - 0010. The old time is not
+        # restored if the time does not read back as written
+        Writes = mywrite.WriteTransaction(self.ModBus, "Set Time", Rollback = False)
+        Writes.AddWrite("000e", [d.hour, d.minute, d.month, d.day])     # 000e, 000f
+        # Note: Day of week should always be zero when setting time, the
+        # controller sets it so 0010 does not read back as written
+        Writes.AddWrite("0010", [0, d.year - 2000], Verify = False)
 
-        self.ModBus.ProcessMasterSlaveWriteTransaction("000e", len(Data) / 2, Data)
+        with self.CommAccessLock:
+            Writes.Execute()
+        return Writes.GetReport()
+
+    #------------ GeneratorDevice::BuildRegisterMap --------------------------------------------
+    # the base and prime registers, the log entry ranges and the model register by address
+    def BuildRegisterMap(self):
+
+        Map = myregisters.RegisterMap()
+        Map.AddRegisters(self.BaseRegisters, myregisters.REG_CLASS_BASE)
+        Map.AddRegisters(self.PrimeRegisters, myregisters.REG_CLASS_PRIME)
+        # the lengths of the log entries are in bytes, the same as the register dicts
+        Map.AddRange(SERVICE_LOG_STARTING_REG, SERVICE_LOG_END_REG, SERVICE_LOG_STRIDE * 2, myregisters.REG_CLASS_SERVICE_LOG, myregisters.CONTROLLER_EVOLUTION)
+        Map.AddRange(START_LOG_STARTING_REG, START_LOG_END_REG, START_LOG_STRIDE * 2, myregisters.REG_CLASS_START_LOG)
+        Map.AddRange(ALARM_LOG_STARTING_REG, ALARM_LOG_END_REG, ALARM_LOG_STRIDE * 2, myregisters.REG_CLASS_ALARM_LOG, myregisters.CONTROLLER_EVOLUTION)
+        Map.AddRange(NEXUS_ALARM_LOG_STARTING_REG, NEXUS_ALARM_LOG_END_REG, NEXUS_ALARM_LOG_STRIDE * 2, myregisters.REG_CLASS_NEXUS_ALARM_LOG, myregisters.CONTROLLER_NEXUS)
+        Map.AddRange(MODEL_REG, MODEL_REG, MODEL_REG_LENGTH * 2, myregisters.REG_CLASS_MODEL)
+        return Map
 
     #------------ GeneratorDevice::GetRegisterLength --------------------------------------------
+    # length in bytes of a base or prime register, zero for other registers
     def GetRegisterLength(self, Register):
 
-        RegInfoReg = self.BaseRegisters.get(Register, [0,0])
-
-        RegLength = RegInfoReg[self.REGLEN]
-
-        if RegLength == 0:
-            RegInfoReg = self.PrimeRegisters.get(Register, [0,0])
-            RegLength = RegInfoReg[self.REGLEN]
-
-        return RegLength
+        Address = self.Registers.Address(Register)
+        if self.RegisterMap.GetClass(Address, self.EvolutionController) in [myregisters.REG_CLASS_BASE, myregisters.REG_CLASS_PRIME]:
+            return self.RegisterMap.GetLength(Address)
+        return 0
 
     #------------ GeneratorDevice::MonitorRegister --------------------------------------------
     # return true if we are monitoring this register
     def MonitorRegister(self, Register):
 
-        RegInfoReg = self.BaseRegisters.get(Register, [0,-1])
-
-        MonitorReg = RegInfoReg[self.REGMONITOR]
-
-        if MonitorReg == -1:
-            RegInfoReg = self.PrimeRegisters.get(Register, [0,-1])
-            MonitorReg = RegInfoReg[self.REGMONITOR]
-
-        if MonitorReg == 1:
-            return True
-        return False
+        return self.RegisterMap.IsMonitored(self.Registers.Address(Register))
 
     #------------ GeneratorDevice::ValidateRegister --------------------------------------------
     def ValidateRegister(self, Register, Value):
 
-        ValidationOK = True
         # validate the length of the data against the size of the register
-        RegLength = self.GetRegisterLength(Register)
-        if(RegLength):      # if this is a base register
-            if RegLength != (len(Value) / 2):  # note: the divide here compensates between the len of hex values vs string data
-                self.LogError("Validation Error: Invalid register length (base) %s:%s %d %d" % (Register, Value, RegLength, len(Value) /2 ))
-                ValidationOK = False
-        # appears to be Start/Stop Log or service log
-        elif int(Register,16) >=  SERVICE_LOG_STARTING_REG and int(Register,16) <= SERVICE_LOG_END_REG:
-            if len(Value) != 16:
-                self.LogError("Validation Error: Invalid register length (Service) %s %s" % (Register, Value))
-                ValidationOK = False
-        elif int(Register,16) >=  START_LOG_STARTING_REG and int(Register,16) <= START_LOG_END_REG:
-            if len(Value) != 16:
-                self.LogError("Validation Error: Invalid register length (Start) %s %s" % (Register, Value))
-                ValidationOK = False
-        elif int(Register,16) >=  ALARM_LOG_STARTING_REG and int(Register,16) <= ALARM_LOG_END_REG:
-            if len(Value) != 20:      #
-                self.LogError("Validation Error: Invalid register length (Alarm) %s %s" % (Register, Value))
-                ValidationOK = False
-        elif int(Register,16) >=  NEXUS_ALARM_LOG_STARTING_REG and int(Register,16) <= NEXUS_ALARM_LOG_END_REG:
-            if len(Value) != 16:      # Nexus alarm reg is 16 chars, no alarm codes
-                self.LogError("Validation Error: Invalid register length (Nexus Alarm) %s %s" % (Register, Value))
-                ValidationOK = False
-        elif int(Register,16) == MODEL_REG:
-            if len(Value) != 20:
-                self.LogError("Validation Error: Invalid register length (Model) %s %s" % (Register, Value))
-                ValidationOK = False
-        else:
+        # note: the lengths are in bytes, the value is a hex string
+        Address = self.Registers.Address(Register)
+        Class = self.RegisterMap.GetClass(Address, self.EvolutionController)
+        if Class == myregisters.REG_CLASS_NONE:
             self.LogError("Validation Error: Invalid register or length (Unkown) %s %s" % (Register, Value))
-            ValidationOK = False
-
-        return ValidationOK
-
+            return False
+        RegLength = self.RegisterMap.GetLength(Address)
+        if len(Value) != RegLength * 2:
+            self.LogError("Validation Error: Invalid register length (%s) %s:%s %d %d" % (myregisters.REG_CLASS_NAMES[Class], Register, Value, RegLength, len(Value) / 2))
+            return False
+        return True
 
     #------------ GeneratorDevice::RegisterIsLog --------------------------------------------
     def RegisterIsLog(self, Register):
 
-        ## Is this a log register
-        if int(Register,16) >=  SERVICE_LOG_STARTING_REG and int(Register,16) <= SERVICE_LOG_END_REG and self.EvolutionController:
-            return True
-        elif int(Register,16) >=  START_LOG_STARTING_REG and int(Register,16) <= START_LOG_END_REG:
-            return True
-        elif int(Register,16) >=  ALARM_LOG_STARTING_REG and int(Register,16) <= ALARM_LOG_END_REG and self.EvolutionController:
-            return True
-        elif int(Register,16) >=  NEXUS_ALARM_LOG_STARTING_REG and int(Register,16) <= NEXUS_ALARM_LOG_END_REG and (not self.EvolutionController):
-            return True
-        elif int(Register,16) == MODEL_REG:
-            return True
-        return False
+        return self.RegisterMap.IsLog(self.Registers.Address(Register), self.EvolutionController)
 
     #------------ GeneratorDevice::UpdateRegisterList --------------------------------------------
     def UpdateRegisterList(self, Register, Value):
@@ -1604,21 +1971,29 @@ class GeneratorDevice:
         if len(Register) != 4 or len(Value) < 4:
             self.LogError("Validation Error: Invalid data in UpdateRegisterList: %s %s" % (Register, Value))
 
-        if self.RegisterIsKnown(Register):
+        Address = self.Registers.Address(Register)
+        Class = self.RegisterMap.GetClass(Address, self.EvolutionController)
+        if Class != myregisters.REG_CLASS_NONE:
             if not self.ValidateRegister(Register, Value):
                 return
-            RegValue = self.Registers.get(Register, "")
+            OldValue = self.Registers.GetWords(Address)
 
-            if RegValue == "":
-                self.Registers[Register] = Value        # first time seeing this register so add it to the list
-            elif RegValue != Value:
+            Result = self.Registers.SetHex(Address, Value)
+            if self.History != None and Class <= myregisters.REG_CLASS_PRIME and Result != myregisters.REG_INVALID:
+                self.History.Add(Register, int(Value, 16))
+            if Result == myregisters.REG_CHANGED:
+                OldValue = ("%04x" * len(OldValue)) % OldValue
                 # don't print values of registers we have validated the purpose
-                if not self.RegisterIsLog(Register):
-                    self.MonitorUnknownRegisters(Register,RegValue, Value)
-                self.Registers[Register] = Value
+                if Class < myregisters.REG_CLASS_START_LOG:
+                    self.MonitorUnknownRegisters(Register, OldValue, Value)
                 self.Changed += 1
-            else:
+                self.EventBus.Publish(Register, OldValue, Value)
+            elif Result == myregisters.REG_NEW:
+                self.EventBus.Publish(Register, "", Value)
+            elif Result == myregisters.REG_UNCHANGED:
                 self.NotChanged += 1
+            elif Result == myregisters.REG_INVALID:
+                self.LogError("Validation Error: Unable to store register value: %s %s" % (Register, Value))
         else:   # Register Under Test
             RegValue = self.RegistersUnderTest.get(Register, "")
             if RegValue == "":
@@ -1630,12 +2005,7 @@ class GeneratorDevice:
     #------------ GeneratorDevice::RegisterIsKnown ------------------------------------
     def RegisterIsKnown(self, Register):
 
-        RegLength = self.GetRegisterLength(Register)
-
-        if RegLength != 0:
-            return True
-
-        return self.RegisterIsLog(Register)
+        return self.RegisterMap.IsKnown(self.Registers.Address(Register), self.EvolutionController)
 
     #------------ GeneratorDevice::GetRegisterValueFromList ------------------------------------
     def GetRegisterValueFromList(self,Register):
@@ -1701,7 +2071,8 @@ class GeneratorDevice:
 
             Register = CmdList[1].strip()
 
-            RegValue = self.ModBus.ProcessMasterSlaveTransaction( Register, 1, ReturnValue = True)
+            # interactive request, ahead of the polled registers
+            RegValue = self.ModBus.ProcessMasterSlaveTransaction( Register, 1, ReturnValue = True, Priority = mymodbus.PRIORITY_PRIME, Timeout = READ_REQUEST_TIMEOUT)
 
             if RegValue == "":
                 self.LogError("Validation Error: Register  not known (ReadRegValue):" + Register)
@@ -1773,6 +2144,20 @@ class GeneratorDevice:
             msgbody += "Invalid GENERATOR command: zero length command. All commands must be prefixed by \"generator: \""
             LocalError = True
 
+        if not LocalError:
+            # commands for a unit are prefixed by "generator[N]: ", i.e. generator[2]: status
+            Match = re.match(br"^generator\[(\d+)\]:", command.lower())
+            if Match:
+                Device = self.Units.get(int(Match.group(1)), None)
+                if Device == None:
+                    msgsubject = "Error in Generator Command (invalid unit)"
+                    msgbody += "Invalid GENERATOR command: unit %s not found, valid units are: %s" % (Match.group(1).decode(), ", ".join(str(Unit) for Unit in sorted(self.Units.keys())))
+                    LocalError = True
+                else:
+                    command = b"generator:" + command[Match.end():]
+                    if Device != self:
+                        return Device.ProcessCommand(command, fromsocket)
+
         if not LocalError:
             if(not command.lower().startswith( b'generator:' )):         # PYTHON3
                 msgsubject = "Error in Generator Command (no generator: prefix)"
@@ -1818,6 +2203,12 @@ class GeneratorDevice:
             elif b"outage" == item.lower():              # display help screen
                 msgbody += self.DisplayOutage(True)
                 continue
+            elif b"units" == item.lower():
+                msgbody += self.DisplayUnits(True)
+                continue
+            elif b"registermap" == item.lower():
+                msgbody += self.DisplayRegisterMap()
+                continue
             elif b"settime" == item.lower():           # set time and date
                 # This is done is a separate thread as not to block any return email processing
                 # since we attempt to sync with generator time
@@ -1844,6 +2235,9 @@ class GeneratorDevice:
                 if b"power_log_json" in item.lower():      # used in web interface
                     msgbody += json.dumps(self.GetPowerHistory(command.lower()))
                     continue
+                elif b"history_json" in item.lower():
+                    msgbody += json.dumps(self.GetRegisterHistory(command.lower()))
+                    continue
                 elif b"power_log_clear" == item.lower():     # used in web interface
                     msgbody += self.ClearPowerLog()
                     continue
@@ -1871,6 +2265,9 @@ class GeneratorDevice:
                 elif b"outage_json" == item.lower():              # display help screen
                     msgbody = json.dumps(self.DisplayOutage(DictOut = True), sort_keys=False)
                     continue
+                elif b"units_json" == item.lower():
+                    msgbody = json.dumps(self.DisplayUnits(DictOut = True), sort_keys=False)
+                    continue
                 if b"gui_status_json" == item.lower():          # used in web interface
                     msgbody += json.dumps(self.GetStatusForGUI())
                     continue
@@ -1915,23 +2312,20 @@ class GeneratorDevice:
             # do not check for outage
             return ""
 
-        Value = self.GetRegisterValueFromList("0009")
-        if len(Value) != 4:
+        UtilityVolts = self.Registers.GetU16("0009")
+        if UtilityVolts is None:
             return ""           # we don't have a value for this register yet
-        UtilityVolts = int(Value, 16)
 
         # Get threshold voltage
-        Value = self.GetRegisterValueFromList("0011")
-        if len(Value) != 4:
+        ThresholdVoltage = self.Registers.GetU16("0011")
+        if ThresholdVoltage is None:
             return ""           # we don't have a value for this register yet
-        ThresholdVoltage = int(Value, 16)
 
         # get pickup voltage
         if self.EvolutionController and self.LiquidCooled:
-            Value = self.GetRegisterValueFromList("023b")
-            if len(Value) != 4:
+            PickupVoltage = self.Registers.GetU16("023b")
+            if PickupVoltage is None:
                 return ""           # we don't have a value for this register yet
-            PickupVoltage = int(Value, 16)
         else:
             PickupVoltage = DEFAULT_PICKUP_VOLTAGE
 
@@ -2011,10 +2405,9 @@ class GeneratorDevice:
         self.CheckForOutage()
 
         # now check to see if there is an alarm
-        Value = self.GetRegisterValueFromList("0001")
-        if len(Value) != 8:
+        RegVal = self.Registers.GetU32("0001")
+        if RegVal is None:
             return ""           # we don't have a value for this register yet
-        RegVal = int(Value, 16)
 
         if RegVal == self.LastAlarmValue:
             return      # nothing new to report, return
@@ -2096,8 +2489,15 @@ class GeneratorDevice:
         outstring += self.printToScreen("   setremote   - issue remote command. format is setremote=command, ", ToString)
         outstring += self.printToScreen("                      where command is start, stop, starttransfer,", ToString)
         outstring += self.printToScreen("                      startexercise. i.e. setremote=start", ToString)
+        outstring += self.printToScreen("   units       - display the generators managed by this monitor", ToString)
+        if self.EnableDebug:
+            outstring += self.printToScreen("   registermap - display the registers found by the register scan", ToString)
         outstring += self.printToScreen("   help        - Display help on commands", ToString)
         outstring += self.printToScreen("\n", ToString)
+        if len(self.Units) > 1:
+            outstring += self.printToScreen("Commands for a unit other than 1 are prefixed by generator[unit]:", ToString)
+            outstring += self.printToScreen("   i.e.  generator[2]: status", ToString)
+            outstring += self.printToScreen("\n", ToString)
 
         outstring += self.printToScreen("To clear the Alarm/Warning message, press OFF on the control panel keypad", ToString)
         outstring += self.printToScreen("followed by the ENTER key. To access Dealer Menu on the Evolution", ToString)
@@ -2185,6 +2585,7 @@ class GeneratorDevice:
         return InputBuffer
 
     #------------------- GeneratorDevice::DisplayOutage -----------------
+    @myregisters.Pinned
     def DisplayOutage(self, ToString = False, DictOut = False):
 
         Outage = collections.OrderedDict()
@@ -2211,13 +2612,14 @@ class GeneratorDevice:
         OutageData["Utility Voltage Minimum"] = "%dV " % (self.UtilityVoltsMin)
         OutageData["Utility Voltage Maximum"] = "%dV " % (self.UtilityVoltsMax)
 
-        OutageData["Utility Threshold Voltage"] = self.GetThresholdVoltage
+        # called here, not dispatched, the dict is returned as is for outage_json
+        OutageData["Utility Threshold Voltage"] = self.GetThresholdVoltage()
 
         if self.EvolutionController and self.LiquidCooled:
-            OutageData["Utility Pickup Voltage"] = self.GetPickUpVoltage
+            OutageData["Utility Pickup Voltage"] = self.GetPickUpVoltage()
 
         if self.EvolutionController:
-            OutageData["Startup Delay"] = self.GetStartupDelay
+            OutageData["Startup Delay"] = self.GetStartupDelay()
 
         OutageData["Outage Log"] = self.DisplayOutageHistory()
 
@@ -2226,6 +2628,28 @@ class GeneratorDevice:
 
         return Outage
 
+    #------------ GeneratorDevice::DisplayUnits ----------------------------------------
+    def DisplayUnits(self, ToString = False, DictOut = False):
+
+        Units = collections.OrderedDict()
+        UnitData = collections.OrderedDict()
+        Units["Units"] = UnitData
+
+        for Unit in sorted(self.Units.keys()):
+            Device = self.Units[Unit]
+            Info = collections.OrderedDict()
+            UnitData["Unit %d" % Unit] = Info
+            Info["Unit"] = "%d" % Unit
+            Info["Site Name"] = Device.SiteName
+            Info["Controller"] = Device.GetController(Actual = False)
+            Info["Transport"] = Device.ModBus.Slave.GetTransportName()
+            Info["Status"] = Device.GetBaseStatus()
+
+        if not DictOut:
+            return self.printToScreen(self.ProcessDispatch(Units,""), ToString)
+
+        return Units
+
     #------------ GeneratorDevice::DisplayOutageHistory-------------------------
     def DisplayOutageHistory(self):
 
@@ -2289,8 +2713,24 @@ class GeneratorDevice:
         outstr = str(ProgramRunTime).split(".")[0]  # remove microseconds from string
         GenMonStats["Run time"] = self.ProgramName + " running for " + outstr + "."
         GenMonStats["Generator Monitor Version"] = GENMON_VERSION
-
-
+        if self.ModbusServer != None:
+            for Name, Value in self.ModbusServer.GetStats():
+                GenMonStats[Name] = Value
+        if self.Scanner != None:
+            for Name, Value in self.Scanner.GetStats():
+                GenMonStats[Name] = Value
+        for Name, Value in self.EventBus.GetStats():
+            GenMonStats[Name] = Value
+        if self.History != None:
+            for Name, Value in self.History.GetStats():
+                GenMonStats[Name] = Value
+        for Name, Value in self.DecodeCache.GetStats():
+            GenMonStats[Name] = Value
+        for Name, Value in self.AlarmCatalogue.GetStats():
+            GenMonStats[Name] = Value
+
+
+        SerialStats["Transport"] = self.ModBus.Slave.GetTransportName()
         SerialStats["Packet Count"] = "M: %d, S: %d, Buffer Count: %d" % (self.ModBus.Slave.TxPacketCount, self.ModBus.Slave.RxPacketCount, len(self.ModBus.Slave.Buffer))
 
         if self.ModBus.Slave.CrcError == 0 or self.ModBus.Slave.RxPacketCount == 0:
@@ -2301,6 +2741,7 @@ class GeneratorDevice:
         SerialStats["CRC Errors"] = "%d " % self.ModBus.Slave.CrcError
         SerialStats["CRC Percent Errors"] = "%.2f" % PercentErrors
         SerialStats["Discarded Bytes"] = "%d" % self.ModBus.Slave.DiscardedBytes
+        SerialStats["Resyncs"] = "%d" % self.ModBus.Slave.Resyncs
         SerialStats["Serial Restarts"] = "%d" % self.ModBus.Slave.Restarts
         SerialStats["Serial Timeouts"] = "%d" %  self.ModBus.Slave.ComTimoutError
 
@@ -2314,6 +2755,38 @@ class GeneratorDevice:
         if self.ModBus.Slave.RxPacketCount:
             AvgTransactionTime = float(self.ModBus.Slave.TotalElapsedPacketeTime / self.ModBus.Slave.RxPacketCount)
             SerialStats["Average Transaction Time"] = "%.4f sec" % (AvgTransactionTime)
+            SerialStats["Minimum Transaction Time"] = "%.4f sec" % (self.ModBus.Slave.MinPacketTime)
+            SerialStats["Maximum Transaction Time"] = "%.4f sec" % (self.ModBus.Slave.MaxPacketTime)
+
+        if self.Scheduler != None:
+            MinInterval, AvgInterval, MaxInterval = self.Scheduler.GetStats()
+            SerialStats["Poll Interval (Min/Avg/Max)"] = "%.1f/%.1f/%.1f sec" % (MinInterval, AvgInterval, MaxInterval)
+
+        SerialStats["Log Refresh (Incremental/Full)"] = "%d/%d" % (self.LogRefreshIncremental, self.LogRefreshFull)
+        SerialStats["Log Read Span"] = "%d" % self.LogReadSpan
+        SerialStats["Transaction Queue Depth"] = "%d (Max %d)" % (self.ModBus.GetQueueDepth(), self.ModBus.MaxQueueDepth)
+        SerialStats["Expired Transactions"] = "%d" % self.ModBus.ExpiredTransactions
+        for Priority, Name in enumerate(mymodbus.PRIORITY_NAMES):
+            Count, TotalWait, MaxWait = self.ModBus.QueueStats[Priority]
+            if Count:
+                SerialStats["Queue Wait (%s)" % Name] = "Avg %.4f sec, Max %.4f sec, Count %d" % (TotalWait / Count, MaxWait, Count)
+        SerialStats["Response Timeout Slack"] = "%d ms" % (self.ModBus.TimeoutSlack * 1000)
+        SerialStats["Read Retries"] = "%d" % self.ModBus.RetryCount
+        SerialStats["Exception Responses"] = "%d" % self.ModBus.ExceptionResponses
+        SerialStats["Write Frames Saved"] = "%d" % self.ModBus.CombinedWrites
+        SerialStats["Write Verify Failures"] = "%d" % self.ModBus.WriteVerifyFailures
+        SerialStats["Write Rollbacks"] = "%d" % self.ModBus.WriteRollbacks
+        DemotedReads = self.ModBus.GetDemotedReads()
+        if len(DemotedReads):
+            SerialStats["Demoted Reads"] = ", ".join("%04x (%d)" % (Register, Length) for Register, Length in DemotedReads)
+            SerialStats["Demoted Reads Skipped"] = "%d" % self.ModBus.DemotedSkips
+        for Name, Value in self.ModBus.Slave.GetStats():
+            SerialStats[Name] = Value
+        if self.ModBus.Loop != None:
+            for Name, Value in self.ModBus.Loop.GetStats():
+                SerialStats[Name] = Value
+        if self.ModBus.Capture != None:
+            SerialStats["Capture File"] = "%s (%d frames)" % (self.ModBus.Capture.FileName, self.ModBus.Capture.Records)
 
         if not DictOut:
             return self.printToScreen(self.ProcessDispatch(Monitor,""), ToString)
@@ -2321,6 +2794,7 @@ class GeneratorDevice:
         return Monitor
 
     #------------ GeneratorDevice::DisplayStatus ----------------------------------------
+    @myregisters.Pinned
     def DisplayStatus(self, ToString = False, DictOut = False):
 
 
@@ -2394,6 +2868,7 @@ class GeneratorDevice:
 
 
     #------------ GeneratorDevice::DisplayMaintenance ----------------------------------------
+    @myregisters.Pinned
     def DisplayMaintenance (self, ToString = False, DictOut = False):
 
         if DictOut:
@@ -2524,9 +2999,9 @@ class GeneratorDevice:
                 Sensors["Ambient Temp Thermistor"] = "Sensor: " + Value + ", " + CStr + "C, " + FStr + "F"
 
             # get total hours since activation
-            Value = self.GetRegisterValueFromList("0054")
-            if len(Value):
-                StrVal = "%d H" % int(Value,16)
+            Value = self.Registers.GetU16("0054")
+            if Value is not None:
+                StrVal = "%d H" % Value
                 Sensors["Hours of Protection"] = StrVal
 
         if self.EvolutionController and not self.LiquidCooled:
@@ -2914,7 +3389,7 @@ class GeneratorDevice:
         return RetStr
 
     #------------------- GeneratorDevice::GetAlarmInfo -----------------
-    # Read file alarm file and get more info on alarm if we have it
+    # Look up more info on alarm in the alarm catalogue if we have it
     # passes ErrorCode as string of hex values
     def GetAlarmInfo(self, ErrorCode, ReturnNameOnly = False, FromLog = False):
 
@@ -2932,23 +3407,13 @@ class GeneratorDevice:
                     # This can occur if the controller was power cycled and not alarms have occurred since power applied
                     return "Error Code 0000: No alarms occured since controller has been power cycled.\n"
 
-            with open(self.AlarmFile,"r") as AlarmFile:     #opens file
-
-                for line in AlarmFile:
-                    line = line.strip()                   # remove newline at beginning / end and trailing whitespace
-                    if not len(line):
-                        continue
-                    if line[0] == "#":              # comment?
-                        continue
-                    Items = line.split("!")
-                    if len(Items) != 5:
-                        continue
-                    if Items[0] == str(int(ErrorCode,16)):
-                        if ReturnNameOnly:
-                            outstr = Items[2]
-                        else:
-                            outstr =  Items[2] + ", Error Code: " + Items[0] + "\n" + "    Description: " + Items[3] + "\n" + "    Additional Info: " + Items[4] + "\n"
-                        return outstr
+            Alarm = self.AlarmCatalogue.Get(int(ErrorCode,16))
+            if Alarm != None:
+                if ReturnNameOnly:
+                    outstr = Alarm.Name
+                else:
+                    outstr =  Alarm.Name + ", Error Code: " + str(Alarm.Code) + "\n" + "    Description: " + Alarm.Condition + "\n" + "    Additional Info: " + Alarm.Info + "\n"
+                return outstr
 
         except Exception as e1:
             self.LogError("Error in  GetAlarmInfo " + str(e1))
@@ -2988,10 +3453,9 @@ class GeneratorDevice:
     #----------  ParseRegisters:GetHardwareVersion  ---------------------------------
     def GetHardwareVersion(self):
 
-        Value = self.GetRegisterValueFromList("002a")
-        if len(Value) != 4:
+        RegVal = self.Registers.GetU16("002a")
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         IntTemp = RegVal >> 8           # high byte is firmware version
         FloatTemp = IntTemp / 100.0
@@ -2999,16 +3463,16 @@ class GeneratorDevice:
 
     #----------  ParseRegisters:GetFirmwareVersion  ---------------------------------
     def GetFirmwareVersion(self):
-        Value = self.GetRegisterValueFromList("002a")
-        if len(Value) != 4:
+        RegVal = self.Registers.GetU16("002a")
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         IntTemp = RegVal & 0xff         # low byte is firmware version
         FloatTemp = IntTemp / 100.0
         return "V%2.2f" % FloatTemp     #
 
      #------------ GeneratorDevice::GetTransferStatus --------------------------------------
+    @myregisters.Decoder("0053")
     def GetTransferStatus(self):
 
         if not self.EvolutionController:
@@ -3019,10 +3483,9 @@ class GeneratorDevice:
             else:
                 return ""
 
-        Value = self.GetRegisterValueFromList(Register)
-        if len(Value) != 4:
+        RegVal = self.Registers.GetU16(Register)
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         if self.BitIsEqual(RegVal, 0x01, 0x01):
             return "Generator"
@@ -3031,6 +3494,7 @@ class GeneratorDevice:
 
 
     ##------------ GeneratorDevice::SystemInAlarm --------------------------------------
+    # not cached, it updates GeneratorInAlarm. GetAlarmState is cached
     def SystemInAlarm(self):
 
         AlarmState = self.GetAlarmState()
@@ -3043,6 +3507,7 @@ class GeneratorDevice:
         return False
 
     ##------------ GeneratorDevice::GetAlarmState --------------------------------------
+    @myregisters.Decoder("0001", "05f1")
     def GetAlarmState(self):
 
         strSwitch = self.GetSwitchState()
@@ -3052,10 +3517,9 @@ class GeneratorDevice:
 
         outString = ""
 
-        Value = self.GetRegisterValueFromList("0001")
-        if len(Value) != 8:
+        RegVal = self.Registers.GetU32("0001")
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         if "alarm" in strSwitch.lower() and self.EvolutionController:
             Value = self.GetRegisterValueFromList("05f1")   # get last error code
@@ -3109,6 +3573,7 @@ class GeneratorDevice:
         return ret[0]
 
     ##------------ GeneratorDevice::GetSensorInputs --------------------------------------
+    @myregisters.Decoder("0052")
     def GetSensorInputs(self):
 
         # at the moment this has only been validated on an Evolution Liquid cooled generator
@@ -3166,18 +3631,17 @@ class GeneratorDevice:
         #   8           Manual              Transfer
 
         # get the inputs registes
-        Value = self.GetRegisterValueFromList("0052")
-        if len(Value) != 4:
+        RegVal = self.Registers.GetU16("0052")
+        if RegVal is None:
             return ""
 
-        RegVal = int(Value, 16)
-
         if self.LiquidCooled:
             return self.GetDigitalValues(RegVal, DealerInputs_Evo_LC)
         else:
             return self.GetDigitalValues(RegVal, DealerInputs_Evo_AC)
 
     #------------ GeneratorDevice::GetDigitalOutputs --------------------------------------
+    @myregisters.Decoder("0053")
     def GetDigitalOutputs(self):
 
         if not self.EvolutionController:
@@ -3206,21 +3670,20 @@ class GeneratorDevice:
 
         Register = "0053"
 
-        Value = self.GetRegisterValueFromList(Register)
-        if len(Value) != 4:
+        RegVal = self.Registers.GetU16(Register)
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         return self.GetDigitalValues(RegVal, DigitalOutputs_LC)
 
     #------------ GeneratorDevice::GetEngineState --------------------------------------
+    @myregisters.Decoder("0001")
     def GetEngineState(self, Reg0001Value = None):
 
         if Reg0001Value is None:
-            Value = self.GetRegisterValueFromList("0001")
-            if len(Value) != 8:
+            RegVal = self.Registers.GetU32("0001")
+            if RegVal is None:
                 return ""
-            RegVal = int(Value, 16)
         else:
             RegVal = Reg0001Value
 
@@ -3266,12 +3729,12 @@ class GeneratorDevice:
             return "UNKNOWN: %08x" % RegVal
 
     #------------ GeneratorDevice::GetSwitchState --------------------------------------
+    @myregisters.Decoder("0001")
     def GetSwitchState(self):
 
-        Value = self.GetRegisterValueFromList("0001")
-        if len(Value) != 8:
+        RegVal = self.Registers.GetU32("0001")
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         if self.BitIsEqual(RegVal, 0x0FFFF, 0x00):
             return "Auto"
@@ -3289,39 +3752,39 @@ class GeneratorDevice:
     def GetDateTime(self):
 
         #Generator Time Hi byte = hours, Lo byte = min
-        Value = self.GetRegisterValueFromList("000e")
-        if len(Value) != 4:
+        Value = self.Registers.GetU16("000e")
+        if Value is None:
             return ""
-        Hour = Value[:2]
-        if int(Hour,16) > 23:
+        Hour = Value >> 8
+        if Hour > 23:
             return ""
-        Minute = Value[2:]
-        if int(Minute,16) >= 60:
+        Minute = Value & 0xff
+        if Minute >= 60:
             return ""
         # Hi byte = month, Lo byte = day of the month
-        Value = self.GetRegisterValueFromList("000f")
-        if len(Value) != 4:
+        Value = self.Registers.GetU16("000f")
+        if Value is None:
             return ""
-        Month = Value[:2]
-        if int(Month,16) == 0 or int(Month,16) > 12:            # 1 - 12
+        Month = Value >> 8
+        if Month == 0 or Month > 12:            # 1 - 12
             return ""
-        DayOfMonth = Value[2:]
-        if int(DayOfMonth,16) > 31 or int(DayOfMonth,16) == 0:  # 1 - 31
+        DayOfMonth = Value & 0xff
+        if DayOfMonth > 31 or DayOfMonth == 0:  # 1 - 31
             return ""
         # Hi byte Day of Week 00=Sunday 01=Monday, Lo byte = last 2 digits of year
-        Value = self.GetRegisterValueFromList("0010")
-        if len(Value) != 4:
+        Value = self.Registers.GetU16("0010")
+        if Value is None:
             return ""
-        DayOfWeek = Value[:2]
-        if int(DayOfWeek,16) > 7:
+        DayOfWeek = Value >> 8
+        if DayOfWeek > 7:
             return ""
-        Year = Value[2:]
-        if int(Year,16) < 16:
+        Year = Value & 0xff
+        if Year < 16:
             return ""
 
-        FullDate =self.DaysOfWeek.get(int(DayOfWeek,16),"INVALID") + " " + self.MonthsOfYear.get(int(Month,16),"INVALID")
-        FullDate += " " + str(int(DayOfMonth,16)) + ", " + "20" + str(int(Year,16)) + " "
-        FullDate += "%02d:%02d" %  (int(Hour,16), int(Minute,16))
+        FullDate =self.DaysOfWeek.get(DayOfWeek,"INVALID") + " " + self.MonthsOfYear.get(Month,"INVALID")
+        FullDate += " " + str(DayOfMonth) + ", " + "20" + str(Year) + " "
+        FullDate += "%02d:%02d" %  (Hour, Minute)
 
         return FullDate
 
@@ -3333,10 +3796,10 @@ class GeneratorDevice:
         if not self.LiquidCooled:
             return ""                       # Not supported on Air Cooled
         # get exercise time of day
-        Value = self.GetRegisterValueFromList("023e")
-        if len(Value) != 4:
+        Value = self.Registers.GetU16("023e")
+        if Value is None:
             return ""
-        return "%d min" % int(Value,16)
+        return "%d min" % Value
 
     #------------ GeneratorDevice::GetParsedExerciseTime --------------------------------------------
     def GetParsedExerciseTime(self):
@@ -3451,11 +3914,10 @@ class GeneratorDevice:
                 return "0"
 
         # get value
-        Value = self.GetRegisterValueFromList(Register)
-        if len(Value) != 4:
+        IntTemp = self.Registers.GetU16(Register)
+        if IntTemp is None:
             return ""
 
-        IntTemp = int(Value,16)
         if not Hex:
             SensorValue = "%d" % IntTemp
         else:
@@ -3467,11 +3929,11 @@ class GeneratorDevice:
     def GetRPM(self):
 
         # get RPM
-        Value = self.GetRegisterValueFromList("0007")
-        if len(Value) != 4:
+        Value = self.Registers.GetU16("0007")
+        if Value is None:
             return ""
 
-        RPMValue = "%5d" % int(Value,16)
+        RPMValue = "%5d" % Value
         return RPMValue
 
     #------------ GeneratorDevice::GetCurrentOutput ---------------------------------------
@@ -3487,21 +3949,21 @@ class GeneratorDevice:
 
         CurrentFloat = 0.0
         if self.EvolutionController and self.LiquidCooled:
-            Value = self.GetRegisterValueFromList("0058")
-            if len(Value):
-                CurrentFloat = int(Value,16)
+            Value = self.Registers.GetU16("0058")
+            if Value is not None:
+                CurrentFloat = Value
                 CurrentFloat = max((CurrentFloat * .2248) - 303.268, 0)
 
         elif self.EvolutionController and not self.LiquidCooled:
             E1Current = 0
             E2Current = 0
 
-            Value = self.GetRegisterValueFromList("05f4")
-            if len(Value):
-                E1Current = int(Value,16)
-            Value = self.GetRegisterValueFromList("05f5")
-            if len(Value):
-                E2Current = int(Value,16)
+            Value = self.Registers.GetU16("05f4")
+            if Value is not None:
+                E1Current = Value
+            Value = self.Registers.GetU16("05f5")
+            if Value is not None:
+                E2Current = Value
             CurrentFloat = float(E1Current + E2Current)
             #Value = self.GetRegisterValueFromList("003B")
             #if len(Value):
@@ -3721,6 +4183,65 @@ class GeneratorDevice:
 
         return NewList
 
+    #------------ GeneratorDevice::GetRegisterHistory-------------------------
+    # format is "history_json=000a,60" or "history_json=000a,60,100", returns the
+    # values of a register read in the last 60 minutes reduced to 100 points (default 300),
+    # each point is [time, minimum, maximum, average]. "Covered Minutes" is the part of
+    # the requested time the history has samples for, "Complete" is False if the history
+    # does not go back as far as requested (i.e. genmon started recently)
+    def GetRegisterHistory(self, CmdString):
+
+        msgbody = "Invalid command syntax for command history_json"
+
+        try:
+            CmdList = CmdString.split("=")
+            if len(CmdList) != 2 or CmdList[0].strip() != "history_json":
+                self.LogError("Validation Error: Error parsing command string in GetRegisterHistory (parse): " + CmdString)
+                return msgbody
+
+            ParseList = CmdList[1].split(",")
+            if len(ParseList) < 2 or len(ParseList) > 3:
+                self.LogError("Validation Error: Error parsing command string in GetRegisterHistory (parse2): " + CmdString)
+                return msgbody
+            Register = "%04x" % int(ParseList[0].strip(), 16)
+            Minutes = int(ParseList[1].strip())
+            MaxPoints = myhistory.DEFAULT_MAX_POINTS
+            if len(ParseList) == 3:
+                MaxPoints = int(ParseList[2].strip())
+            if Minutes <= 0 or MaxPoints <= 0:
+                self.LogError("Validation Error: Error parsing command string in GetRegisterHistory (parse3): " + CmdString)
+                return msgbody
+        except Exception as e1:
+            self.LogError("Error in  GetRegisterHistory (Parse): %s : %s" % (CmdString,str(e1)))
+            return msgbody
+
+        if self.History == None:
+            return []       # history disabled
+
+        Samples = self.History.GetRange(Register, Minutes)
+        Oldest = self.History.GetOldest(Register)
+        Start = time.time() - (Minutes * 60)
+        History = collections.OrderedDict()
+        History["Register"] = Register
+        History["Minutes"] = Minutes
+        if Oldest == None:
+            History["Covered Minutes"] = 0
+        else:
+            History["Covered Minutes"] = round(min(Minutes, (time.time() - Oldest) / 60.0), 1)
+        # the first sample kept is at most one interval after the start of the time recorded
+        History["Complete"] = Oldest != None and Oldest <= Start + self.History.Interval
+        History["Sample Interval"] = self.History.Interval
+        History["Samples"] = len(Samples)
+        Summary = self.History.GetSummary(Samples)
+        if Summary != None:
+            History["Minimum"], History["Maximum"], History["Average"] = Summary[0], Summary[1], round(Summary[2], 2)
+        PointList = []
+        for Time, Minimum, Maximum, Average in self.History.Downsample(Samples, MaxPoints):
+            TimeStamp = datetime.datetime.fromtimestamp(Time).strftime('%x %X')
+            PointList.append([TimeStamp, Minimum, Maximum, round(Average, 2)])
+        History["History"] = PointList
+        return History
+
     #------------ GeneratorDevice::-------------------------
     def GetPowerHistory(self, CmdString, NoReduce = False):
 
@@ -3829,20 +4350,18 @@ class GeneratorDevice:
             return msgbody
 
     #----------  GeneratorDevice::PowerMeter-------------------------------------
-    #----------  Monitors Power Output
+    #----------  Monitors Power Output, logs the output when the registers it is calculated from change
     def PowerMeter(self):
 
+        Queue = self.EventQueues["PowerMeter"]
         if not len(self.PowerLog):
             self.LogError("Power Log Disabled")
             self.KillThread("PowerMeter", CleanupSelf = True)
             return
 
         # make sure system is up and running otherwise we will not know which controller is present
-        while True:
-            time.sleep(1)
-            if self.InitComplete:
-                break
-            if self.IsStopSignaled("PowerMeter"):
+        while not self.InitComplete:
+            if Queue.Get() == None:
                 return
 
         if not self.EvolutionController:    # Not supported by Nexus at this time
@@ -3864,16 +4383,15 @@ class GeneratorDevice:
         LastPruneTime = datetime.datetime.now()
         while True:
             try:
-                time.sleep(5)
+                # Time to exit?
+                if Queue.Get() == None:
+                    return
 
                 # Housekeeping on kw Log
                 if self.GetDeltaTimeMinutes(datetime.datetime.now() - LastPruneTime) > 1440 :     # check every day
                     self.PrunePowerLog(43800)   # delete log entries greater than one month
                     LastPruneTime = datetime.datetime.now()
 
-                # Time to exit?
-                if self.IsStopSignaled("PowerMeter"):
-                    return
                 KWOut = self.removeAlpha(self.GetPowerOutput())
                 KWFloat = float(KWOut)
 
@@ -3923,11 +4441,10 @@ class GeneratorDevice:
         FloatTemp = 0.0
 
         if not Calculate:
-            Value = self.GetRegisterValueFromList("0008")
-            if len(Value) != 4:
+            IntTemp = self.Registers.GetU16("0008")
+            if IntTemp is None:
                 return ""
 
-            IntTemp = int(Value,16)
             if self.EvolutionController and self.LiquidCooled:
                 FloatTemp = IntTemp / 10.0      # Evolution
             elif not self.EvolutionController and self.LiquidCooled:
@@ -3950,11 +4467,11 @@ class GeneratorDevice:
     def GetVoltageOutput(self):
 
         # get Output Voltage
-        Value = self.GetRegisterValueFromList("0012")
-        if len(Value) != 4:
+        Value = self.Registers.GetU16("0012")
+        if Value is None:
             return ""
 
-        VolatageValue = "%dV" % int(Value,16)
+        VolatageValue = "%dV" % Value
 
         return VolatageValue
 
@@ -3962,10 +4479,9 @@ class GeneratorDevice:
     def GetPickUpVoltage(self):
 
          # get Utility Voltage Pickup Voltage
-        Value = self.GetRegisterValueFromList("023b")
-        if len(Value) != 4:
+        PickupVoltage = self.Registers.GetU16("023b")
+        if PickupVoltage is None:
             return ""
-        PickupVoltage = int(Value,16)
 
         return "%dV" % PickupVoltage
 
@@ -3973,10 +4489,9 @@ class GeneratorDevice:
     def GetThresholdVoltage(self):
 
         # get Utility Voltage Threshold
-        Value = self.GetRegisterValueFromList("0011")
-        if len(Value) != 4:
+        ThresholdVoltage = self.Registers.GetU16("0011")
+        if ThresholdVoltage is None:
             return ""
-        ThresholdVoltage = int(Value,16)
 
         return "%dV" % ThresholdVoltage
 
@@ -3986,10 +4501,9 @@ class GeneratorDevice:
         # get set output voltage
         if not self.EvolutionController or not self.LiquidCooled:
             return ""
-        Value = self.GetRegisterValueFromList("0237")
-        if len(Value) != 4:
+        SetOutputVoltage = self.Registers.GetU16("0237")
+        if SetOutputVoltage is None:
             return ""
-        SetOutputVoltage = int(Value,16)
 
         return "%dV" % SetOutputVoltage
 
@@ -3997,17 +4511,15 @@ class GeneratorDevice:
     def GetStartupDelay(self):
 
         # get Startup Delay
-        StartupDelay = 0
-        Value = ""
+        StartupDelay = None
         if self.EvolutionController and not self.LiquidCooled:
-            Value = self.GetRegisterValueFromList("002b")
+            StartupDelay = self.Registers.GetU16("002b")
         elif self.EvolutionController and self.LiquidCooled:
-            Value = self.GetRegisterValueFromList("0239")
+            StartupDelay = self.Registers.GetU16("0239")
         else:
             return ""
-        if len(Value) != 4:
+        if StartupDelay is None:
             return ""
-        StartupDelay = int(Value,16)
 
         return "%d s" % StartupDelay
 
@@ -4015,11 +4527,11 @@ class GeneratorDevice:
     def GetUtilityVoltage(self):
 
         # get Utility Voltage
-        Value = self.GetRegisterValueFromList("0009")
-        if len(Value) != 4:
+        Value = self.Registers.GetU16("0009")
+        if Value is None:
             return ""
 
-        VolatageValue = "%dV" % int(Value,16)
+        VolatageValue = "%dV" % Value
 
         return VolatageValue
 
@@ -4027,11 +4539,10 @@ class GeneratorDevice:
     def GetBatteryVoltage(self):
 
         # get Battery Charging Voltage
-        Value = self.GetRegisterValueFromList("000a")
-        if len(Value) != 4:
+        IntTemp = self.Registers.GetU16("000a")
+        if IntTemp is None:
             return ""
 
-        IntTemp = int(Value,16)
         FloatTemp = IntTemp / 10.0
         VoltageValue = "%2.1fV" % FloatTemp
 
@@ -4049,9 +4560,9 @@ class GeneratorDevice:
         if not "Stopped" in EngineState and not "Off" in EngineState:
             return "Not Charging"
 
-        Value = self.GetRegisterValueFromList("05ee")
-        if len(Value):
-            FloatTemp = int(Value,16) / 10.0
+        Value = self.Registers.GetU16("05ee")
+        if Value is not None:
+            FloatTemp = Value / 10.0
             if self.LiquidCooled:
                 CompValue = 5.0
             else:
@@ -4098,6 +4609,7 @@ class GeneratorDevice:
     # 12.6V or an engine crank occurs (i.e. such as occurs during the
     # weekly exercise cycle). If either condition occurs the battery charge
     # will begin its 18 hour charge cycle.
+    @myregisters.Decoder("0053")
     def GetBatteryStatus(self):
 
         if not self.EvolutionController:
@@ -4109,18 +4621,17 @@ class GeneratorDevice:
                 return "Not Available"
 
         # get Battery Charging Voltage
-        Value = self.GetRegisterValueFromList(Register)
-        if len(Value) != 4:
+        Outputs = self.Registers.GetU16(Register)
+        if Outputs is None:
             return ""
 
-        Outputs = int(Value,16)
-
         if self.BitIsEqual(Outputs, 0x10, 0x10):
             return "Charging"
         else:
             return "Not Charging"
 
     #------------ GeneratorDevice::GetStatusForGUI ------------------------------------
+    @myregisters.Pinned
     def GetStatusForGUI(self):
 
         Status = {}
@@ -4129,10 +4640,14 @@ class GeneratorDevice:
         Status["kwOutput"] = self.GetPowerOutput()
         Status["Exercise"] = self.GetParsedExerciseTime()
         Status["UnsentFeedback"] = str(os.path.isfile(self.FeedbackLogFile))
+        # sequence of the register snapshot, the web UI skips reading maint_json if it has not
+        # changed. Only here, the status, maintenance and outage dicts are displayed key by key
+        Status["Snapshot"] = self.Registers.GetViewSequence()
 
         return Status
 
     #------------ GeneratorDevice::GetBaseStatus ------------------------------------
+    @myregisters.Decoder("0001", "05f1", "001a", "001c", "001e", "001f", "0021")
     def GetBaseStatus(self):
 
         if self.SystemInAlarm():
@@ -4159,15 +4674,14 @@ class GeneratorDevice:
                 return "READY"
 
     #------------ GeneratorDevice::ServiceIsDue ------------------------------------
+    @myregisters.Decoder("0001", "001a", "001c", "001e", "001f", "0021")
     def ServiceIsDue(self):
 
         # get Hours until next service
-        Value = self.GetRegisterValueFromList("0001")
-        if len(Value) != 8:
+        HexValue = self.Registers.GetU32("0001")
+        if HexValue is None:
             return False
 
-        HexValue = int(Value,16)
-
         # service due alarm?
         if self.BitIsEqual(HexValue,   0xFFF0FFFF, 0x0000001F):
             return True
@@ -4230,14 +4744,14 @@ class GeneratorDevice:
             return ""
 
         # get Hours until next service
-        Value = self.GetRegisterValueFromList(Register)
-        if len(Value) != 4:
+        Value = self.Registers.GetU16(Register)
+        if Value is None:
             return ""
 
         if NoUnits:
-            ServiceValue = "%d" % int(Value,16)
+            ServiceValue = "%d" % Value
         else:
-            ServiceValue = "%d hrs" % int(Value,16)
+            ServiceValue = "%d hrs" % Value
 
         return ServiceValue
 
@@ -4298,12 +4812,12 @@ class GeneratorDevice:
             return ""
 
         # get Hours until next service
-        Value = self.GetRegisterValueFromList(Register)
-        if len(Value) != 4:
+        Value = self.Registers.GetU16(Register)
+        if Value is None:
             return ""
 
         try:
-            time = int(Value,16) * 86400
+            time = Value * 86400
             time += 86400
             Date = datetime.datetime.fromtimestamp(time)
             return Date.strftime('%m/%d/%Y ')
@@ -4314,10 +4828,9 @@ class GeneratorDevice:
     #----------  GeneratorDevice:GetHardwareVersion  ---------------------------------
     def GetHardwareVersion(self):
 
-        Value = self.GetRegisterValueFromList("002a")
-        if len(Value) != 4:
+        RegVal = self.Registers.GetU16("002a")
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         IntTemp = RegVal >> 8           # high byte is firmware version
         FloatTemp = IntTemp / 100.0
@@ -4325,10 +4838,9 @@ class GeneratorDevice:
 
     #----------  GeneratorDevice:GetFirmwareVersion  ---------------------------------
     def GetFirmwareVersion(self):
-        Value = self.GetRegisterValueFromList("002a")
-        if len(Value) != 4:
+        RegVal = self.Registers.GetU16("002a")
+        if RegVal is None:
             return ""
-        RegVal = int(Value, 16)
 
         IntTemp = RegVal & 0xff         # low byte is firmware version
         FloatTemp = IntTemp / 100.0
@@ -4339,34 +4851,27 @@ class GeneratorDevice:
 
         if not self.EvolutionController or not self.LiquidCooled:
             # get total hours running
-            Value = self.GetRegisterValueFromList("000c")
-            if len(Value) != 4:
+            TotalRunTimeLow = self.Registers.GetU16("000c")
+            if TotalRunTimeLow is None:
                 return ""
 
-            TotalRunTimeLow = int(Value,16)
-
             # get total hours running
-            Value = self.GetRegisterValueFromList("000b")
-            if len(Value) != 4:
+            TotalRunTimeHigh = self.Registers.GetU16("000b")
+            if TotalRunTimeHigh is None:
                 return ""
-            TotalRunTimeHigh = int(Value,16)
 
             TotalRunTime = (TotalRunTimeHigh << 16)| TotalRunTimeLow
             RunTimes = "%d " % (TotalRunTime)
         else:
             # total engine run time in minutes
-            Value = self.GetRegisterValueFromList("005f")
-            if len(Value) != 4:
+            TotalRunTimeLow = self.Registers.GetU16("005f")
+            if TotalRunTimeLow is None:
                 return ""
 
-            TotalRunTimeLow = int(Value,16)
-
-            Value = self.GetRegisterValueFromList("005e")
-            if len(Value) != 4:
+            TotalRunTimeHigh = self.Registers.GetU16("005e")
+            if TotalRunTimeHigh is None:
                 return ""
 
-            TotalRunTimeHigh = int(Value,16)
-
             TotalRunTime = (TotalRunTimeHigh << 16)| TotalRunTimeLow
             #hours, min = divmod(TotalRunTime, 60)
             #RunTimes = "Total Engine Run Time: %d:%d " % (hours, min)
@@ -4384,7 +4889,7 @@ class GeneratorDevice:
             outstr += "System Initializing. "
         if not self.AreThreadsAlive():
             outstr += " Threads are dead. "
-        if  not self.CommunicationsActive:
+        if  not self.CommunicationsActive():
             outstr += " Not receiving data. "
 
         if len(outstr) == 0:
@@ -4476,24 +4981,11 @@ class GeneratorDevice:
         isdst = t.tm_isdst
         return (isdst != 0)
 
-    #----------  GeneratorDevice::ComWatchDog-------------------------------------
-    #----------  monitors receive data status to make sure we are still communicating
-    def ComWatchDog(self):
-
-        self.CommunicationsActive = False
-        LastRxPacketCount = self.ModBus.Slave.RxPacketCount
-
-        while True:
-
-            if LastRxPacketCount == self.ModBus.Slave.RxPacketCount:
-                self.CommunicationsActive = False
-            else:
-                self.CommunicationsActive = True
-                LastRxPacketCount = self.ModBus.Slave.RxPacketCount
-            time.sleep(2)
+    #----------  GeneratorDevice::CommunicationsActive-------------------------------------
+    #----------  true if a valid response was received recently
+    def CommunicationsActive(self):
 
-            if self.IsStopSignaled("ComWatchDog"):
-                break
+        return (time.time() - self.ModBus.Slave.LastRxPacketTime) < COMM_TIMEOUT
 
     #---------- GeneratorDevice:: AreThreadsAlive----------------------------------
     # ret true if all threads are alive
@@ -4529,11 +5021,14 @@ class GeneratorDevice:
             conn.settimeout(2)   # only blok on recv for a small amount of time
 
             statusstr = ""
-            if self.SystemInAlarm():
-                statusstr += "CRITICAL: System in alarm! "
-            HealthStr = self.GetSystemHealth()
-            if HealthStr != "OK":
-                statusstr += "WARNING: " + HealthStr
+            for Unit in sorted(self.Units.keys()):
+                Device = self.Units[Unit]
+                UnitStr = "" if len(self.Units) == 1 else "Unit %d " % Unit
+                if Device.SystemInAlarm():
+                    statusstr += "CRITICAL: " + UnitStr + "System in alarm! "
+                HealthStr = Device.GetSystemHealth()
+                if HealthStr != "OK":
+                    statusstr += "WARNING: " + UnitStr + HealthStr
             if statusstr == "":
                 statusstr = "OK "
 
@@ -4589,6 +5084,32 @@ class GeneratorDevice:
 
         self.ServerSocket.close()
         #
+    #----------  GeneratorDevice::StartModbusServer-------------------------------------
+    # Modbus TCP server that answers from the register cache, it remains open during a reload
+    def StartModbusServer(self):
+
+        try:
+            self.ModbusServer = mymodbusserver.ModbusTcpServer(self.Registers, self.ModbusServerPort,
+                WriteCallback = self.ModbusServerWrite, WriteAllowList = self.ModbusServerWriteList, loglocation = self.LogLocation)
+            self.ModbusServer.Start()
+        except Exception as e1:
+            self.LogError("Error starting Modbus TCP server: " + str(e1))
+            self.ModbusServer = None
+
+    #----------  GeneratorDevice::ModbusServerWrite-------------------------------------
+    # write registers for a Modbus TCP server client, Values is a list of 16 bit values
+    def ModbusServerWrite(self, Register, Values):
+
+        # the registers genmon polls are read back and restored if the write fails, others
+        # (i.e. the command and index registers) do not read back as written
+        Writes = mywrite.WriteTransaction(self.ModBus, "Modbus server write %04x" % Register)
+        for Index in range(0, len(Values)):
+            Address = "%04x" % (Register + Index)
+            Writes.AddValue(Address, Values[Index], Verify = self.RegisterIsKnown(Address))
+
+        with self.CommAccessLock:
+            return Writes.Execute()
+
     #---------------------GeneratorDevice::FatalError------------------------
     def LogError(self, Message):
         self.log.error(Message)
@@ -4615,8 +5136,17 @@ class GeneratorDevice:
             self.ServerSocket.shutdown(socket.SHUT_RDWR)
             self.ServerSocket.close()
 
+        if self.ModbusServer != None:
+            self.ModbusServer.Close()
+
         if self.ModBus.DeviceInit:
-            self.ModBus.Slave.Close()
+            self.ModBus.Close()
+
+        if self.EventLoop != None:
+            self.EventLoop.Stop()
+
+        for Queue in list(self.EventQueues.values()):
+            Queue.Close()
 
     #------------ GeneratorDevice::BitIsEqual -----------------------------------------
     def BitIsEqual(self, value, mask, bits):
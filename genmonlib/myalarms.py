@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: myalarms.py
+# PURPOSE: Alarm codes from ALARMS.txt
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, time, bisect, threading
+
+CHECK_INTERVAL          = 5         # seconds between checks of the alarm file modification time
+
+# families of alarm codes (Evolution), name : list of (first code, last code)
+FAMILY_SPEED            = "Overspeed/Underspeed"
+FAMILY_LOW_OIL          = "Low Oil"
+FAMILY_HIGH_TEMP        = "High Temperature"
+FAMILY_RPM_SENSE        = "RPM Sensor"
+FAMILY_VOLTAGE          = "Overvoltage/Undervoltage"
+FAMILY_OVERCRANK        = "Overcrank"
+FAMILY_OVERLOAD         = "Overload"
+FAMILY_GOVERNOR         = "Governor"
+FAMILY_WARNING          = "Warning"
+
+ALARM_FAMILIES = {
+                FAMILY_SPEED : [(1200, 1206), (1600, 1603)],
+                FAMILY_LOW_OIL : [(1300, 1300)],
+                FAMILY_HIGH_TEMP : [(1400, 1400)],
+                FAMILY_RPM_SENSE : [(1500, 1521)],
+                FAMILY_VOLTAGE : [(1800, 1803), (1900, 1906)],
+                FAMILY_OVERCRANK : [(1100, 1101)],
+                FAMILY_OVERLOAD : [(2100, 2103)],
+                FAMILY_GOVERNOR : [(2500, 2502)],
+                FAMILY_WARNING : [(0, 0)],      # Evolution Air Cooled gives a code of 0000 for warnings
+                }
+
+# ---------- GetAlarmFamily------------------
+# return the family name of an alarm code (int), None if it is not in a family
+def GetAlarmFamily(Code):
+
+    for Family, Ranges in ALARM_FAMILIES.items():
+        for First, Last in Ranges:
+            if First <= Code <= Last:
+                return Family
+    return None
+
+#------------ AlarmEntry class ----------------------------------------------
+# one line of the alarm file
+class AlarmEntry:
+    def __init__(self, Code, Type, Name, Condition, Info):
+
+        self.Code = Code                    # int
+        self.Type = Type                    # ALARM or WARNING
+        self.Name = Name
+        self.Condition = Condition
+        self.Info = Info
+
+#------------ AlarmCatalogue class ------------------------------------------
+# The alarm file read into a dict keyed by alarm code. The file is read again
+# if its modification time changes, this is checked at most every
+# CHECK_INTERVAL seconds.
+#   File format: AlarmCode! Type (ALARM, WARNING)! AlarmName! Condition! Additional Info
+class AlarmCatalogue:
+    def __init__(self, FileName):
+
+        self.FileName = FileName
+        self.Alarms = {}                    # code (int) : AlarmEntry
+        self.Codes = []                     # sorted codes, for range lookups
+        self.ModifiedTime = None            # modification time of the file when read
+        self.LastCheck = 0
+        self.Loads = 0                      # times the file was read
+        self.Lock = threading.Lock()
+        self.Refresh()
+
+    # ---------- AlarmCatalogue::Refresh------------------
+    # read the file if it changed, raises an exception if it can not be read
+    def Refresh(self):
+
+        with self.Lock:
+            Now = time.time()
+            if self.ModifiedTime != None and Now - self.LastCheck < CHECK_INTERVAL:
+                return
+            self.LastCheck = Now
+            ModifiedTime = os.path.getmtime(self.FileName)
+            if ModifiedTime == self.ModifiedTime:
+                return
+            self.Alarms = self.ReadFile()
+            self.Codes = sorted(self.Alarms.keys())
+            self.ModifiedTime = ModifiedTime
+            self.Loads += 1
+
+    # ---------- AlarmCatalogue::ReadFile------------------
+    def ReadFile(self):
+
+        Alarms = {}
+        with open(self.FileName,"r") as AlarmFile:     #opens file
+            for line in AlarmFile:
+                line = line.strip()                   # remove newline at beginning / end and trailing whitespace
+                if not len(line):
+                    continue
+                if line[0] == "#":              # comment?
+                    continue
+                Items = line.split("!")
+                if len(Items) != 5:
+                    continue
+                try:
+                    Code = int(Items[0])
+                except ValueError:
+                    continue
+                if not Code in Alarms:          # the first entry of a code is used
+                    Alarms[Code] = AlarmEntry(Code, Items[1], Items[2], Items[3], Items[4])
+        return Alarms
+
+    # ---------- AlarmCatalogue::Get------------------
+    # return the AlarmEntry of a code (int), None if not found
+    def Get(self, Code):
+
+        self.Refresh()
+        return self.Alarms.get(Code, None)
+
+    # ---------- AlarmCatalogue::GetRange------------------
+    # return the AlarmEntry of each code from First to Last (inclusive) in the file, in code order
+    def GetRange(self, First, Last):
+
+        self.Refresh()
+        Alarms, Codes = self.Alarms, self.Codes
+        Start = bisect.bisect_left(Codes, First)
+        End = bisect.bisect_right(Codes, Last)
+        return [Alarms[Code] for Code in Codes[Start:End]]
+
+    # ---------- AlarmCatalogue::GetFamily------------------
+    # return the AlarmEntry of each code of a family (see ALARM_FAMILIES) in the file
+    def GetFamily(self, Family):
+
+        Entries = []
+        for First, Last in ALARM_FAMILIES.get(Family, []):
+            Entries.extend(self.GetRange(First, Last))
+        return Entries
+
+    # ---------- AlarmCatalogue::GetStats------------------
+    # return a list of (name, value)
+    def GetStats(self):
+
+        return [("Alarm Catalogue", "%d codes, loaded %d times" % (len(self.Alarms), self.Loads))]
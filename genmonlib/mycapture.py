@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: mycapture.py
+# PURPOSE: Capture modbus traffic to a file and replay a capture file
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, time, struct, mmap, threading
+import mytransport
+
+# File format (little endian):
+#   File header:    magic (8 bytes), version (uint16), header size (uint16), created time (double)
+#   Records:        type (uint8), flags (uint8), frame length (uint16), timestamp (double),
+#                   latency in seconds (float), followed by the frame bytes
+# Records are appended as frames are sent and received so a capture can be read
+# (or memory mapped) while it is still being written.
+CAPTURE_MAGIC           = b"GENMCAP\0"
+CAPTURE_VERSION         = 1
+CAPTURE_FILE_HEADER     = struct.Struct("<8sHHd")
+CAPTURE_RECORD_HEADER   = struct.Struct("<BBHdf")
+
+# record types
+CAPTURE_MASTER          = 0     # frame sent by the master
+CAPTURE_SLAVE           = 1     # frame received from the slave
+CAPTURE_TIMEOUT         = 2     # no response to the last master frame, frame holds any partial data
+CAPTURE_TYPE_NAMES      = ["Master", "Slave", "Timeout"]
+
+# record flags
+CAPTURE_CRC_OK          = 0x01
+
+REPLAY_PREFIX           = "replay:"     # serial port name prefix to replay a capture file
+
+#------------ CaptureWriter class --------------------------------------------
+class CaptureWriter:
+    def __init__(self, FileName):
+
+        self.FileName = FileName
+        self.Lock = threading.Lock()
+        self.Records = 0
+        self.File = open(FileName, "ab")
+        if self.File.tell() == 0:
+            self.File.write(CAPTURE_FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, CAPTURE_FILE_HEADER.size, time.time()))
+            self.File.flush()
+
+    # ---------- CaptureWriter::Write------------------
+    # append one frame, Latency is the time in seconds since the master frame was sent
+    def Write(self, Type, Frame, Latency = 0, CrcOK = True):
+
+        Frame = bytes(bytearray(Frame))
+        Flags = CAPTURE_CRC_OK if CrcOK else 0
+        with self.Lock:
+            if self.File is None:
+                return
+            self.File.write(CAPTURE_RECORD_HEADER.pack(Type, Flags, len(Frame), time.time(), Latency) + Frame)
+            self.File.flush()
+            self.Records += 1
+
+    # ---------- CaptureWriter::Close------------------
+    def Close(self):
+
+        with self.Lock:
+            if self.File is not None:
+                self.File.close()
+                self.File = None
+
+#------------ CaptureReader class --------------------------------------------
+# The capture file is memory mapped and the records are decoded as they are
+# iterated, so large captures are not read into memory
+class CaptureReader:
+    def __init__(self, FileName):
+
+        self.FileName = FileName
+        self.Map = None
+        self.Created = 0
+        self.HeaderSize = CAPTURE_FILE_HEADER.size
+
+        with open(FileName, "rb") as File:
+            Size = os.fstat(File.fileno()).st_size
+            if Size < CAPTURE_FILE_HEADER.size:
+                raise Exception("Capture file too short: " + FileName)
+            self.Map = mmap.mmap(File.fileno(), 0, access = mmap.ACCESS_READ)
+
+        Magic, Version, self.HeaderSize, self.Created = CAPTURE_FILE_HEADER.unpack_from(self.Map, 0)
+        if Magic != CAPTURE_MAGIC or Version != CAPTURE_VERSION:
+            self.Close()
+            raise Exception("Invalid capture file: " + FileName)
+
+    # ---------- CaptureReader::Records------------------
+    # generator returning (Type, Flags, Timestamp, Latency, Frame) for each record,
+    # Frame is a bytearray. A partly written last record is ignored
+    def Records(self):
+
+        Offset = self.HeaderSize
+        Size = len(self.Map)
+        while Offset + CAPTURE_RECORD_HEADER.size <= Size:
+            Type, Flags, Length, Timestamp, Latency = CAPTURE_RECORD_HEADER.unpack_from(self.Map, Offset)
+            Offset += CAPTURE_RECORD_HEADER.size
+            if Offset + Length > Size:
+                break
+            yield Type, Flags, Timestamp, Latency, bytearray(self.Map[Offset:Offset + Length])
+            Offset += Length
+
+    # ---------- CaptureReader::Close------------------
+    def Close(self):
+
+        if self.Map is not None:
+            self.Map.close()
+            self.Map = None
+
+#------------ ReplayDevice class ---------------------------------------------
+# A transport that replays a capture file. Each master frame written is
+# answered immediately with the slave frames that followed the same master frame
+# in the capture, so a captured session runs through the protocol layer at full
+# speed. Exchanges are replayed in capture order, if the master frame written is
+# not the next one in the capture the next matching exchange is used. A captured
+# timeout is replayed by sending no response.
+class ReplayDevice(mytransport.TransportDevice):
+    def __init__(self, FileName, loglocation = "/var/log/"):
+
+        self.Exchanges = []             # [Master Frame, [Slave Frames]]
+        self.Position = 0               # index of the next exchange
+        self.ReplayMismatch = 0         # master frames not found in the capture
+        self.ReplayWraps = 0            # number of times the capture was restarted
+        mytransport.TransportDevice.__init__(self, FileName, loglocation, "mycapture")
+
+    # ---------- ReplayDevice::OpenDevice------------------
+    def OpenDevice(self):
+
+        try:
+            Reader = CaptureReader(self.DeviceName)
+            try:
+                for Type, Flags, Timestamp, Latency, Frame in Reader.Records():
+                    if Type == CAPTURE_MASTER:
+                        self.Exchanges.append([bytes(Frame), []])
+                    elif Type == CAPTURE_SLAVE and len(self.Exchanges):
+                        self.Exchanges[-1][1].append(Frame)
+            finally:
+                Reader.Close()
+        except Exception as e1:
+            self.FatalError("Error opening capture file %s: " % self.DeviceName + str(e1))
+            return None
+
+        if not len(self.Exchanges):
+            self.FatalError("No master frames in capture file: %s" % self.DeviceName)
+
+    # ---------- ReplayDevice::FindExchange------------------
+    # return the next exchange for the master frame, None if not in the capture
+    def FindExchange(self, MasterFrame):
+
+        Count = len(self.Exchanges)
+        for Index in range(self.Position, self.Position + Count):
+            if Index >= Count:
+                Index -= Count
+            if self.Exchanges[Index][0] == MasterFrame:
+                if Index < self.Position:
+                    self.ReplayWraps += 1
+                self.Position = Index + 1
+                return self.Exchanges[Index]
+        return None
+
+    # ---------- ReplayDevice::ReadLoop------------------
+    # responses are added to the buffer by Write, the read thread only wakes a
+    # waiting thread when its deadline has passed
+    def ReadLoop(self):
+        while not self.IsStopSignaled():
+            time.sleep(0.05)
+            with self.BufferLock:
+                self.SignalWaiter()
+
+    # ---------- ReplayDevice::Write-----------------
+    def Write(self, data):
+
+        Exchange = self.FindExchange(bytes(bytearray(data)))
+        if Exchange is None:
+            self.ReplayMismatch += 1
+            self.LogError("Replay: master frame not in capture: " + " ".join("%02x" % x for x in bytearray(data)))
+            return len(data)
+
+        with self.BufferLock:
+            for Frame in Exchange[1]:
+                self.AddData(Frame, GapBefore = True)
+            self.SignalWaiter()
+        return len(data)
+
+    # ---------- ReplayDevice::GetTransportName------------------
+    def GetTransportName(self):
+        return "Replay " + self.DeviceName
+
+    # ---------- ReplayDevice::GetStats------------------
+    def GetStats(self):
+        return [("Replay Mismatches", "%d" % self.ReplayMismatch), ("Replay Restarts", "%d" % self.ReplayWraps)]
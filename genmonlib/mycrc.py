@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: mycrc.py
+# PURPOSE: CRC16 (modbus) calculation and frame validation
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import sys
+
+CRC16_MODBUS_POLY   = 0xA001        # reflected 0x8005
+CRC16_MODBUS_INIT   = 0xFFFF
+
+#---------- MakeTable -------------------------
+def MakeTable():
+
+    Table = []
+    for i in range(0, 256):
+        crc = i
+        for bit in range(0, 8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ CRC16_MODBUS_POLY
+            else:
+                crc >>= 1
+        Table.append(crc)
+    return Table
+
+CRC16_TABLE = MakeTable()
+
+#---------- ToByteArray -------------------------
+# accept a list of ints, str, bytes, bytearray or memoryview. Indexing the
+# result returns an int on python 2 and 3
+def ToByteArray(data):
+
+    if isinstance(data, bytearray):
+        return data
+    return bytearray(data)
+
+#---------- TableCRC16 -------------------------
+# pure python table driven CRC16/Modbus
+def TableCRC16(data):
+
+    crc = CRC16_MODBUS_INIT
+    Table = CRC16_TABLE
+    for b in ToByteArray(data):
+        crc = (crc >> 8) ^ Table[(crc ^ b) & 0xFF]
+    return crc
+
+#---------- Optional crcmod (C extension) support -------------------------
+try:
+    import crcmod.predefined
+    _crcmodfun = crcmod.predefined.mkCrcFun('modbus')
+
+    if sys.version_info[0] < 3:
+        def CrcmodCRC16(data):
+            return _crcmodfun(str(ToByteArray(data)))       # PYTHON2
+    else:
+        def CrcmodCRC16(data):
+            if isinstance(data, list):
+                data = bytearray(data)
+            return _crcmodfun(data)                         # PYTHON3, accepts any bytes like object
+
+    CRC16 = CrcmodCRC16
+    CRC_ENGINE = "crcmod"
+except Exception as e1:
+    CrcmodCRC16 = None
+    CRC16 = TableCRC16
+    CRC_ENGINE = "table"
+
+#---------- CheckFrame -------------------------
+# returns True if the last two bytes of the frame are a valid CRC (low byte
+# first) of the rest of the frame. The CRC of a frame including its own CRC
+# is always zero, so no slice of the frame is needed.
+def CheckFrame(frame):
+
+    if len(frame) < 3:
+        return False
+    return CRC16(frame) == 0
+
+#---------- CheckFrames -------------------------
+# validate a sequence of frames (i.e. from a capture file), returns a list of
+# booleans, one for each frame
+def CheckFrames(frames):
+
+    Check = CRC16
+    return [len(frame) >= 3 and Check(frame) == 0 for frame in frames]
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: myeventloop.py
+# PURPOSE: Single thread event loop for the modbus transports
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, time, select, threading, heapq, collections, fcntl, errno
+import mylog, mythread
+
+#------------ Timer class ---------------------------------------------------
+# a callback scheduled on the event loop, returned by CallLater
+class Timer:
+    def __init__(self, When, Callback, Args):
+
+        self.When = When
+        self.Callback = Callback
+        self.Args = Args
+        self.Cancelled = False
+
+    # ---------- Timer::Cancel------------------
+    def Cancel(self):
+        self.Cancelled = True
+
+#------------ EventLoop class -----------------------------------------------
+# One thread waits (select) on the file descriptors of several transports and
+# runs timers, so any number of transports (units, TCP converters) share one
+# thread instead of a read thread and a bus thread each. Callbacks run on the
+# loop thread and must not block, in particular they must not wait for a
+# modbus transaction. Other threads hand work to the loop with CallSoon, the
+# loop is woken by writing to a pipe. A timer runs when it is due, not on the
+# next read timeout, so response timeouts are exact.
+class EventLoop:
+    def __init__(self, Name = "ModbusEventLoop", loglocation = "/var/log/"):
+
+        self.Name = Name
+        self.Readers = {}                   # fd : callback
+        self.Writers = {}                   # fd : callback
+        self.Timers = []                    # heap of [When, Sequence, Timer]
+        self.Sequence = 0                   # keeps first in first out order of timers due at the same time
+        self.Pending = collections.deque()  # (Callback, Args) from CallSoon
+        self.Lock = threading.Lock()
+        self.WakeRead, self.WakeWrite = os.pipe()
+        for fd in [self.WakeRead, self.WakeWrite]:
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.Thread = None
+        self.ThreadObj = None               # threading.Thread object of the loop thread
+        # stats
+        self.Wakeups = 0
+        self.CallbackErrors = 0
+        self.TimersRun = 0
+        self.TotalLateness = 0.0            # seconds timers ran after they were due
+        self.MaxLateness = 0.0
+
+        # log errors in this module to a file
+        self.log = mylog.SetupLogger("myeventloop", loglocation + "myeventloop.log")
+
+    # ---------- EventLoop::Start------------------
+    def Start(self):
+
+        self.Thread = mythread.MyThread(self.Run, Name = self.Name)
+        return self.Thread
+
+    # ---------- EventLoop::Stop------------------
+    def Stop(self):
+
+        if self.Thread != None and self.Thread.IsAlive():
+            self.Thread.Stop()
+            self.Wake()
+            if not self.IsLoopThread():
+                self.Thread.WaitForThreadToEnd(5)
+
+    # ---------- EventLoop::IsLoopThread------------------
+    def IsLoopThread(self):
+
+        return threading.current_thread() is self.ThreadObj
+
+    # ---------- EventLoop::IsStopSignaled------------------
+    def IsStopSignaled(self):
+
+        if self.Thread == None:
+            return False        # the thread may start before Start returns
+        return self.Thread.StopSignaled()
+
+    # ---------- EventLoop::IsRunning------------------
+    def IsRunning(self):
+
+        return self.Thread != None and self.Thread.IsAlive() and not self.Thread.StopSignaled()
+
+    # ---------- EventLoop::Wake------------------
+    # wake the loop from select so it sees new timers, readers and callbacks
+    def Wake(self):
+
+        if self.IsLoopThread():
+            return
+        try:
+            os.write(self.WakeWrite, b"x")
+        except OSError as e1:
+            if e1.errno != errno.EAGAIN:        # the pipe is full, the loop will wake anyway
+                raise
+
+    # ---------- EventLoop::CallSoon------------------
+    # run Callback(*Args) on the loop thread, may be called from any thread
+    def CallSoon(self, Callback, *Args):
+
+        with self.Lock:
+            self.Pending.append((Callback, Args))
+        self.Wake()
+
+    # ---------- EventLoop::CallLater------------------
+    # run Callback(*Args) on the loop thread after Delay seconds, returns a Timer
+    def CallLater(self, Delay, Callback, *Args):
+
+        NewTimer = Timer(time.time() + max(0, Delay), Callback, Args)
+        with self.Lock:
+            heapq.heappush(self.Timers, [NewTimer.When, self.Sequence, NewTimer])
+            self.Sequence += 1
+        self.Wake()
+        return NewTimer
+
+    # ---------- EventLoop::RunInLoop------------------
+    # run Callback(*Args) on the loop thread and wait for it to finish, returns
+    # its return value. Runs it now if called on the loop thread or the loop is not running
+    def RunInLoop(self, Callback, *Args):
+
+        if self.IsLoopThread() or not self.IsRunning():
+            return Callback(*Args)
+        Result = []
+        Done = threading.Event()
+        def RunCallback():
+            try:
+                Result.append(Callback(*Args))
+            finally:
+                Done.set()
+        self.CallSoon(RunCallback)
+        Done.wait()
+        return Result[0] if len(Result) else None
+
+    # ---------- EventLoop::AddReader------------------
+    # call Callback() on the loop thread when fd has data to read
+    def AddReader(self, fd, Callback):
+
+        with self.Lock:
+            self.Readers[fd] = Callback
+        self.Wake()
+
+    # ---------- EventLoop::RemoveReader------------------
+    def RemoveReader(self, fd):
+
+        with self.Lock:
+            self.Readers.pop(fd, None)
+        self.Wake()
+
+    # ---------- EventLoop::AddWriter------------------
+    # call Callback() on the loop thread when fd can be written (i.e. a connect completed)
+    def AddWriter(self, fd, Callback):
+
+        with self.Lock:
+            self.Writers[fd] = Callback
+        self.Wake()
+
+    # ---------- EventLoop::RemoveWriter------------------
+    def RemoveWriter(self, fd):
+
+        with self.Lock:
+            self.Writers.pop(fd, None)
+        self.Wake()
+
+    # ---------- EventLoop::Run------------------
+    def Run(self):
+
+        self.ThreadObj = threading.current_thread()
+        while not self.IsStopSignaled():
+            with self.Lock:
+                Readers = list(self.Readers.keys()) + [self.WakeRead]
+                Writers = list(self.Writers.keys())
+                Timeout = None
+                if len(self.Pending):
+                    Timeout = 0
+                elif len(self.Timers):
+                    Timeout = max(0, self.Timers[0][0] - time.time())
+            try:
+                Readable, Writable, Error = select.select(Readers, Writers, [], Timeout)
+            except (select.error, OSError, ValueError) as e1:
+                # a descriptor was closed after the lists were made, it is not in the lists next time
+                self.LogError("Error in EventLoop:select: " + str(e1))
+                time.sleep(0.01)
+                continue
+            self.Wakeups += 1
+
+            if self.WakeRead in Readable:
+                try:
+                    while len(os.read(self.WakeRead, 512)):
+                        pass
+                except OSError:
+                    pass
+            for fd in Readable:
+                self.RunCallback(self.Readers.get(fd, None))
+            for fd in Writable:
+                self.RunCallback(self.Writers.get(fd, None))
+            self.RunTimers()
+            while True:
+                with self.Lock:
+                    if not len(self.Pending):
+                        break
+                    Callback, Args = self.Pending.popleft()
+                self.RunCallback(Callback, Args)
+
+    # ---------- EventLoop::RunTimers------------------
+    # run the timers that are due
+    def RunTimers(self):
+
+        while True:
+            with self.Lock:
+                if not len(self.Timers) or self.Timers[0][0] > time.time():
+                    return
+                When, Sequence, DueTimer = heapq.heappop(self.Timers)
+            if DueTimer.Cancelled:
+                continue
+            Lateness = time.time() - When
+            self.TimersRun += 1
+            self.TotalLateness += Lateness
+            self.MaxLateness = max(self.MaxLateness, Lateness)
+            self.RunCallback(DueTimer.Callback, DueTimer.Args)
+
+    # ---------- EventLoop::RunCallback------------------
+    # an error in one callback does not stop the loop
+    def RunCallback(self, Callback, Args = ()):
+
+        if Callback == None:
+            return
+        try:
+            Callback(*Args)
+        except Exception as e1:
+            self.CallbackErrors += 1
+            self.LogError("Error in EventLoop callback %s: " % getattr(Callback, "__name__", "") + str(e1))
+
+    # ---------- EventLoop::GetStats------------------
+    # return a list of (name, value)
+    def GetStats(self):
+
+        Stats = []
+        Stats.append(("Event Loop", "%d descriptors, %d timers, %d wakeups" % (len(self.Readers) + len(self.Writers), len(self.Timers), self.Wakeups)))
+        if self.TimersRun:
+            Stats.append(("Event Loop Timer Lateness", "Avg %.4f sec, Max %.4f sec" % (self.TotalLateness / self.TimersRun, self.MaxLateness)))
+        if self.CallbackErrors:
+            Stats.append(("Event Loop Callback Errors", "%d" % self.CallbackErrors))
+        return Stats
+
+    #---------------------EventLoop::LogError------------------------
+    def LogError(self, Message):
+        self.log.error(Message)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: myevents.py
+# PURPOSE: Register change events
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import time, threading, collections
+
+MAX_QUEUED_EVENTS   = 1000      # events kept for a consumer thread that has not caught up
+
+#------------ RegisterEvent class -------------------------------------------
+# a register value changed. Old is "" the first time a register is read,
+# values are hex strings
+class RegisterEvent:
+    def __init__(self, Register, Old, New, Time):
+
+        self.Register = Register
+        self.Old = Old
+        self.New = New
+        self.Time = Time
+
+#------------ Subscription class --------------------------------------------
+# Callback(Event) is called for changes of the registers in Registers (hex
+# strings) or, if Registers is None, for the changes Predicate(Event) returns
+# True for (all changes if Predicate is None as well)
+class Subscription:
+    def __init__(self, Callback, Registers = None, Predicate = None):
+
+        self.Callback = Callback
+        self.Registers = Registers
+        self.Predicate = Predicate
+
+#------------ EventBus class ------------------------------------------------
+# UpdateRegisterList publishes the changes of the register values, the
+# callbacks run on the thread that read the registers (the poll thread or the
+# event loop) so they must not block. Consumer threads use an EventQueue.
+# The subscription lists are replaced, not changed, so Publish does not lock.
+class EventBus:
+    def __init__(self):
+
+        self.Lock = threading.Lock()
+        self.ByRegister = {}            # register : tuple of Subscription
+        self.ByPredicate = ()           # tuple of Subscription
+        self.Published = 0
+        self.Delivered = 0
+        self.CallbackErrors = 0
+        self.LastError = ""
+
+    # ---------- EventBus::Subscribe------------------
+    # returns the Subscription, to pass to Unsubscribe
+    def Subscribe(self, Callback, Registers = None, Predicate = None):
+
+        Sub = Subscription(Callback, Registers, Predicate)
+        with self.Lock:
+            if Registers == None:
+                self.ByPredicate = self.ByPredicate + (Sub,)
+            else:
+                for Register in Registers:
+                    self.ByRegister[Register] = self.ByRegister.get(Register, ()) + (Sub,)
+        return Sub
+
+    # ---------- EventBus::Unsubscribe------------------
+    def Unsubscribe(self, Sub):
+
+        with self.Lock:
+            if Sub.Registers == None:
+                self.ByPredicate = tuple(Item for Item in self.ByPredicate if Item is not Sub)
+            else:
+                for Register in Sub.Registers:
+                    Subs = tuple(Item for Item in self.ByRegister.get(Register, ()) if Item is not Sub)
+                    if len(Subs):
+                        self.ByRegister[Register] = Subs
+                    else:
+                        self.ByRegister.pop(Register, None)
+
+    # ---------- EventBus::Publish------------------
+    def Publish(self, Register, Old, New):
+
+        self.Published += 1
+        Subs = self.ByRegister.get(Register, ())
+        Predicates = self.ByPredicate
+        if not len(Subs) and not len(Predicates):
+            return
+        Event = RegisterEvent(Register, Old, New, time.time())
+        for Sub in Subs:
+            self.Deliver(Sub, Event)
+        for Sub in Predicates:
+            if Sub.Predicate == None or Sub.Predicate(Event):
+                self.Deliver(Sub, Event)
+
+    # ---------- EventBus::Deliver------------------
+    # an error in one callback does not stop the others or the register update
+    def Deliver(self, Sub, Event):
+
+        try:
+            Sub.Callback(Event)
+            self.Delivered += 1
+        except Exception as e1:
+            self.CallbackErrors += 1
+            self.LastError = str(e1)
+
+    # ---------- EventBus::GetStats------------------
+    # return a list of (name, value)
+    def GetStats(self):
+
+        Subs = len(self.ByPredicate) + len(set(Sub for Subs in self.ByRegister.values() for Sub in Subs))
+        Stats = [("Register Change Events", "%d published, %d delivered, %d subscribers" % (self.Published, self.Delivered, Subs))]
+        if self.CallbackErrors:
+            Stats.append(("Register Change Event Errors", "%d (%s)" % (self.CallbackErrors, self.LastError)))
+        return Stats
+
+#------------ EventQueue class ----------------------------------------------
+# Queues the events of a subscription for a consumer thread. The thread
+# blocks in Get until there is an event, Wake is called or the queue is
+# closed, so a thread waiting for changes does not wake up to poll.
+class EventQueue:
+    def __init__(self, Bus, Registers = None, Predicate = None):
+
+        self.Bus = Bus
+        self.Condition = threading.Condition(threading.Lock())
+        self.Events = collections.deque(maxlen = MAX_QUEUED_EVENTS)
+        self.Woken = False
+        self.Closed = False
+        self.Sub = Bus.Subscribe(self.Put, Registers, Predicate)
+
+    # ---------- EventQueue::Put------------------
+    def Put(self, Event):
+
+        with self.Condition:
+            self.Events.append(Event)
+            self.Condition.notify()
+
+    # ---------- EventQueue::Wake------------------
+    # make Get return even if there are no events
+    def Wake(self):
+
+        with self.Condition:
+            self.Woken = True
+            self.Condition.notify()
+
+    # ---------- EventQueue::Get------------------
+    # wait for events, returns the list of events queued (empty if woken or
+    # timed out) or None if the queue is closed
+    def Get(self, Timeout = None):
+
+        with self.Condition:
+            while not len(self.Events) and not self.Woken and not self.Closed:
+                self.Condition.wait(Timeout)
+                if Timeout != None:
+                    break
+            if self.Closed:
+                return None
+            Events = list(self.Events)
+            self.Events.clear()
+            self.Woken = False
+            return Events
+
+    # ---------- EventQueue::Close------------------
+    def Close(self):
+
+        self.Bus.Unsubscribe(self.Sub)
+        with self.Condition:
+            self.Closed = True
+            self.Condition.notify_all()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: myhistory.py
+# PURPOSE: Recent history of register values
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import time, threading
+from array import array
+
+DEFAULT_HISTORY_DEPTH   = 3600      # samples kept per register
+MAX_HISTORY_DEPTH       = 86400
+DEFAULT_HISTORY_INTERVAL = 1.0      # minimum seconds between samples of a register
+MAX_HISTORY_INTERVAL    = 3600.0
+DEFAULT_MAX_POINTS      = 300       # samples returned by a downsampled query
+
+#------------ RingBuffer class ----------------------------------------------
+# The last Depth (time, value) samples of one register in two fixed size
+# arrays, the oldest sample is overwritten when it is full.
+class RingBuffer:
+    def __init__(self, Depth):
+
+        self.Depth = Depth
+        self.Times = array('d', [0.0] * Depth)
+        self.Values = array('L', [0] * Depth)
+        self.Next = 0                       # index the next sample is written to
+        self.Count = 0                      # samples stored
+        self.LastTime = None                # time of the newest sample
+
+    # ---------- RingBuffer::Add------------------
+    def Add(self, Time, Value):
+
+        self.Times[self.Next] = Time
+        self.Values[self.Next] = Value
+        self.Next = (self.Next + 1) % self.Depth
+        if self.Count < self.Depth:
+            self.Count += 1
+        self.LastTime = Time
+
+    # ---------- RingBuffer::GetOldest------------------
+    # time of the oldest sample, None if there are none
+    def GetOldest(self):
+
+        if not self.Count:
+            return None
+        return self.Times[(self.Next - self.Count) % self.Depth]
+
+    # ---------- RingBuffer::GetRange------------------
+    # return the (time, value) samples from Start to End (times), oldest first
+    def GetRange(self, Start, End):
+
+        Oldest = (self.Next - self.Count) % self.Depth
+        # samples are in time order so find the first one in the range by bisection
+        Low, High = 0, self.Count
+        while Low < High:
+            Middle = (Low + High) // 2
+            if self.Times[(Oldest + Middle) % self.Depth] < Start:
+                Low = Middle + 1
+            else:
+                High = Middle
+        Samples = []
+        for Offset in range(Low, self.Count):
+            Index = (Oldest + Offset) % self.Depth
+            if self.Times[Index] > End:
+                break
+            Samples.append((self.Times[Index], self.Values[Index]))
+        return Samples
+
+    # ---------- RingBuffer::GetMemory------------------
+    # bytes used by the arrays
+    def GetMemory(self):
+
+        return self.Depth * (self.Times.itemsize + self.Values.itemsize)
+
+#------------ RegisterHistory class -----------------------------------------
+# A RingBuffer for each register recorded, added the first time the register
+# is read. A value is stored only if Interval seconds have passed since the
+# last sample of the register, the prime registers are read several times a
+# second, so a full buffer covers Depth times Interval seconds (one hour at
+# the defaults) however often the register is read. The number of registers
+# is limited to the base and prime registers so the memory used is at most the
+# number of registers times the depth times 16 bytes (about 4 MB for 75
+# registers at the default depth).
+class RegisterHistory:
+    def __init__(self, Depth = DEFAULT_HISTORY_DEPTH, Interval = DEFAULT_HISTORY_INTERVAL):
+
+        self.Depth = Depth
+        self.Interval = Interval
+        self.Buffers = {}                   # register (hex string) : RingBuffer
+        self.Lock = threading.Lock()
+
+    # ---------- RegisterHistory::Add------------------
+    def Add(self, Register, Value, Time = None):
+
+        if Time == None:
+            Time = time.time()
+        with self.Lock:
+            Buffer = self.Buffers.get(Register, None)
+            if Buffer == None:
+                Buffer = RingBuffer(self.Depth)
+                self.Buffers[Register] = Buffer
+            elif Buffer.LastTime != None and Time - Buffer.LastTime < self.Interval:
+                return
+            Buffer.Add(Time, Value)
+
+    # ---------- RegisterHistory::GetRange------------------
+    # return the samples of the last Minutes, oldest first
+    def GetRange(self, Register, Minutes):
+
+        End = time.time()
+        with self.Lock:
+            Buffer = self.Buffers.get(Register, None)
+            if Buffer == None:
+                return []
+            return Buffer.GetRange(End - (Minutes * 60), End)
+
+    # ---------- RegisterHistory::GetOldest------------------
+    # time of the oldest sample of a register, None if there are none
+    def GetOldest(self, Register):
+
+        with self.Lock:
+            Buffer = self.Buffers.get(Register, None)
+            if Buffer == None:
+                return None
+            return Buffer.GetOldest()
+
+    # ---------- RegisterHistory::GetSummary------------------
+    # return the minimum, maximum and average value of Samples, None if there are none
+    def GetSummary(self, Samples):
+
+        if not len(Samples):
+            return None
+        Values = [Value for Time, Value in Samples]
+        return min(Values), max(Values), float(sum(Values)) / len(Values)
+
+    # ---------- RegisterHistory::Downsample------------------
+    # reduce Samples to at most MaxPoints by splitting the time range into
+    # equal intervals, returns (time, minimum, maximum, average) of each
+    # interval that has samples
+    def Downsample(self, Samples, MaxPoints = DEFAULT_MAX_POINTS):
+
+        if not len(Samples):
+            return []
+        if len(Samples) <= MaxPoints:
+            return [(Time, Value, Value, float(Value)) for Time, Value in Samples]
+        Start = Samples[0][0]
+        Interval = (Samples[-1][0] - Start) / MaxPoints
+        Points = []
+        Bucket = []
+        BucketEnd = Start + Interval
+        for Sample in Samples:
+            while Sample[0] > BucketEnd and len(Points) < MaxPoints - 1:
+                if len(Bucket):
+                    Points.append((Bucket[0][0],) + self.GetSummary(Bucket))
+                    Bucket = []
+                BucketEnd += Interval
+            Bucket.append(Sample)
+        if len(Bucket):
+            Points.append((Bucket[0][0],) + self.GetSummary(Bucket))
+        return Points
+
+    # ---------- RegisterHistory::GetStats------------------
+    # return a list of (name, value)
+    def GetStats(self):
+
+        with self.Lock:
+            Samples = sum(Buffer.Count for Buffer in self.Buffers.values())
+            Memory = sum(Buffer.GetMemory() for Buffer in self.Buffers.values())
+            Registers = len(self.Buffers)
+        return [("Register History", "%d registers, %d samples, %d KB, %g sec interval, %d min span" % (Registers, Samples,
+            Memory // 1024, self.Interval, (self.Depth * self.Interval) // 60))]
@@ -11,8 +11,8 @@
 
 from __future__ import print_function       # For python 3.x compatibility with print function
 
-import datetime, threading, crcmod, sys, time
-import mylog, mythread, myserial
+import datetime, threading, sys, time, binascii, heapq
+import mylog, mythread, myserial, mytcp, mycrc, mycapture
 
 #--------------------- MODBUS specific Const defines for Generator class
 MBUS_ADDRESS            = 0x00
@@ -30,94 +30,324 @@ MIN_PACKET_LENGTH_RES   = 0x07
 MIN_PACKET_LENGTH_WR_RES= 0x08
 MBUS_CMD_READ_REGS      = 0x03
 MBUS_CMD_WRITE_REGS     = 0x10
+MBUS_EXCEPTION_FLAG     = 0x80      # set in the function code of an exception response
+MBUS_EXCEPTION_LENGTH   = 0x05      # address, function, exception code, CRC
+
+#--------------------- Transaction results
+RESULT_OK               = 0
+RESULT_ERROR            = 1         # CRC error or invalid response
+RESULT_TIMEOUT          = 2         # no response
+RESULT_EXCEPTION        = 3         # exception response, i.e. the register is not supported
+RESULT_CANCELLED        = 4         # cancelled (or the wait timed out) before it completed
+
+#--------------------- Timeouts and retries
+MBUS_CHAR_BITS          = 11        # bits per character on the wire (start, 8 data, parity or 2nd stop, stop)
+MBUS_FRAME_GAP_CHARS    = 3.5       # silent interval between frames in characters
+DEFAULT_TIMEOUT_SLACK   = 1.0       # seconds added to the wire time for the controller to respond
+DEFAULT_RETRIES         = 2         # retries of a failed read
+RETRY_BACKOFF_MIN       = 0.05      # seconds before the first retry, doubled for each retry
+RETRY_BACKOFF_MAX       = 0.5       # max seconds between retries
+DEMOTE_FAILURES         = 3         # consecutive timeouts (or exception responses) before a read is demoted
+DEMOTE_TIME_MIN         = 300       # seconds a read is demoted the first time, doubled each time it fails again
+DEMOTE_TIME_MAX         = 3600 * 6  # max seconds a read is demoted
+
+#--------------------- Transports
+TRANSPORT_SERIAL        = "serial"  # serial port (or replay of a capture file)
+TRANSPORT_TCP           = "tcp"     # modbus RTU over TCP to a serial to ethernet converter
+TRANSPORTS              = [TRANSPORT_SERIAL, TRANSPORT_TCP]
+
+#--------------------- Engines
+ENGINE_THREAD           = "thread"      # a read thread and a bus thread for each transport
+ENGINE_EVENTLOOP        = "eventloop"   # all transports serviced by one event loop thread
+ENGINES                 = [ENGINE_THREAD, ENGINE_EVENTLOOP]
+
+#--------------------- Transaction priorities, lower values are sent first
+PRIORITY_CONTROL        = 0     # writes (remote start/stop, set time, exercise time)
+PRIORITY_PRIME          = 1     # status and alarm registers, interactive reads
+PRIORITY_BASE           = 2     # base registers
+PRIORITY_LOG            = 3     # log registers
+PRIORITY_DEBUG          = 4     # register scan
+PRIORITY_NAMES          = ["Control", "Prime", "Base", "Log", "Debug"]
+
+#------------ ModbusTransaction class -----------------------------------------
+# a queued request for the bus thread (or event loop) and its result. Callers
+# may block on Wait, or add a callback that is called when it completes
+class ModbusTransaction:
+    def __init__(self, MasterPacket, skiplog = False, ReturnValue = False, Priority = PRIORITY_BASE, Timeout = None, Retries = None):
+
+        self.MasterPacket = MasterPacket
+        self.SkipLog = skiplog
+        self.ReturnValue = ReturnValue
+        self.Priority = Priority
+        self.Retries = Retries                          # None for the default number of retries
+        self.QueuedTime = time.time()
+        if Timeout is None:
+            self.Deadline = None                        # no deadline
+        else:
+            self.Deadline = self.QueuedTime + Timeout   # not sent if not started by this time
+        self.Result = False
+        self.ResultCode = None                          # RESULT_OK ... of the last attempt, None if not sent
+        self.Event = threading.Event()
+        self.Lock = threading.Lock()
+        self.Callbacks = []                             # called with the transaction when it completes
+        self.Attempt = 0                                # attempts sent, used by the event loop engine
+
+    # ---------- ModbusTransaction::Complete------------------
+    # returns False if it was already complete (i.e. cancelled)
+    def Complete(self, Result, ResultCode = None):
+
+        with self.Lock:
+            if self.Event.is_set():
+                return False
+            self.Result = Result
+            self.ResultCode = ResultCode
+            self.Event.set()
+            Callbacks = self.Callbacks
+            self.Callbacks = []
+        for Callback in Callbacks:
+            Callback(self)
+        return True
+
+    # ---------- ModbusTransaction::Done------------------
+    def Done(self):
+        return self.Event.is_set()
+
+    # ---------- ModbusTransaction::Cancel------------------
+    # complete the transaction with RESULT_CANCELLED. It is not sent if it is
+    # still queued, if it is on the bus the response is not returned
+    def Cancel(self):
+        return self.Complete(False, RESULT_CANCELLED)
+
+    # ---------- ModbusTransaction::AddDoneCallback------------------
+    # call Callback(Transaction) when complete, on the thread that completes it
+    # (the bus thread or the event loop), now if it is already complete
+    def AddDoneCallback(self, Callback):
+
+        with self.Lock:
+            if not self.Event.is_set():
+                self.Callbacks.append(Callback)
+                return
+        Callback(self)
+
+    # ---------- ModbusTransaction::Wait------------------
+    # block until the transaction is complete and return the result. The bus
+    # thread completes every transaction (or fails it if it exits) so no timeout
+    # is needed here. If Timeout (seconds) is given the transaction is
+    # cancelled if not complete by then. Note a timed wait polls on python 2
+    def Wait(self, Timeout = None):
+
+        if Timeout is None:
+            self.Event.wait()
+        elif not self.Event.wait(Timeout):
+            self.Cancel()
+        return self.Result
 
 #------------ ModbusProtocol class --------------------------------------------
 class ModbusProtocol:
-    def __init__(self, updatecallback, address = 0x9d, name = "/dev/serial", rate=9600, loglocation = "/var/log/"):
+    def __init__(self, updatecallback, address = 0x9d, name = "/dev/serial", rate=9600, loglocation = "/var/log/", capturefile = None,
+        transport = TRANSPORT_SERIAL, tcpaddress = None, tcpport = mytcp.DEFAULT_TCP_PORT, slack = DEFAULT_TIMEOUT_SLACK, retries = DEFAULT_RETRIES,
+        eventloop = None):
 
         self.Address = address
+        self.CharTime = float(MBUS_CHAR_BITS) / rate  # seconds to send one character
+        self.TimeoutSlack = slack                   # seconds added to the wire time of a transaction
+        self.Retries = retries                      # retries of a failed read
+        self.RetryCount = 0                         # stats, reads sent again after a failure
+        self.Failures = {}                          # (Register, Length) : [consecutive failures, demote seconds, demoted until time.time()]
+        self.DemotedSkips = 0                       # stats, reads not sent as they are demoted
+        self.ExceptionResponses = 0                 # stats
+        self.LastResult = RESULT_OK                 # result of the last transaction, or reason the last response was not valid
+        self.RejectedWrites = set()                 # (Register, Length) of combined writes the controller answered with an exception
+        self.CombinedWrites = 0                     # stats, write frames saved by combining contiguous writes
+        self.WriteVerifyFailures = 0                # stats, writes that did not read back as written
+        self.WriteRollbacks = 0                     # stats, write transactions that were rolled back
         self.Threads = {}                           # Dict of mythread objects
         self.DeviceInit = False
         self.CommAccessLock = threading.RLock()     # lock to synchronize access to the serial port comms
         self.UpdateRegisterList = updatecallback
+        # transaction queue, all transactions are sent by the bus thread in priority order
+        self.QueueCondition = threading.Condition()
+        self.TransactionQueue = []                  # heap of [Priority, Sequence, ModbusTransaction]
+        self.QueueSequence = 0                      # keeps first in first out order within a priority
+        self.BusThread = None
+        self.BusThreadObj = None                    # threading.Thread object of the bus thread
+        self.BusRunning = False
+        self.MaxQueueDepth = 0
+        self.ExpiredTransactions = 0                # transactions not sent before their deadline
+        self.QueueStats = [[0, 0.0, 0.0] for Priority in PRIORITY_NAMES]  # Count, Total Wait, Max Wait
+        self.Capture = None                         # mycapture.CaptureWriter if capturing bus traffic
+        self.MasterSentTime = 0                     # time.time() the last master packet was sent
+        self.Loop = None                            # myeventloop.EventLoop if the event loop engine is used
+        self.Current = None                         # transaction on the bus (event loop engine)
+        self.ResponseLength = 0                     # expected length of the response to the current transaction
+        self.ResponseTimer = None                   # event loop timer of the response timeout
+        self.SentTime = None                        # datetime the current request was sent (event loop engine)
         # log errors in this module to a file
         self.log = mylog.SetupLogger("mymodbus", loglocation + "mymodbus.log")
 
         try:
             #Starting serial connection
-            self.Slave = myserial.SerialDevice(name, rate, loglocation)
+            if transport == TRANSPORT_TCP:
+                self.Slave = mytcp.TcpDevice(tcpaddress, tcpport, loglocation)
+            elif name.startswith(mycapture.REPLAY_PREFIX):
+                self.Slave = mycapture.ReplayDevice(name[len(mycapture.REPLAY_PREFIX):], loglocation)
+            else:
+                self.Slave = myserial.SerialDevice(name, rate, loglocation)
+            self.Slave.SetFrameGap(self.CharTime, MBUS_FRAME_GAP_CHARS * self.CharTime)
             self.DeviceInit = True
 
         except Exception as e1:
-            self.FatalError("Error opening serial device: " + str(e1))
+            self.FatalError("Error opening transport: " + str(e1))
             return None
 
-        try:
-            # CRCMOD library, used for CRC calculations
-            self.ModbusCrc = crcmod.predefined.mkCrcFun('modbus')
-        except Exception as e1:
-            self.FatalError("Unable to find crcmod package: " + str(e1))
+        if capturefile != None and len(capturefile):
+            try:
+                self.Capture = mycapture.CaptureWriter(capturefile)
+            except Exception as e1:
+                self.LogError("Error opening capture file %s: " % capturefile + str(e1))
+
+        if eventloop != None:
+            if self.Slave.GetFileno() == None and transport != TRANSPORT_TCP:
+                self.LogError("Transport %s does not support the event loop, using threads" % self.Slave.GetTransportName())
+            else:
+                self.Loop = eventloop
+                self.Slave.AttachLoop(eventloop, self.LoopData)
 
     # ---------- ModbusProtocol::GetPacketFromSlave------------------
     #  This function returns two values, the first is boolean. The seconds is
     #  a packet (list). If the return value is True and an empty packet, then
     #  keep looking because the data has not arrived yet, if return is False there
-    #  is and error. If True and a non empty packet then it is valid data
-    def GetPacketFromSlave(self):
+    #  is and error. If True and a non empty packet then it is valid data.
+    #  LastResult is set to the reason for an error. ResponseLength is the length
+    #  of the expected response, if known
+    #
+    #  Data that is not a valid frame (noise, a partial or corrupted frame) does
+    #  not flush the buffer, the buffer is searched for the next valid frame
+    #  (address, function, length and CRC) and only the bytes before it are
+    #  discarded. Positions received after a silent interval are tried first.
+    def GetPacketFromSlave(self, ResponseLength = None):
 
-        LocalErrorCount = 0
-        Packet = []
         EmptyPacket = []    # empty packet
 
-        if len(self.Slave.Buffer) < MIN_PACKET_LENGTH_RES:
-            return True, EmptyPacket
-
-        if len(self.Slave.Buffer) >= MIN_PACKET_LENGTH_RES:
-            if self.Slave.Buffer[MBUS_ADDRESS] == self.Address and self.Slave.Buffer[MBUS_COMMAND] in [MBUS_CMD_READ_REGS]:
-                # it must be a read command response
-                length = self.Slave.Buffer[MBUS_RESPONSE_LEN]   # our packet tells us the length of the payload
-                # if the full length of the packet has not arrived, return and try again
-                if (length + MBUS_RES_PAYLOAD_SIZE_MINUS_LENGTH) > len(self.Slave.Buffer):
-                    return True, EmptyPacket
-
-                for i in range(0, length + MBUS_RES_PAYLOAD_SIZE_MINUS_LENGTH):
-                    Packet.append(self.Slave.Buffer.pop(0))  # pop Address, Function, Length, message and CRC
+        # hold the buffer lock so the read thread can not add data while we parse
+        with self.Slave.BufferLock:
+            while True:
+                Length = self.GetFrameLength(0)
+                Complete = Length > 0 and Length <= len(self.Slave.Buffer)
+                # a frame of another length is not the response to this request
+                Expected = ResponseLength in [None, Length] or Length == MBUS_EXCEPTION_LENGTH
+                if Complete and Expected and self.IsValidFrame(0, Length):
+                    Packet = self.Slave.GetPacket(Length)
+                    break
 
-                if self.CheckCRC(Packet):
-                    self.Slave.RxPacketCount += 1
-                    return True, Packet
+                if Length >= 0 and not Complete:
+                    if Length == 0:
+                        return True, EmptyPacket
+                    # the frame has not all arrived, it is replaced by a complete frame that
+                    # started after it, only look after silent intervals if it has the expected length
+                    Offset, Found = self.FindFrame(GapsOnly = Expected)
+                    if not Found:
+                        return True, EmptyPacket
                 else:
-                    self.Slave.CrcError += 1
-                    return False, EmptyPacket
-            elif self.Slave.Buffer[MBUS_ADDRESS] == self.Address and self.Slave.Buffer[MBUS_COMMAND] in [MBUS_CMD_WRITE_REGS]:
-                # it must be a write command response
-                if len(self.Slave.Buffer) < MIN_PACKET_LENGTH_WR_RES:
-                    return True, EmptyPacket
-                for i in range(0, MIN_PACKET_LENGTH_WR_RES):
-                    Packet.append(self.Slave.Buffer.pop(0))    # address, function, address hi, address low, quantity hi, quantity low, CRC high, crc low
+                    Offset, Found = self.FindFrame()
 
-                if self.CheckCRC(Packet):
-                    self.Slave.RxPacketCount += 1
-                    return True,Packet
-                else:
+                if Complete and Expected and not Found:
+                    # CRC error, the frame is dropped and the rest of the buffer is kept
+                    Packet = self.Slave.GetPacket(Length)
+                    self.CaptureFrame(mycapture.CAPTURE_SLAVE, Packet, False)
+                    self.CheckCRC(Packet)       # log the error
                     self.Slave.CrcError += 1
+                    self.LastResult = RESULT_ERROR
                     return False, EmptyPacket
-            else:
-                self.DiscardByte()
-                self.Flush()
-                return False, EmptyPacket
 
-        return True, EmptyPacket   # technically not a CRC error, we really should never get here
-
-
-    # ---------- GeneratorDevice::DiscardByte------------------
-    def DiscardByte(self):
+                if not Offset:
+                    # nothing in the buffer can be the start of a frame
+                    self.LogError("Discarding %d bytes slave: %s" % (len(self.Slave.Buffer), self.GetBufferString(len(self.Slave.Buffer))))
+                    self.Slave.DiscardBytes(len(self.Slave.Buffer))
+                    return True, EmptyPacket
 
-        discard = self.Slave.DiscardByte()
-        self.LogError("Discarding byte slave: %02x" % (discard))
+                self.LogError("Resync, discarding %d bytes slave: %s" % (Offset, self.GetBufferString(Offset)))
+                self.Slave.DiscardBytes(Offset)
+                self.Slave.Resyncs += 1
+
+        self.CaptureFrame(mycapture.CAPTURE_SLAVE, Packet, True)
+        self.Slave.RxPacketCount += 1
+        self.Slave.LastRxPacketTime = time.time()
+        if Packet[MBUS_COMMAND] & MBUS_EXCEPTION_FLAG:
+            self.ExceptionResponses += 1
+            self.LastResult = RESULT_EXCEPTION
+            self.LogError("Exception response: function %02x, exception code %02x" % (Packet[MBUS_COMMAND], Packet[2]))
+            return False, EmptyPacket
+        return True, Packet
+
+    # ---------- ModbusProtocol::GetFrameLength------------------
+    # return the length of the response frame at Offset in the receive buffer,
+    # -1 if a response can not start there, 0 if not enough has arrived to tell.
+    # The frame may not have all arrived. Call with the buffer lock held
+    def GetFrameLength(self, Offset):
+
+        Available = len(self.Slave.Buffer) - Offset
+        if Available < 1:
+            return 0
+        if self.Slave.Buffer[Offset + MBUS_ADDRESS] != self.Address:
+            return -1
+        if Available < 2:
+            return 0
+        Command = self.Slave.Buffer[Offset + MBUS_COMMAND]
+        if Command & MBUS_EXCEPTION_FLAG:
+            if (Command & ~MBUS_EXCEPTION_FLAG) in [MBUS_CMD_READ_REGS, MBUS_CMD_WRITE_REGS]:
+                return MBUS_EXCEPTION_LENGTH        # address, function, exception code, CRC
+            return -1
+        if Command == MBUS_CMD_READ_REGS:
+            if Available < 3:
+                return 0
+            # address, function, length, payload and CRC
+            return self.Slave.Buffer[Offset + MBUS_RESPONSE_LEN] + MBUS_RES_PAYLOAD_SIZE_MINUS_LENGTH
+        if Command == MBUS_CMD_WRITE_REGS:
+            return MIN_PACKET_LENGTH_WR_RES         # address, function, address hi, address low, quantity hi, quantity low, CRC
+        return -1
+
+    # ---------- ModbusProtocol::IsValidFrame------------------
+    # True if the frame of Length bytes at Offset in the receive buffer has a valid CRC
+    def IsValidFrame(self, Offset, Length):
+
+        return mycrc.CheckFrame(self.Slave.Buffer.Peek(Length, Offset))
+
+    # ---------- ModbusProtocol::FindFrame------------------
+    # find the next frame in the receive buffer after the head, returns the offset
+    # and True for the first complete frame with a valid CRC, or if there is none
+    # the offset of the first place a frame may start (it has not all arrived) and
+    # False. Positions received after a silent interval are tried first, if
+    # GapsOnly only those are tried. The offset is zero if nothing is found. Call
+    # with the buffer lock held
+    def FindFrame(self, GapsOnly = False):
+
+        Starts = self.Slave.GetFrameStarts()
+        Offsets = Starts
+        if not GapsOnly:
+            Offsets = Starts + [Offset for Offset in range(1, len(self.Slave.Buffer)) if not Offset in Starts]
+        Partial = 0
+        for Offset in Offsets:
+            Length = self.GetFrameLength(Offset)
+            if Length < 0:
+                continue
+            if Length > 0 and Offset + Length <= len(self.Slave.Buffer):
+                if self.IsValidFrame(Offset, Length):
+                    return Offset, True
+            elif not Partial or Offset < Partial:
+                Partial = Offset
+        if GapsOnly:
+            return 0, False
+        return Partial, False
+
+    # ---------- ModbusProtocol::GetBufferString------------------
+    # the first Count bytes of the receive buffer in hex, for logging
+    def GetBufferString(self, Count):
+
+        return " ".join("%02x" % Byte for Byte in self.Slave.Buffer.Peek(min(Count, 32)))
 
     #-------------ModbusProtocol::ProcessMasterSlaveWriteTransaction--------------------
-    def ProcessMasterSlaveWriteTransaction(self, Register, Length, Data):
+    def ProcessMasterSlaveWriteTransaction(self, Register, Length, Data, Priority = PRIORITY_CONTROL, Timeout = None):
 
         MasterPacket = []
 
@@ -126,10 +356,11 @@ class ModbusProtocol:
         if len(MasterPacket) == 0:
             return
 
-        return self.ProcessOneTransaction(MasterPacket, skiplog = True)   # True to skip writing results to cached reg values
+        # True to skip writing results to cached reg values
+        return self.QueueTransaction(MasterPacket, skiplog = True, Priority = Priority, Timeout = Timeout).Wait()
 
     #-------------ModbusProtocol::ProcessMasterSlaveTransaction--------------------
-    def ProcessMasterSlaveTransaction(self, Register, Length, ReturnValue = False):
+    def ProcessMasterSlaveTransaction(self, Register, Length, ReturnValue = False, Priority = PRIORITY_BASE, Timeout = None, Retries = None):
 
         MasterPacket = []
 
@@ -139,44 +370,81 @@ class ModbusProtocol:
             return
 
         if ReturnValue:
-            return self.ProcessOneTransaction(MasterPacket, skiplog = True, ReturnValue = True)     # don't log
+            return self.QueueTransaction(MasterPacket, skiplog = True, ReturnValue = True, Priority = Priority, Timeout = Timeout, Retries = Retries).Wait()     # don't log
 
-        return self.ProcessOneTransaction(MasterPacket)
+        return self.QueueTransaction(MasterPacket, Priority = Priority, Timeout = Timeout, Retries = Retries).Wait()
 
     #------------ModbusProtocol::ProcessOneTransaction
-    def ProcessOneTransaction(self, MasterPacket, skiplog = False, ReturnValue = False):
+    # reads that fail are sent again (up to Retries times) with an increasing
+    # delay, writes are only sent once. Reads that repeatedly time out (or get
+    # an exception response) are demoted, i.e. not sent for a while, unless
+    # Demote is False. Retries overrides the number of retries if not None
+    def ProcessOneTransaction(self, MasterPacket, skiplog = False, ReturnValue = False, Demote = True, Retries = None):
+
+        if self.SkipDemoted(MasterPacket, Demote):
+            self.LastResult = RESULT_CANCELLED      # not sent, the result of the last transaction does not apply
+            return False
 
+        Retries = self.GetRetries(MasterPacket, Retries)
         with self.CommAccessLock:       # this lock should allow calls from multiple threads
+            for Attempt in range(0, Retries + 1):
+                if Attempt:
+                    self.RetryCount += 1
+                    time.sleep(self.GetRetryDelay(Attempt))
+                    # a late response to the last request must not be taken as the response to this one
+                    self.Flush()
+                SlavePacket, Result = self.SendAndReceive(MasterPacket)
+                if Result in [RESULT_OK, RESULT_EXCEPTION]:
+                    break           # an exception response will not change if the request is sent again
 
-            self.SendPacketAsMaster(MasterPacket)
+            self.UpdateResult(MasterPacket, Result)
+            if Result != RESULT_OK:
+                return False
 
-            SentTime = datetime.datetime.now()
-            while True:
-                # be kind to other processes, we know we are going to have to wait for the packet to arrive
-                # so let's sleep for a bit before we start polling
-                time.sleep(0.01)
+        return self.FinishTransaction(MasterPacket, SlavePacket, skiplog, ReturnValue)
 
-                RetVal, SlavePacket = self.GetPacketFromSlave()
+    #------------ModbusProtocol::SkipDemoted
+    # True if the master packet is a read that is demoted, it is not sent
+    def SkipDemoted(self, MasterPacket, Demote):
 
-                if RetVal == True and len(SlavePacket) != 0:    # we receive a packet
-                    self.Slave.TotalElapsedPacketeTime += (self.MillisecondsElapsed(SentTime) / 1000)
-                    break
-                if RetVal == False:
-                    self.LogError("Error Receiving slave packet for register %x%x" % (MasterPacket[2],MasterPacket[3]) )
-                    # Errors returned here are logged in GetPacketFromSlave
-                    self.Flush()
-                    return False
-                msElapsed = self.MillisecondsElapsed(SentTime)
-                # This normally takes about 30 ms however in some instances it can take up to 950ms
-                # the theory is this is either a delay due to how python does threading, or
-                # delay caused by the generator controller.
-                # each char time is about 1 millisecond so assuming a 10 byte packet transmitted
-                # and a 10 byte received with about 5 char times of silence in between should give
-                # us about 25ms
-                if msElapsed > 3000:
-                    self.Slave.ComTimoutError += 1
-                    self.LogError("Error: timeout receiving slave packet for register %x%x Buffer:%d" % (MasterPacket[2],MasterPacket[3], len(self.Slave.Buffer)) )
-                    return False
+        if Demote and MasterPacket[MBUS_COMMAND] == MBUS_CMD_READ_REGS and self.IsDemoted(self.GetReadKey(MasterPacket)):
+            self.DemotedSkips += 1
+            return True
+        return False
+
+    #------------ModbusProtocol::GetReadKey
+    # (Register, Length) of a master packet
+    def GetReadKey(self, MasterPacket):
+
+        return (MasterPacket[2] << 8 | MasterPacket[3], MasterPacket[4] << 8 | MasterPacket[5])
+
+    #------------ModbusProtocol::GetRetries
+    # writes are only sent once
+    def GetRetries(self, MasterPacket, Retries):
+
+        if MasterPacket[MBUS_COMMAND] != MBUS_CMD_READ_REGS:
+            return 0
+        if Retries is None:
+            return self.Retries
+        return Retries
+
+    #------------ModbusProtocol::GetRetryDelay
+    # seconds before a retry, Attempt is 1 for the first retry
+    def GetRetryDelay(self, Attempt):
+
+        return min(RETRY_BACKOFF_MIN * (2 ** (Attempt - 1)), RETRY_BACKOFF_MAX)
+
+    #------------ModbusProtocol::UpdateResult
+    # record the result of the last attempt of a transaction
+    def UpdateResult(self, MasterPacket, Result):
+
+        self.LastResult = Result
+        if MasterPacket[MBUS_COMMAND] == MBUS_CMD_READ_REGS:
+            self.UpdateFailures(self.GetReadKey(MasterPacket), Result in [RESULT_TIMEOUT, RESULT_EXCEPTION])
+
+    #------------ModbusProtocol::FinishTransaction
+    # the return value of a transaction that was answered
+    def FinishTransaction(self, MasterPacket, SlavePacket, skiplog, ReturnValue):
 
         # update our cached register dict
         ReturnRegValue = self.UpdateRegistersFromPacket(MasterPacket, SlavePacket, SkipUpdate = skiplog)
@@ -185,6 +453,371 @@ class ModbusProtocol:
 
         return True
 
+    #------------ModbusProtocol::SendAndReceive----------------------
+    # send one master packet and wait for the response, returns the slave packet
+    # (empty on failure) and the result (RESULT_OK ...)
+    def SendAndReceive(self, MasterPacket):
+
+        EmptyPacket = []
+        self.DiscardStaleData()
+        self.SendPacketAsMaster(MasterPacket)
+
+        SentTime = datetime.datetime.now()
+        ResponseLength = self.GetResponseLength(MasterPacket)
+        BytesNeeded = MBUS_EXCEPTION_LENGTH     # an exception response is shorter than the expected response
+        Timeout = self.GetTimeout(MasterPacket)
+        while True:
+            msElapsed = self.MillisecondsElapsed(SentTime)
+            # block until the read thread signals the full response has arrived (or timeout)
+            self.Slave.WaitForData(BytesNeeded, Timeout - (msElapsed / 1000.0))
+
+            RetVal, SlavePacket = self.GetPacketFromSlave(ResponseLength)
+
+            if RetVal == True and len(SlavePacket) != 0:    # we receive a packet
+                self.Slave.UpdatePacketTime(self.MillisecondsElapsed(SentTime) / 1000)
+                return SlavePacket, RESULT_OK
+            if RetVal == False:
+                self.LogError("Error Receiving slave packet for register %x%x" % (MasterPacket[2],MasterPacket[3]) )
+                # Errors returned here are logged in GetPacketFromSlave
+                return EmptyPacket, self.LastResult
+            msElapsed = self.MillisecondsElapsed(SentTime)
+            if msElapsed > Timeout * 1000:
+                self.ResponseTimedOut(MasterPacket)
+                return EmptyPacket, RESULT_TIMEOUT
+            # the buffer does not yet hold a full packet, wait for more data
+            BytesNeeded = max(ResponseLength, len(self.Slave.Buffer) + 1)
+
+    #------------ModbusProtocol::DiscardStaleData----------------------
+    # data received before a request is sent can not be the response to it
+    def DiscardStaleData(self):
+
+        with self.Slave.BufferLock:
+            if len(self.Slave.Buffer):
+                self.LogError("Discarding %d bytes received before request: %s" % (len(self.Slave.Buffer), self.GetBufferString(len(self.Slave.Buffer))))
+                self.Slave.DiscardBytes(len(self.Slave.Buffer))
+
+    #------------ModbusProtocol::ResponseTimedOut----------------------
+    def ResponseTimedOut(self, MasterPacket):
+
+        self.Slave.ComTimoutError += 1
+        with self.Slave.BufferLock:
+            self.CaptureFrame(mycapture.CAPTURE_TIMEOUT, self.Slave.Buffer.Peek(len(self.Slave.Buffer)))
+        self.LogError("Error: timeout receiving slave packet for register %x%x Buffer:%d" % (MasterPacket[2],MasterPacket[3], len(self.Slave.Buffer)) )
+
+    # ---------- ModbusProtocol::GetTimeout------------------
+    # seconds to wait for the response to a master packet: the time to send the
+    # request and the response at the baud rate, the silent intervals between
+    # frames, and the slack for the controller to respond. The response normally
+    # starts within about 30 ms but it has been seen to take up to 950 ms
+    def GetTimeout(self, MasterPacket):
+
+        Chars = len(MasterPacket) + self.GetResponseLength(MasterPacket) + (MBUS_FRAME_GAP_CHARS * 2)
+        return (Chars * self.CharTime) + self.TimeoutSlack
+
+    # ---------- ModbusProtocol::IsDemoted------------------
+    # True if the read (Register, Length) is demoted and not due to be tried again
+    def IsDemoted(self, Key):
+
+        Failure = self.Failures.get(Key, None)
+        return Failure != None and time.time() < Failure[2]
+
+    # ---------- ModbusProtocol::UpdateFailures------------------
+    # count consecutive failures (timeouts and exception responses) of a read,
+    # after DEMOTE_FAILURES the read is demoted. When the demotion expires the
+    # read is tried once, if it fails again it is demoted for twice as long
+    def UpdateFailures(self, Key, Failed):
+
+        if not Failed:
+            if Key in self.Failures:
+                if self.Failures[Key][2]:
+                    self.LogError("Read of register %04x (length %d) restored" % Key)
+                del self.Failures[Key]
+            return
+
+        Failure = self.Failures.setdefault(Key, [0, 0, 0])
+        Failure[0] += 1
+        if Failure[2]:
+            Failure[1] = min(Failure[1] * 2, DEMOTE_TIME_MAX)
+        elif Failure[0] >= DEMOTE_FAILURES:
+            Failure[1] = DEMOTE_TIME_MIN
+        else:
+            return
+        Failure[2] = time.time() + Failure[1]
+        self.LogError("Read of register %04x (length %d) demoted for %d sec after %d failures" % (Key[0], Key[1], Failure[1], Failure[0]))
+
+    # ---------- ModbusProtocol::GetDemotedReads------------------
+    # list of (Register, Length) of the reads that are currently demoted
+    def GetDemotedReads(self):
+
+        return sorted(Key for Key, Failure in list(self.Failures.items()) if Failure[2] and time.time() < Failure[2])
+
+    # ---------- ModbusProtocol::GetResponseLength------------------
+    # return the number of bytes expected in the slave response to a master packet
+    def GetResponseLength(self, MasterPacket):
+
+        if MasterPacket[MBUS_COMMAND] == MBUS_CMD_WRITE_REGS:
+            return MIN_PACKET_LENGTH_WR_RES
+        # address, function, byte count, payload (2 bytes per register), CRC
+        Length = (MasterPacket[4] << 8) | MasterPacket[5]
+        return MBUS_RES_PAYLOAD_SIZE_MINUS_LENGTH + (Length * 2)
+
+    # ---------- ModbusProtocol::StartBusThread------------------
+    def StartBusThread(self):
+
+        with self.QueueCondition:
+            self.BusRunning = True
+        self.BusThread = mythread.MyThread(self.BusThreadFunction, Name = "ModbusBusThread")
+        return self.BusThread
+
+    # ---------- ModbusProtocol::BusThreadFunction------------------
+    # the only thread that sends queued transactions on the bus
+    def BusThreadFunction(self):
+
+        self.BusThreadObj = threading.current_thread()
+        try:
+            while True:
+                with self.QueueCondition:
+                    while not len(self.TransactionQueue) and not self.BusStopSignaled():
+                        self.QueueCondition.wait()
+                    if self.BusStopSignaled():
+                        return
+                    Priority, Sequence, Transaction = heapq.heappop(self.TransactionQueue)
+
+                if not self.StartTransaction(Priority, Transaction):
+                    continue
+
+                try:
+                    # control and prime transactions are always sent
+                    Result = self.ProcessOneTransaction(Transaction.MasterPacket, skiplog = Transaction.SkipLog, ReturnValue = Transaction.ReturnValue,
+                        Demote = Priority >= PRIORITY_BASE, Retries = Transaction.Retries)
+                    ResultCode = self.LastResult
+                except Exception as e1:
+                    self.LogError("Error in ModbusProtocol:BusThread: " + str(e1))
+                    Result = False
+                    ResultCode = RESULT_ERROR
+                Transaction.Complete(Result, ResultCode)
+        finally:
+            with self.QueueCondition:
+                self.BusRunning = False
+            self.FailQueued()
+
+    # ---------- ModbusProtocol::StartTransaction------------------
+    # called when a transaction is taken from the queue, returns False if it
+    # is not to be sent (cancelled, or not started before its deadline)
+    def StartTransaction(self, Priority, Transaction):
+
+        if Transaction.Done():
+            return False                # cancelled
+        CurrentTime = time.time()
+        if Transaction.Deadline is not None and CurrentTime > Transaction.Deadline:
+            self.ExpiredTransactions += 1
+            Transaction.Complete(False)
+            return False
+
+        Stats = self.QueueStats[Priority]
+        Wait = CurrentTime - Transaction.QueuedTime
+        Stats[0] += 1
+        Stats[1] += Wait
+        Stats[2] = max(Stats[2], Wait)
+        return True
+
+    # ---------- ModbusProtocol::FailQueued------------------
+    # fail anything still queued, nothing else will send it
+    def FailQueued(self):
+
+        with self.QueueCondition:
+            Queued = self.TransactionQueue
+            self.TransactionQueue = []
+        for Priority, Sequence, Transaction in Queued:
+            Transaction.Complete(False)
+
+    # ---------- ModbusProtocol::BusStopSignaled------------------
+    def BusStopSignaled(self):
+
+        return self.BusThread is not None and self.BusThread.StopSignaled()
+
+    #-------------ModbusProtocol::ReadRegisters--------------------
+    # queue a read of Length registers at Register (hex string) and return the
+    # ModbusTransaction without waiting for it. The result is the value read
+    # (hex string) or False. The register cache is updated unless Update is
+    # False. Callback(Transaction) is called when it completes
+    def ReadRegisters(self, Register, Length, Priority = PRIORITY_PRIME, Timeout = None, Retries = None, Update = True, Callback = None):
+
+        MasterPacket = self.CreateMasterPacket(Register, Length)
+        return self.QueueTransaction(MasterPacket, skiplog = not Update, ReturnValue = True, Priority = Priority, Timeout = Timeout,
+            Retries = Retries, Callback = Callback)
+
+    #-------------ModbusProtocol::WriteRegisters--------------------
+    # queue a write of Data (list of bytes, two per register) at Register (hex
+    # string) and return the ModbusTransaction without waiting for it. The
+    # result is True if written. Callback(Transaction) is called when it completes
+    def WriteRegisters(self, Register, Data, Priority = PRIORITY_CONTROL, Timeout = None, Callback = None):
+
+        MasterPacket = self.CreateMasterPacket(Register, len(Data) // 2, MBUS_CMD_WRITE_REGS, Data)
+        # True to skip writing results to cached reg values
+        return self.QueueTransaction(MasterPacket, skiplog = True, Priority = Priority, Timeout = Timeout, Callback = Callback)
+
+    # ---------- ModbusProtocol::QueueTransaction------------------
+    # queue a transaction for the bus thread (or the event loop), returns the
+    # ModbusTransaction. If the bus thread is not running, or if this is called
+    # by the bus thread (i.e. from the register update callback) the transaction
+    # is sent now. With the event loop it is always queued, so code running on
+    # the loop thread must not wait for it
+    def QueueTransaction(self, MasterPacket, skiplog = False, ReturnValue = False, Priority = PRIORITY_BASE, Timeout = None, Retries = None, Callback = None):
+
+        Transaction = ModbusTransaction(MasterPacket, skiplog, ReturnValue, Priority, Timeout, Retries)
+        if Callback != None:
+            Transaction.AddDoneCallback(Callback)
+        if not len(MasterPacket):
+            Transaction.Complete(False, RESULT_ERROR)
+            return Transaction
+
+        with self.QueueCondition:
+            Queue = self.Loop != None or (self.BusRunning and threading.current_thread() is not self.BusThreadObj)
+            if Queue:
+                heapq.heappush(self.TransactionQueue, [Priority, self.QueueSequence, Transaction])
+                self.QueueSequence += 1
+                self.MaxQueueDepth = max(self.MaxQueueDepth, len(self.TransactionQueue))
+                self.QueueCondition.notify()
+        if Queue:
+            Loop = self.Loop
+            if Loop != None:
+                Loop.CallSoon(self.LoopStartNext)
+            return Transaction
+
+        Result = self.ProcessOneTransaction(MasterPacket, skiplog = skiplog, ReturnValue = ReturnValue, Demote = Priority >= PRIORITY_BASE, Retries = Retries)
+        Transaction.Complete(Result, self.LastResult)
+        return Transaction
+
+    # ---------- ModbusProtocol::GetQueueDepth------------------
+    def GetQueueDepth(self):
+
+        return len(self.TransactionQueue)
+
+    # ---------- ModbusProtocol::LoopStartNext------------------
+    # event loop engine: send the next queued transaction if the bus is idle.
+    # The transaction is a state machine driven by the loop, LoopData is called
+    # when data arrives, LoopTimeout when the response is late and retries are
+    # sent from a timer, so no thread waits on the bus
+    def LoopStartNext(self):
+
+        while self.Current == None and self.Loop != None:
+            with self.QueueCondition:
+                if not len(self.TransactionQueue):
+                    return
+                Priority, Sequence, Transaction = heapq.heappop(self.TransactionQueue)
+            if not self.StartTransaction(Priority, Transaction):
+                continue
+            # control and prime transactions are always sent
+            if self.SkipDemoted(Transaction.MasterPacket, Priority >= PRIORITY_BASE):
+                Transaction.Complete(False)
+                continue
+            Transaction.Attempt = 0
+            self.Current = Transaction
+            self.LoopSend()
+
+    # ---------- ModbusProtocol::LoopSend------------------
+    def LoopSend(self):
+
+        Transaction = self.Current
+        if Transaction == None or self.Loop == None:
+            return
+        if Transaction.Done():
+            # cancelled while waiting to be sent again
+            self.Current = None
+            self.LoopStartNext()
+            return
+        self.DiscardStaleData()
+        self.SendPacketAsMaster(Transaction.MasterPacket)
+        self.SentTime = datetime.datetime.now()
+        self.ResponseLength = self.GetResponseLength(Transaction.MasterPacket)
+        self.ResponseTimer = self.Loop.CallLater(self.GetTimeout(Transaction.MasterPacket), self.LoopTimeout)
+        # the response may already be in the buffer if the transport is fast
+        self.LoopData()
+
+    # ---------- ModbusProtocol::LoopData------------------
+    # data received, called on the loop thread
+    def LoopData(self):
+
+        if self.Current == None or self.ResponseTimer == None:
+            return      # not waiting for a response, data is discarded before the next request
+        RetVal, SlavePacket = self.GetPacketFromSlave(self.ResponseLength)
+        if RetVal == True and len(SlavePacket) != 0:    # we receive a packet
+            self.Slave.UpdatePacketTime(self.MillisecondsElapsed(self.SentTime) / 1000)
+            self.LoopAttemptDone(SlavePacket, RESULT_OK)
+        elif RetVal == False:
+            MasterPacket = self.Current.MasterPacket
+            self.LogError("Error Receiving slave packet for register %x%x" % (MasterPacket[2],MasterPacket[3]) )
+            self.LoopAttemptDone([], self.LastResult)
+
+    # ---------- ModbusProtocol::LoopTimeout------------------
+    def LoopTimeout(self):
+
+        self.ResponseTimer = None
+        if self.Current == None:
+            return
+        self.ResponseTimedOut(self.Current.MasterPacket)
+        self.LoopAttemptDone([], RESULT_TIMEOUT)
+
+    # ---------- ModbusProtocol::LoopAttemptDone------------------
+    # a response was received (or not), send the request again or complete the
+    # transaction and start the next one
+    def LoopAttemptDone(self, SlavePacket, Result):
+
+        Transaction = self.Current
+        if self.ResponseTimer != None:
+            self.ResponseTimer.Cancel()
+            self.ResponseTimer = None
+
+        if not Result in [RESULT_OK, RESULT_EXCEPTION] and not Transaction.Done():
+            if Transaction.Attempt < self.GetRetries(Transaction.MasterPacket, Transaction.Retries):
+                Transaction.Attempt += 1
+                self.RetryCount += 1
+                self.Loop.CallLater(self.GetRetryDelay(Transaction.Attempt), self.LoopSend)
+                return
+
+        self.Current = None
+        try:
+            self.UpdateResult(Transaction.MasterPacket, Result)
+            if Result == RESULT_OK:
+                Value = self.FinishTransaction(Transaction.MasterPacket, SlavePacket, Transaction.SkipLog, Transaction.ReturnValue)
+            else:
+                Value = False
+        except Exception as e1:
+            self.LogError("Error in ModbusProtocol:LoopAttemptDone: " + str(e1))
+            Value = False
+            Result = RESULT_ERROR
+        Transaction.Complete(Value, Result)
+        self.LoopStartNext()
+
+    # ---------- ModbusProtocol::LoopClose------------------
+    # stop the event loop engine, called on the loop thread
+    def LoopClose(self):
+
+        if self.ResponseTimer != None:
+            self.ResponseTimer.Cancel()
+            self.ResponseTimer = None
+        if self.Current != None:
+            self.Current.Complete(False)
+            self.Current = None
+        self.FailQueued()
+
+    # ---------- ModbusProtocol::Close------------------
+    def Close(self):
+
+        if self.BusThread is not None and self.BusThread.IsAlive():
+            self.BusThread.Stop()
+            with self.QueueCondition:
+                self.QueueCondition.notify_all()
+            self.BusThread.WaitForThreadToEnd()
+        if self.Loop != None:
+            Loop = self.Loop
+            self.Loop = None
+            Loop.RunInLoop(self.LoopClose)
+        self.Slave.Close()
+        if self.Capture != None:
+            self.Capture.Close()
+
     # ---------- GeneratorDevice::MillisecondsElapsed------------------
     def MillisecondsElapsed(self, ReferenceTime):
 
@@ -235,8 +868,25 @@ class ModbusProtocol:
     def SendPacketAsMaster(self, Packet):
 
         ByteArray = bytearray(Packet)
+        self.MasterSentTime = time.time()
         self.Slave.Write(ByteArray)
         self.Slave.TxPacketCount += 1
+        self.CaptureFrame(mycapture.CAPTURE_MASTER, ByteArray)
+
+    #-------------ModbusProtocol::CaptureFrame---------------------------------
+    # write a frame to the capture file if capturing bus traffic
+    def CaptureFrame(self, Type, Packet, CrcOK = True):
+
+        if self.Capture == None:
+            return
+        try:
+            if Type == mycapture.CAPTURE_MASTER:
+                Latency = 0
+            else:
+                Latency = time.time() - self.MasterSentTime
+            self.Capture.Write(Type, Packet, Latency, CrcOK)
+        except Exception as e1:
+            self.LogError("Error writing capture file: " + str(e1))
 
     # ---------- ModbusProtocol::UpdateRegistersFromPacket------------------
     #    Update our internal register list based on the request/response packet
@@ -264,9 +914,9 @@ class ModbusProtocol:
         if (length + MBUS_RES_PAYLOAD_SIZE_MINUS_LENGTH) > len(SlavePacket):
              return ""
 
-        RegisterValue = ""
-        for i in range(3, length+3):
-            RegisterValue += "%02x" % SlavePacket[i]
+        RegisterValue = binascii.hexlify(bytearray(SlavePacket[3:length+3]))
+        if sys.version_info[0] >= 3:
+            RegisterValue = RegisterValue.decode("ascii")     # PYTHON3
         # update register list
         if not SkipUpdate:
             self.UpdateRegisterList(Register, RegisterValue)
@@ -278,15 +928,10 @@ class ModbusProtocol:
 
         if len(Packet) == 0:
             return False
-        ByteArray = bytearray(Packet[:len(Packet)-2])
-
-        if sys.version_info[0] < 3:
-            results = self.ModbusCrc(str(ByteArray))
-        else:   # PYTHON3
-            results = self.ModbusCrc(ByteArray)
 
-        CRCValue = ( ( Packet[-1] & 0xFF ) << 8 ) | ( Packet[ -2] & 0xFF )
-        if results != CRCValue:
+        if not mycrc.CheckFrame(Packet):
+            results = mycrc.CRC16(Packet[:len(Packet)-2])
+            CRCValue = ( ( Packet[-1] & 0xFF ) << 8 ) | ( Packet[ -2] & 0xFF )
             self.LogError("Data Error: CRC check failed: %04x  %04x" % (results, CRCValue))
             return False
         return True
@@ -296,14 +941,8 @@ class ModbusProtocol:
 
         if len(Packet) == 0:
             return False
-        ByteArray = bytearray(Packet)
-
-        if sys.version_info[0] < 3:
-            results = self.ModbusCrc(str(ByteArray))
-        else:   # PYTHON3
-            results = self.ModbusCrc(ByteArray)
 
-        return results
+        return mycrc.CRC16(Packet)
 
     #------------ModbusProtocol::Flush-----------------------
     def Flush(self):
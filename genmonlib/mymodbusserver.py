@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: mymodbusserver.py
+# PURPOSE: Modbus TCP server that answers from the cached register values
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import socket, select, struct, threading, time
+import mylog, mythread
+
+DEFAULT_SERVER_PORT     = 502
+MAX_CLIENTS             = 32
+CLIENT_IDLE_TIMEOUT     = 300       # seconds before an idle client is disconnected
+MAX_READ_COUNT          = 125       # modbus limit for registers in one read
+MAX_WRITE_COUNT         = 123       # modbus limit for registers in one write
+
+MBAP_HEADER             = struct.Struct(">HHHB")    # transaction id, protocol id (0), length, unit id
+MBAP_HEADER_SIZE        = 7
+
+FUNC_READ_HOLDING       = 0x03
+FUNC_READ_INPUT         = 0x04
+FUNC_WRITE_SINGLE       = 0x06
+FUNC_WRITE_MULTIPLE     = 0x10
+
+EXCEPTION_ILLEGAL_FUNCTION  = 0x01
+EXCEPTION_ILLEGAL_ADDRESS   = 0x02
+EXCEPTION_ILLEGAL_VALUE     = 0x03
+EXCEPTION_DEVICE_FAILURE    = 0x04
+
+#------------ ModbusClient class ---------------------------------------------
+class ModbusClient:
+    def __init__(self, conn, addr):
+
+        self.Socket = conn
+        self.Address = addr
+        self.Buffer = bytearray()
+        self.SendLock = threading.Lock()        # responses are sent by the server and write threads
+        self.LastActivity = time.time()
+
+#------------ ModbusTcpServer class ------------------------------------------
+# A Modbus TCP slave for building management systems and other clients. Read
+# requests (function 03 and 04, both return the same registers) are answered
+# from the last published snapshot of the register file, i.e. the values
+# genmon read from the controller in one poll cycle, so clients do not add any
+# traffic to the controller. A read that includes a word genmon has no value
+# for is answered with an illegal data address exception rather than zero.
+# All clients are served by one thread using select. Write requests (function
+# 06 and 16) are only accepted for the registers in WriteAllowList, they are
+# passed to WriteCallback (Register, Values) on a separate thread as they have
+# to wait for the controller. WriteCallback returns True if the write
+# succeeded.
+class ModbusTcpServer:
+    def __init__(self, Registers, port = DEFAULT_SERVER_PORT, WriteCallback = None, WriteAllowList = [], loglocation = "/var/log/"):
+
+        self.Registers = Registers
+        self.Port = port
+        self.WriteCallback = WriteCallback
+        self.WriteAllowList = set(WriteAllowList)   # register addresses (int) that may be written
+        self.ServerSocket = None
+        self.Clients = {}                           # socket : ModbusClient
+        self.Threads = {}
+        self.WriteQueue = []                        # [ModbusClient, Header, Function, Register, Values]
+        self.WriteCondition = threading.Condition()
+
+        # stats
+        self.Connections = 0
+        self.RejectedConnections = 0
+        self.ReadRequests = 0
+        self.WriteRequests = 0
+        self.ExceptionResponses = 0
+
+        self.log = mylog.SetupLogger("mymodbusserver", loglocation + "mymodbusserver.log")
+
+    # ---------- ModbusTcpServer::Start------------------
+    def Start(self):
+
+        self.ServerSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.ServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.ServerSocket.bind(('', self.Port))
+        self.ServerSocket.listen(5)
+
+        self.Threads["ModbusServerThread"] = mythread.MyThread(self.ServerThread, Name = "ModbusServerThread")
+        self.Threads["ModbusServerWriteThread"] = mythread.MyThread(self.WriteThread, Name = "ModbusServerWriteThread")
+
+    # ---------- ModbusTcpServer::IsStopSignaled------------------
+    def IsStopSignaled(self, Name):
+
+        Thread = self.Threads.get(Name, None)
+        if Thread == None:
+            return False        # the thread may start before it is added to the list
+        return Thread.StopSignaled()
+
+    # ---------- ModbusTcpServer::Close------------------
+    def Close(self):
+
+        for Name, MyThreadObj in self.Threads.items():
+            MyThreadObj.Stop()
+        with self.WriteCondition:
+            self.WriteCondition.notify_all()
+        for Name, MyThreadObj in self.Threads.items():
+            MyThreadObj.WaitForThreadToEnd()
+
+        for Client in list(self.Clients.values()):
+            self.CloseClient(Client)
+        if self.ServerSocket != None:
+            self.ServerSocket.close()
+            self.ServerSocket = None
+
+    # ---------- ModbusTcpServer::ServerThread------------------
+    def ServerThread(self):
+
+        while True:
+            if self.IsStopSignaled("ModbusServerThread"):
+                return
+            try:
+                Sockets = [self.ServerSocket] + list(self.Clients.keys())
+                Readable, Writable, Error = select.select(Sockets, [], [], 0.5)
+                for Socket in Readable:
+                    if Socket is self.ServerSocket:
+                        self.AcceptClient()
+                    else:
+                        Client = self.Clients.get(Socket, None)
+                        if Client != None:          # may have been closed by the write thread
+                            self.ReadClient(Client)
+                self.CheckIdleClients()
+            except Exception as e1:
+                self.LogError("Error in ModbusServerThread: " + str(e1))
+                time.sleep(0.5)
+
+    # ---------- ModbusTcpServer::AcceptClient------------------
+    def AcceptClient(self):
+
+        conn, addr = self.ServerSocket.accept()
+        if len(self.Clients) >= MAX_CLIENTS:
+            self.RejectedConnections += 1
+            conn.close()
+            return
+        conn.settimeout(1)          # sends block for at most this time
+        self.Clients[conn] = ModbusClient(conn, addr)
+        self.Connections += 1
+
+    # ---------- ModbusTcpServer::CloseClient------------------
+    def CloseClient(self, Client):
+
+        self.Clients.pop(Client.Socket, None)
+        try:
+            Client.Socket.close()
+        except Exception as e1:
+            pass
+
+    # ---------- ModbusTcpServer::CheckIdleClients------------------
+    def CheckIdleClients(self):
+
+        Now = time.time()
+        for Client in list(self.Clients.values()):
+            if Now - Client.LastActivity > CLIENT_IDLE_TIMEOUT:
+                self.CloseClient(Client)
+
+    # ---------- ModbusTcpServer::ReadClient------------------
+    def ReadClient(self, Client):
+
+        try:
+            Data = Client.Socket.recv(1024)
+        except Exception as e1:
+            Data = b""
+        if not len(Data):
+            self.CloseClient(Client)
+            return
+
+        Client.LastActivity = time.time()
+        Client.Buffer += bytearray(Data)
+        while len(Client.Buffer) >= MBAP_HEADER_SIZE:
+            TransactionID, ProtocolID, Length, UnitID = MBAP_HEADER.unpack_from(bytes(Client.Buffer[:MBAP_HEADER_SIZE]))
+            if ProtocolID != 0 or Length < 2 or Length > 254:
+                self.LogError("Invalid request header from %s, closing connection" % str(Client.Address))
+                self.CloseClient(Client)
+                return
+            FrameLength = MBAP_HEADER_SIZE - 1 + Length
+            if len(Client.Buffer) < FrameLength:
+                return
+            PDU = Client.Buffer[MBAP_HEADER_SIZE:FrameLength]
+            Client.Buffer = Client.Buffer[FrameLength:]
+            self.ProcessRequest(Client, (TransactionID, UnitID), PDU)
+
+    # ---------- ModbusTcpServer::ProcessRequest------------------
+    def ProcessRequest(self, Client, Header, PDU):
+
+        Function = PDU[0]
+        if Function in [FUNC_READ_HOLDING, FUNC_READ_INPUT]:
+            if len(PDU) != 5:
+                return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_VALUE)
+            Register, Count = struct.unpack(">HH", bytes(PDU[1:5]))
+            if Count < 1 or Count > MAX_READ_COUNT:
+                return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_VALUE)
+            # read from the published snapshot so the words are from one poll cycle
+            self.Registers.Pin()
+            try:
+                Words = self.Registers.GetRange(Register, Count)
+            finally:
+                self.Registers.Unpin()
+            if Words == None:
+                return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_ADDRESS)
+            self.ReadRequests += 1
+            return self.SendResponse(Client, Header, struct.pack(">BB%dH" % Count, Function, Count * 2, *Words))
+
+        if Function == FUNC_WRITE_SINGLE:
+            if len(PDU) != 5:
+                return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_VALUE)
+            Register, Value = struct.unpack(">HH", bytes(PDU[1:5]))
+            Values = [Value]
+        elif Function == FUNC_WRITE_MULTIPLE:
+            if len(PDU) < 6:
+                return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_VALUE)
+            Register, Count, ByteCount = struct.unpack(">HHB", bytes(PDU[1:6]))
+            if Count < 1 or Count > MAX_WRITE_COUNT or ByteCount != Count * 2 or len(PDU) != 6 + ByteCount:
+                return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_VALUE)
+            Values = list(struct.unpack(">%dH" % Count, bytes(PDU[6:6 + ByteCount])))
+        else:
+            return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_FUNCTION)
+
+        if self.WriteCallback == None or not len(self.WriteAllowList):
+            return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_FUNCTION)
+        for Address in range(Register, Register + len(Values)):
+            if not Address in self.WriteAllowList:
+                return self.SendException(Client, Header, Function, EXCEPTION_ILLEGAL_ADDRESS)
+
+        with self.WriteCondition:
+            self.WriteQueue.append([Client, Header, Function, Register, Values])
+            self.WriteCondition.notify()
+
+    # ---------- ModbusTcpServer::WriteThread------------------
+    # writes wait for the controller so they are not done by the server thread
+    def WriteThread(self):
+
+        while True:
+            with self.WriteCondition:
+                while not len(self.WriteQueue):
+                    if self.IsStopSignaled("ModbusServerWriteThread"):
+                        return
+                    self.WriteCondition.wait()
+                Client, Header, Function, Register, Values = self.WriteQueue.pop(0)
+
+            try:
+                Result = self.WriteCallback(Register, Values)
+            except Exception as e1:
+                self.LogError("Error in write callback: " + str(e1))
+                Result = False
+
+            if not Result:
+                self.SendException(Client, Header, Function, EXCEPTION_DEVICE_FAILURE)
+                continue
+            self.WriteRequests += 1
+            if Function == FUNC_WRITE_SINGLE:
+                self.SendResponse(Client, Header, struct.pack(">BHH", Function, Register, Values[0]))
+            else:
+                self.SendResponse(Client, Header, struct.pack(">BHH", Function, Register, len(Values)))
+
+    # ---------- ModbusTcpServer::SendException------------------
+    def SendException(self, Client, Header, Function, Code):
+
+        self.ExceptionResponses += 1
+        self.SendResponse(Client, Header, struct.pack(">BB", (Function | 0x80) & 0xff, Code))
+
+    # ---------- ModbusTcpServer::SendResponse------------------
+    def SendResponse(self, Client, Header, PDU):
+
+        TransactionID, UnitID = Header
+        try:
+            with Client.SendLock:
+                Client.Socket.sendall(MBAP_HEADER.pack(TransactionID, 0, len(PDU) + 1, UnitID) + PDU)
+        except Exception as e1:
+            self.LogError("Error sending to %s: " % str(Client.Address) + str(e1))
+            self.CloseClient(Client)
+
+    # ---------- ModbusTcpServer::GetStats------------------
+    def GetStats(self):
+
+        Stats = []
+        Stats.append(("Modbus Server Clients", "%d (Total %d, Rejected %d)" % (len(self.Clients), self.Connections, self.RejectedConnections)))
+        Stats.append(("Modbus Server Requests", "Read %d, Write %d, Exceptions %d" % (self.ReadRequests, self.WriteRequests, self.ExceptionResponses)))
+        return Stats
+
+    #---------------------ModbusTcpServer::LogError------------------------
+    def LogError(self, Message):
+        self.log.error(Message)
@@ -0,0 +1,477 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: myregisters.py
+# PURPOSE: Binary register file for cached modbus register values
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import binascii, struct, threading, time
+from array import array
+
+REGISTER_FILE_SIZE  = 0x800     # number of 16 bit registers (addresses 0000 - 07ff)
+MAX_REGISTER_WORDS  = 0xff      # longest register, the length in words is stored in a byte
+
+# return values for RegisterFile::SetHex
+REG_INVALID         = -1
+REG_UNCHANGED       = 0
+REG_CHANGED         = 1
+REG_NEW             = 2
+
+# register classes in a RegisterMap
+REG_CLASS_NONE              = 0
+REG_CLASS_BASE              = 1
+REG_CLASS_PRIME             = 2
+REG_CLASS_START_LOG         = 3
+REG_CLASS_ALARM_LOG         = 4
+REG_CLASS_SERVICE_LOG       = 5
+REG_CLASS_NEXUS_ALARM_LOG   = 6
+REG_CLASS_MODEL             = 7
+REG_CLASS_NAMES             = ["Unknown", "Base", "Prime", "Start", "Alarm", "Service", "Nexus Alarm", "Model"]
+
+# controllers a register applies to
+CONTROLLER_NEXUS        = 0x01
+CONTROLLER_EVOLUTION    = 0x02
+CONTROLLER_ALL          = CONTROLLER_NEXUS | CONTROLLER_EVOLUTION
+
+#------------ RegisterFile class --------------------------------------------
+# Register values are stored as 16 bit words indexed by register address. A
+# register may be more than one word (i.e. log entries), the number of words
+# is stored at the starting address. Each register has a sequence number that
+# is updated when the value changes. The dict like methods (get, items, [])
+# return the values as hex strings, the same as the previous dict of hex
+# strings, for the display and command code.
+#
+# Publish makes a copy of the registers (a RegisterSnapshot), the poll loop
+# calls it when a poll cycle is complete. A thread that has pinned the
+# registers (Pin, or a method decorated with Pinned) reads from the snapshot
+# published before it pinned, so a display made of many registers shows the
+# values of one poll cycle while the registers are updated. Other threads read the current values.
+class RegisterFile:
+    def __init__(self, size = REGISTER_FILE_SIZE):
+
+        self.Size = size
+        self.Words = array('H', [0] * size)     # register values
+        self.Lengths = array('B', [0] * size)   # length in words of the register at this address, zero if not present
+        self.Sequences = array('L', [0] * size) # sequence number of last change of the register at this address
+        self.Sequence = 0                       # incremented on each change to any register
+        self.Present = []                       # addresses of registers with values, in the order received
+        self.AddressCache = {}                  # hex string to address
+        self.Snapshot = None                    # RegisterSnapshot last published
+        self.Local = threading.local()          # View and Depth of the threads that have pinned a snapshot
+
+    # ---------- RegisterFile::Address------------------
+    # return the address for a register given as a hex string or an int
+    def Address(self, Register):
+
+        if isinstance(Register, int):
+            return Register
+        Address = self.AddressCache.get(Register, None)
+        if Address is None:
+            Address = int(Register, 16)
+            self.AddressCache[Register] = Address
+        return Address
+
+    # ---------- RegisterFile::SetHex------------------
+    # set a register from a hex string value. Returns REG_NEW, REG_CHANGED,
+    # REG_UNCHANGED or REG_INVALID
+    def SetHex(self, Register, Value):
+
+        Address = self.Address(Register)
+        Length = len(Value) // 4
+        if not Length or len(Value) % 4 or Address < 0 or Address + Length > self.Size or Length > 0xff:
+            return REG_INVALID
+
+        if Length == 1:
+            Words = (int(Value, 16),)
+        else:
+            Words = struct.unpack(">%dH" % Length, binascii.unhexlify(Value))
+
+        return self.SetWords(Address, Words)
+
+    # ---------- RegisterFile::SetWords------------------
+    # set a register from a sequence of 16 bit values
+    def SetWords(self, Address, Words):
+
+        Length = len(Words)
+        OldLength = self.Lengths[Address]
+        if OldLength == Length and tuple(self.Words[Address:Address + Length]) == tuple(Words):
+            return REG_UNCHANGED
+
+        self.Words[Address:Address + Length] = array('H', Words)
+        self.Lengths[Address] = Length
+        self.Sequence += 1
+        self.Sequences[Address] = self.Sequence
+        if not OldLength:
+            self.Present.append(Address)
+            return REG_NEW
+        return REG_CHANGED
+
+    # ---------- RegisterFile::GetHex------------------
+    # return the value of a register as a hex string, or "" if no value
+    def GetHex(self, Register):
+
+        Address = self.Address(Register)
+        if Address < 0 or Address >= self.Size:
+            return ""
+        View = self.View()
+        Length = View.Lengths[Address]
+        if not Length:
+            return ""
+        return ("%04x" * Length) % tuple(View.Words[Address:Address + Length])
+
+    # ---------- RegisterFile::GetWords------------------
+    # return the value of a register as a tuple of 16 bit values, None if no value
+    def GetWords(self, Register):
+
+        Address = self.Address(Register)
+        if Address < 0 or Address >= self.Size:
+            return None
+        View = self.View()
+        Length = View.Lengths[Address]
+        if not Length:
+            return None
+        return tuple(View.Words[Address:Address + Length])
+
+    # ---------- RegisterFile::GetU16------------------
+    # return the value of a one word register, None if no value
+    def GetU16(self, Register):
+
+        Address = self.Address(Register)
+        View = self.View()
+        if Address < 0 or Address >= self.Size or View.Lengths[Address] != 1:
+            return None
+        return View.Words[Address]
+
+    # ---------- RegisterFile::GetS16------------------
+    def GetS16(self, Register):
+
+        Value = self.GetU16(Register)
+        if Value is None:
+            return None
+        if Value & 0x8000:
+            return Value - 0x10000
+        return Value
+
+    # ---------- RegisterFile::GetU32------------------
+    # return the value of a two word register (high word first), None if no value
+    def GetU32(self, Register):
+
+        Address = self.Address(Register)
+        View = self.View()
+        if Address < 0 or Address >= self.Size or View.Lengths[Address] != 2:
+            return None
+        return (View.Words[Address] << 16) | View.Words[Address + 1]
+
+    # ---------- RegisterFile::GetHiByte------------------
+    def GetHiByte(self, Register):
+
+        Value = self.GetU16(Register)
+        if Value is None:
+            return None
+        return Value >> 8
+
+    # ---------- RegisterFile::GetLoByte------------------
+    def GetLoByte(self, Register):
+
+        Value = self.GetU16(Register)
+        if Value is None:
+            return None
+        return Value & 0x00FF
+
+    # ---------- RegisterFile::GetRange------------------
+    # return Count 16 bit words starting at Address as a tuple. Returns None if
+    # the range is outside the file or any word in it is not part of a register
+    # that has a value, so a word that has never been read is not returned as zero
+    def GetRange(self, Address, Count):
+
+        if Address < 0 or Count < 0 or Address + Count > self.Size:
+            return None
+        View = self.View()
+        End = Address + Count
+        Next = Address                  # first word not known to be part of a register
+        # the first words may be inside a multi word register that starts before Address
+        for Start in range(Address - 1, max(-1, Address - MAX_REGISTER_WORDS - 1), -1):
+            if View.Lengths[Start]:
+                Next = max(Next, Start + View.Lengths[Start])
+                break
+        while Next < End:
+            if not View.Lengths[Next]:
+                return None
+            Next += View.Lengths[Next]
+        return tuple(View.Words[Address:End])
+
+    # ---------- RegisterFile::GetSequence------------------
+    # return the sequence number of the last change of a register, zero if no value
+    def GetSequence(self, Register):
+
+        Address = self.Address(Register)
+        View = self.View()
+        if Address < 0 or Address >= self.Size or not View.Lengths[Address]:
+            return 0
+        return View.Sequences[Address]
+
+    # ---------- RegisterFile::Publish------------------
+    # make a snapshot of the registers if they changed since the last one,
+    # called by MasterEmulation when a poll cycle is complete, also by Pin if
+    # nothing has been published yet. Returns the snapshot
+    def Publish(self):
+
+        Snapshot = self.Snapshot
+        if Snapshot == None or Snapshot.Sequence != self.Sequence:
+            Snapshot = RegisterSnapshot(self)
+            self.Snapshot = Snapshot        # replaced, never changed, readers keep the one they have
+        return Snapshot
+
+    # ---------- RegisterFile::Pin------------------
+    # read from the last published snapshot on this thread until Unpin. A nested
+    # Pin keeps the snapshot of the outer one. Returns the snapshot
+    def Pin(self):
+
+        Depth = getattr(self.Local, "Depth", 0)
+        if not Depth:
+            self.Local.View = self.Snapshot if self.Snapshot != None else self.Publish()
+        self.Local.Depth = Depth + 1
+        return self.Local.View
+
+    # ---------- RegisterFile::Unpin------------------
+    def Unpin(self):
+
+        self.Local.Depth -= 1
+        if not self.Local.Depth:
+            self.Local.View = None
+
+    # ---------- RegisterFile::View------------------
+    # the snapshot pinned by this thread, or the register file
+    def View(self):
+
+        View = getattr(self.Local, "View", None)
+        if View == None:
+            return self
+        return View
+
+    # ---------- RegisterFile::GetViewSequence------------------
+    # the sequence number of the values this thread reads, the snapshot
+    # sequence if pinned. It only changes when a register value changes
+    def GetViewSequence(self):
+
+        return self.View().Sequence
+
+    #----- dict compatibility, values are hex strings ---------------------
+
+    # ---------- RegisterFile::get------------------
+    def get(self, Register, Default = None):
+
+        Value = self.GetHex(Register)
+        if not len(Value):
+            return Default
+        return Value
+
+    # ---------- RegisterFile::keys------------------
+    def keys(self):
+        return ["%04x" % Address for Address in self.View().Present]
+
+    # ---------- RegisterFile::items------------------
+    def items(self):
+        return [("%04x" % Address, self.GetHex(Address)) for Address in self.View().Present]
+
+    # ---------- RegisterFile::__len__------------------
+    def __len__(self):
+        return len(self.View().Present)
+
+    # ---------- RegisterFile::__contains__------------------
+    def __contains__(self, Register):
+        return self.GetSequence(Register) != 0
+
+    # ---------- RegisterFile::__getitem__------------------
+    def __getitem__(self, Register):
+
+        Value = self.GetHex(Register)
+        if not len(Value):
+            raise KeyError(Register)
+        return Value
+
+    # ---------- RegisterFile::__setitem__------------------
+    def __setitem__(self, Register, Value):
+
+        if self.SetHex(Register, Value) == REG_INVALID:
+            raise ValueError("Invalid register value %s:%s" % (str(Register), str(Value)))
+
+#------------ RegisterSnapshot class ----------------------------------------
+# A copy of the register values, sequence numbers and register list of a
+# RegisterFile. It is not changed once made so any thread can read it.
+class RegisterSnapshot:
+    def __init__(self, Registers):
+
+        self.Sequence = Registers.Sequence      # read first, a change while copying makes the next Publish copy again
+        self.Words = array('H', Registers.Words)
+        self.Lengths = array('B', Registers.Lengths)
+        self.Sequences = array('L', Registers.Sequences)
+        self.Present = list(Registers.Present)
+        self.Time = time.time()
+
+#------------ Pinned decorator ----------------------------------------------
+# the method reads self.Registers from one snapshot (see RegisterFile)
+def Pinned(Function):
+
+    def Wrapper(self, *Args, **Kwargs):
+        self.Registers.Pin()
+        try:
+            return Function(self, *Args, **Kwargs)
+        finally:
+            self.Registers.Unpin()
+    Wrapper.__name__ = Function.__name__
+    Wrapper.__doc__ = Function.__doc__
+    return Wrapper
+
+#------------ RegisterMap class ---------------------------------------------
+# What is known about each register address: the length of the value, the
+# register class (base, prime, log or model), the controllers it applies to
+# and if changes are monitored. Built once from the register dicts and the log
+# ranges, the lookups are indexed by address so checking a register read is
+# a few array reads instead of parsing the register string for each range.
+class RegisterMap:
+    def __init__(self, size = REGISTER_FILE_SIZE):
+
+        self.Size = size
+        self.Lengths = array('B', [0] * size)       # length of the value in bytes
+        self.Classes = array('B', [REG_CLASS_NONE] * size)
+        self.Controllers = array('B', [0] * size)   # CONTROLLER_ bits
+        self.Monitor = array('B', [0] * size)       # 1 if changes are monitored
+
+    # ---------- RegisterMap::AddRegisters------------------
+    # add the registers of a dict, format Register: [Length in bytes, monitor change 0 - no, 1 = yes]
+    def AddRegisters(self, RegisterDict, Class, Controllers = CONTROLLER_ALL):
+
+        for Register, Info in RegisterDict.items():
+            self.Add(int(Register, 16), Info[0], Class, Controllers, Info[1])
+
+    # ---------- RegisterMap::AddRange------------------
+    # add each address from Start to End (inclusive), addresses already added are not changed
+    def AddRange(self, Start, End, Length, Class, Controllers = CONTROLLER_ALL):
+
+        for Address in range(Start, End + 1):
+            if self.Classes[Address] == REG_CLASS_NONE:
+                self.Add(Address, Length, Class, Controllers)
+
+    # ---------- RegisterMap::Add------------------
+    def Add(self, Address, Length, Class, Controllers = CONTROLLER_ALL, Monitor = 0):
+
+        self.Lengths[Address] = Length
+        self.Classes[Address] = Class
+        self.Controllers[Address] = Controllers
+        self.Monitor[Address] = 1 if Monitor == 1 else 0
+
+    # ---------- RegisterMap::GetClass------------------
+    # return the class of a register, REG_CLASS_NONE if unknown or it does not
+    # apply to the controller (True for Evolution)
+    def GetClass(self, Address, Evolution):
+
+        if Address < 0 or Address >= self.Size:
+            return REG_CLASS_NONE
+        if not self.Controllers[Address] & (CONTROLLER_EVOLUTION if Evolution else CONTROLLER_NEXUS):
+            return REG_CLASS_NONE
+        return self.Classes[Address]
+
+    # ---------- RegisterMap::IsKnown------------------
+    def IsKnown(self, Address, Evolution):
+
+        return self.GetClass(Address, Evolution) != REG_CLASS_NONE
+
+    # ---------- RegisterMap::IsLog------------------
+    # True for log entries and the model register
+    def IsLog(self, Address, Evolution):
+
+        return self.GetClass(Address, Evolution) >= REG_CLASS_START_LOG
+
+    # ---------- RegisterMap::GetLength------------------
+    # return the length in bytes of a register value, zero if unknown
+    def GetLength(self, Address):
+
+        if Address < 0 or Address >= self.Size:
+            return 0
+        return self.Lengths[Address]
+
+    # ---------- RegisterMap::IsMonitored------------------
+    def IsMonitored(self, Address):
+
+        if Address < 0 or Address >= self.Size:
+            return False
+        return self.Monitor[Address] == 1
+
+#------------ Decoder decorator ---------------------------------------------
+# Declares the registers a GeneratorDevice method decodes. A call without
+# arguments returns the value cached in self.DecodeCache until one of the
+# registers changes, calls with arguments (i.e. a register value passed in)
+# are not cached. The method must not depend on anything but the registers
+# and the controller settings, DecodeCache::Invalidate is called when those change.
+def Decoder(*Dependencies):
+
+    Addresses = tuple(int(Register, 16) for Register in Dependencies)
+
+    def Wrap(Function):
+        def Cached(self, *Args, **Kwargs):
+            if len(Args) or len(Kwargs):
+                return Function(self, *Args, **Kwargs)
+            return self.DecodeCache.Get(Function.__name__, Addresses, Function, self)
+        Cached.__name__ = Function.__name__
+        Cached.__doc__ = Function.__doc__
+        return Cached
+    return Wrap
+
+#------------ DecodeCache class ---------------------------------------------
+# Values decoded from the register file, each stored with the version of the
+# registers it was decoded from. The version is the highest sequence number
+# of the registers, the sequence numbers only increase so the version changes
+# when any of them changes.
+class DecodeCache:
+    def __init__(self, Registers):
+
+        self.Registers = Registers
+        self.Entries = {}               # name : (Generation, Version, Value)
+        self.Generation = 0             # incremented by Invalidate
+        self.Hits = 0
+        self.Misses = 0
+
+    # ---------- DecodeCache::Get------------------
+    # return the cached value of Name, or call Decode(*Args) if one of the
+    # registers (addresses) changed since it was cached
+    def Get(self, Name, Addresses, Decode, *Args):
+
+        Generation = self.Generation
+        Version = 0
+        Sequences = self.Registers.View().Sequences     # the pinned snapshot, if any, is decoded
+        for Address in Addresses:
+            Sequence = Sequences[Address]
+            if Sequence > Version:
+                Version = Sequence
+        Entry = self.Entries.get(Name, None)
+        if Entry != None and Entry[0] == Generation and Entry[1] == Version:
+            self.Hits += 1
+            return Entry[2]
+        self.Misses += 1
+        # the version is read before decoding, if a register changes while
+        # decoding the value is decoded again on the next call
+        Value = Decode(*Args)
+        self.Entries[Name] = (Generation, Version, Value)
+        return Value
+
+    # ---------- DecodeCache::Invalidate------------------
+    # discard all values, i.e. the controller type changed
+    def Invalidate(self):
+
+        self.Generation += 1
+        self.Entries = {}
+
+    # ---------- DecodeCache::GetStats------------------
+    # return a list of (name, value)
+    def GetStats(self):
+
+        Total = self.Hits + self.Misses
+        HitRate = (100.0 * self.Hits / Total) if Total else 0.0
+        return [("Decode Cache (Hits/Misses)", "%d/%d (%.1f%% hits, %d values)" % (self.Hits, self.Misses, HitRate, len(self.Entries)))]
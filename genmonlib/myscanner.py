@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: myscanner.py
+# PURPOSE: Discover the registers implemented by a controller
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, json, time, datetime, threading
+import mylog, mymodbus
+
+DEFAULT_SCAN_START      = 0x0000
+DEFAULT_SCAN_END        = 0x0800    # first register not scanned
+DEFAULT_SCAN_SPAN       = 64        # registers (words) in the first read of each range
+SCAN_MIN_SPLIT          = 4         # failed ranges this size or smaller are read one register at a time
+MAX_READ_LENGTH         = 125       # modbus limit for registers in one read
+
+# the cache file is shared by all units, one entry per controller model
+CacheLock = threading.Lock()
+
+#------------ RegisterScanner class ------------------------------------------
+# Finds the registers a controller implements. The register space is read in
+# ranges of Span registers, a range the controller does not answer is split in
+# two and each half is read, small ranges are read one register at a time. The ranges
+# that were answered (islands) are saved to the cache file under the controller
+# model so the scan is only done once per model. Reads are sent with the debug
+# priority so the scan runs while genmon polls the controller normally.
+class RegisterScanner:
+    def __init__(self, ModBus, CacheFile, UpdateCallback = None, Start = DEFAULT_SCAN_START, End = DEFAULT_SCAN_END,
+        Span = DEFAULT_SCAN_SPAN, loglocation = "/var/log/"):
+
+        self.ModBus = ModBus
+        self.CacheFile = CacheFile
+        self.UpdateCallback = UpdateCallback    # called with (Register, Value) for each register read, both hex strings
+        self.Start = Start
+        self.End = End
+        self.Span = max(1, min(Span, MAX_READ_LENGTH))
+        self.Key = None                 # controller model the register map is for
+        self.Islands = []               # [Start, Length] of the implemented registers, sorted
+        self.Values = {}                # register (int) : last value read (hex string)
+        self.ScanTime = None            # time the map was made (string)
+        self.FromCache = False
+        # stats
+        self.Reads = 0
+        self.FailedReads = 0
+        self.ScanSeconds = 0
+
+        self.log = mylog.SetupLogger("myscanner", loglocation + "myscanner.log")
+
+    # ---------- RegisterScanner::LoadCache------------------
+    # load the register map for a controller model, returns False if it has not been scanned
+    def LoadCache(self, Key):
+
+        try:
+            if not os.path.isfile(self.CacheFile):
+                return False
+            with CacheLock:
+                with open(self.CacheFile) as infile:
+                    Cache = json.load(infile)
+            Entry = Cache.get(Key, None)
+            if Entry == None or Entry.get("Range", None) != [self.Start, self.End]:
+                return False
+            self.Islands = [[Start, Length] for Start, Length in Entry["Islands"]]
+            self.Values = dict((int(Register, 16), Value) for Register, Value in Entry["Values"].items())
+            self.ScanTime = Entry["Scanned"]
+            self.Key = Key
+            self.FromCache = True
+            return True
+        except Exception as e1:
+            self.LogError("Error loading register map cache: " + str(e1))
+            return False
+
+    # ---------- RegisterScanner::SaveCache------------------
+    def SaveCache(self):
+
+        try:
+            with CacheLock:
+                Cache = {}
+                if os.path.isfile(self.CacheFile):
+                    with open(self.CacheFile) as infile:
+                        Cache = json.load(infile)
+                Cache[self.Key] = { "Range" : [self.Start, self.End],
+                                    "Scanned" : self.ScanTime,
+                                    "Islands" : self.Islands,
+                                    "Values" : dict(("%04x" % Register, Value) for Register, Value in self.Values.items())}
+                with open(self.CacheFile, "w") as outfile:
+                    json.dump(Cache, outfile, sort_keys = True, indent = 1)
+        except Exception as e1:
+            self.LogError("Error saving register map cache: " + str(e1))
+
+    # ---------- RegisterScanner::Scan------------------
+    # discover the implemented registers, StopCallback returns True to abandon
+    # the scan. Returns True if the scan completed
+    def Scan(self, Key, StopCallback = None):
+
+        self.Key = Key
+        StartTime = time.time()
+        Pending = [[Register, min(self.Span, self.End - Register)] for Register in range(self.Start, self.End, self.Span)]
+        Islands = []
+        while len(Pending):
+            if StopCallback != None and StopCallback():
+                return False
+            Start, Length = Pending.pop(0)
+            if self.ReadRange(Start, Length):
+                Islands.append([Start, Length])
+            elif Length <= SCAN_MIN_SPLIT:
+                # read the registers of a small range individually, splitting again costs more reads
+                if Length > 1:
+                    Pending[0:0] = [[Register, 1] for Register in range(Start, Start + Length)]
+            else:
+                # split the range, the halves are read next so the islands stay in order
+                Half = Length // 2
+                Pending[0:0] = [[Start, Half], [Start + Half, Length - Half]]
+
+        self.Islands = self.MergeRanges(Islands)
+        self.ScanTime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.ScanSeconds = time.time() - StartTime
+        self.FromCache = False
+        self.LogError("Register scan of %s complete, %d registers in %d ranges, %d reads in %d sec" %
+            (Key, sum(Length for Start, Length in self.Islands), len(self.Islands), self.Reads, self.ScanSeconds))
+        return True
+
+    # ---------- RegisterScanner::Refresh------------------
+    # read all discovered registers, the values are passed to UpdateCallback
+    def Refresh(self, StopCallback = None):
+
+        for Start, Length in self.Islands:
+            for Offset in range(0, Length, MAX_READ_LENGTH):
+                if StopCallback != None and StopCallback():
+                    return
+                self.ReadRange(Start + Offset, min(MAX_READ_LENGTH, Length - Offset))
+
+    # ---------- RegisterScanner::ReadRange------------------
+    # returns True if the controller answered the range read
+    def ReadRange(self, Start, Length):
+
+        self.Reads += 1
+        # reads are not retried, most of the scan is reads the controller does not answer
+        Value = self.ModBus.ProcessMasterSlaveTransaction("%04x" % Start, Length, ReturnValue = True,
+            Priority = mymodbus.PRIORITY_DEBUG, Retries = 0)
+        if not isinstance(Value, str) or len(Value) != Length * 4:
+            self.FailedReads += 1
+            return False
+
+        for Offset in range(0, Length):
+            RegValue = Value[Offset * 4:(Offset + 1) * 4]
+            self.Values[Start + Offset] = RegValue
+            if self.UpdateCallback != None:
+                self.UpdateCallback("%04x" % (Start + Offset), RegValue)
+        return True
+
+    # ---------- RegisterScanner::MergeRanges------------------
+    # merge sorted ranges that are next to each other
+    def MergeRanges(self, Ranges):
+
+        Merged = []
+        for Start, Length in sorted(Ranges):
+            if len(Merged) and Merged[-1][0] + Merged[-1][1] == Start:
+                Merged[-1][1] += Length
+            else:
+                Merged.append([Start, Length])
+        return Merged
+
+    # ---------- RegisterScanner::GetReport------------------
+    # register map as text, the register lines can be pasted into BaseRegisters.
+    # Registers in KnownRegisters (list of hex strings) are marked as known
+    def GetReport(self, KnownRegisters = []):
+
+        if self.ScanTime == None:
+            return "Register scan not complete (%d reads)\n" % self.Reads
+
+        Known = set(Register.lower() for Register in KnownRegisters)
+        outstr = "Register map for %s, scanned %s%s\n" % (self.Key, self.ScanTime, " (cached)" if self.FromCache else "")
+        outstr += "Range %04x - %04x: %d registers in %d ranges\n" % (self.Start, self.End - 1,
+            sum(Length for Start, Length in self.Islands), len(self.Islands))
+        outstr += "Ranges: " + ", ".join("%04x-%04x" % (Start, Start + Length - 1) for Start, Length in self.Islands) + "\n\n"
+        for Start, Length in self.Islands:
+            for Register in range(Start, Start + Length):
+                RegStr = "%04x" % Register
+                outstr += '                    "%s" : [2, 0],     # %s%s\n' % (RegStr, self.Values.get(Register, "????"),
+                    " (known)" if RegStr in Known else "")
+        return outstr
+
+    # ---------- RegisterScanner::GetStats------------------
+    def GetStats(self):
+
+        Stats = []
+        if self.ScanTime == None:
+            Stats.append(("Register Scan", "In progress, %d reads (%d failed)" % (self.Reads, self.FailedReads)))
+        elif self.FromCache:
+            Stats.append(("Register Scan", "%d ranges from cache (scanned %s)" % (len(self.Islands), self.ScanTime)))
+        else:
+            Stats.append(("Register Scan", "%d ranges, %d reads (%d failed) in %d sec" % (len(self.Islands), self.Reads, self.FailedReads, self.ScanSeconds)))
+        return Stats
+
+    #---------------------RegisterScanner::LogError------------------------
+    def LogError(self, Message):
+        self.log.error(Message)
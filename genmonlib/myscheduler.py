@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: myscheduler.py
+# PURPOSE: Adaptive polling schedule for modbus registers
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import time
+
+POLL_INTERVAL_DECREASE  = 0.5       # multiply the interval by this when a register changes
+POLL_INTERVAL_INCREASE  = 1.5       # multiply the interval by this when a register does not change
+
+#------------ PollScheduler class -------------------------------------------
+# Each register has its own poll interval between MinInterval and MaxInterval
+# (seconds). When a read shows a register has changed its interval is reduced,
+# when it has not changed its interval is increased. Registers that must always
+# be read as often as possible (i.e. alarm and status registers) can be given
+# a fixed interval. Reads are scheduled in blocks (range reads), a block is
+# due when the first of its registers is due.
+class PollScheduler:
+    def __init__(self, MinInterval, MaxInterval):
+
+        self.MinInterval = MinInterval
+        self.MaxInterval = max(MinInterval, MaxInterval)
+        # Register : [Interval, Next Due Time, Last Sequence, Fixed Interval, Reads, Changes]
+        self.Registers = {}
+        self.Tightened = 0          # number of times intervals were reset to the minimum
+
+    # ---------- PollScheduler::AddRegister------------------
+    # Fixed is None for an adaptive interval, otherwise a fixed interval in seconds
+    def AddRegister(self, Register, Fixed = None):
+
+        if Fixed is None:
+            Interval = self.MinInterval
+        else:
+            Interval = Fixed
+        self.Registers[Register] = [Interval, 0, 0, Fixed, 0, 0]
+
+    # ---------- PollScheduler::BlockDue------------------
+    # return the time the block of registers is due to be read
+    def BlockDue(self, RegList):
+
+        Due = None
+        for Reg, Offset, RegLength in RegList:
+            Stats = self.Registers.get(Reg, None)
+            if Stats is None:
+                return 0
+            if Due is None or Stats[1] < Due:
+                Due = Stats[1]
+        return Due
+
+    # ---------- PollScheduler::GetNextBlock------------------
+    # Plans is a list of read plans. Returns the plan and block that is due
+    # soonest (or most overdue) and the number of seconds until it is due
+    def GetNextBlock(self, Plans):
+
+        NextPlan = None
+        NextBlock = None
+        NextDue = None
+        for Plan in Plans:
+            for Block in Plan:
+                Due = self.BlockDue(Block[2])
+                if NextDue is None or Due < NextDue:
+                    NextPlan, NextBlock, NextDue = Plan, Block, Due
+
+        if NextBlock is None:
+            return None, None, 0
+        return NextPlan, NextBlock, max(0, NextDue - time.time())
+
+    # ---------- PollScheduler::BlockRead------------------
+    # Update the registers of a block after it has been read. Registers is the
+    # register file, used to see which registers changed
+    def BlockRead(self, RegList, Registers):
+
+        Now = time.time()
+        for Reg, Offset, RegLength in RegList:
+            Stats = self.Registers.get(Reg, None)
+            if Stats is None:
+                continue
+            Sequence = Registers.GetSequence(Reg)
+            Stats[4] += 1
+            if Stats[3] is None:
+                if Sequence != Stats[2]:
+                    Stats[0] = max(self.MinInterval, Stats[0] * POLL_INTERVAL_DECREASE)
+                else:
+                    Stats[0] = min(self.MaxInterval, Stats[0] * POLL_INTERVAL_INCREASE)
+            if Sequence != Stats[2]:
+                Stats[5] += 1
+            Stats[2] = Sequence
+            Stats[1] = Now + Stats[0]
+
+    # ---------- PollScheduler::Tighten------------------
+    # reset all adaptive registers to the minimum interval and make them due
+    # now, used when the generator changes state (i.e. engine starts)
+    def Tighten(self):
+
+        for Stats in self.Registers.values():
+            if Stats[3] is None:
+                Stats[0] = self.MinInterval
+                Stats[1] = 0
+        self.Tightened += 1
+
+    # ---------- PollScheduler::GetStats------------------
+    # return the min, average and max interval of the adaptive registers
+    def GetStats(self):
+
+        Intervals = [Stats[0] for Stats in self.Registers.values() if Stats[3] is None]
+        if not len(Intervals):
+            return 0, 0, 0
+        return min(Intervals), sum(Intervals) / len(Intervals), max(Intervals)
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: mysimulator.py
+# PURPOSE: Simulated Evolution / Nexus controller on a pseudo-terminal
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import os, tty, select, threading, time, datetime, random
+from array import array
+import mylog, mythread, mycrc
+
+# product codes in register 0000 (see GeneratorDevice::DetectController)
+PRODUCT_CODES = {   "nexusac" : 0x03,     # Nexus, Air Cooled
+                    "nexuslc" : 0x06,     # Nexus, Liquid Cooled
+                    "evoac"   : 0x09,     # Evolution, Air Cooled
+                    "evolc"   : 0x0c}     # Evolution, Liquid Cooled
+
+MBUS_CMD_READ_REGS      = 0x03
+MBUS_CMD_WRITE_REGS     = 0x10
+MAX_READ_LENGTH         = 125
+MEMORY_SIZE             = 0x800
+NOISE_GAP               = 0.01      # seconds of silence between a noise burst and the response
+NOISE_MAX_LENGTH        = 6         # max bytes in a noise burst
+
+# log layout, this must match genmon.py
+LOG_DEPTH               = 50
+START_LOG_STARTING_REG  = 0x012c
+START_LOG_STRIDE        = 4
+ALARM_LOG_STARTING_REG  = 0x03e8
+ALARM_LOG_STRIDE        = 5
+SERVICE_LOG_STARTING_REG= 0x04e2
+SERVICE_LOG_STRIDE      = 4
+NEXUS_ALARM_LOG_STARTING_REG    = 0x064
+NEXUS_ALARM_LOG_STRIDE          = 4
+MODEL_REG               = 0x01f4
+
+# engine state, high word of register 0001
+ENGINE_OFF              = 0x0000
+ENGINE_RUNNING          = 0x0003
+ENGINE_EXERCISING       = 0x0004
+ENGINE_COOLDOWN         = 0x0005
+ENGINE_STOPPED_ALARM    = 0x0008
+# switch state, low word of register 0001
+SWITCH_AUTO             = 0x0000
+SWITCH_ALARM            = 0x0008
+
+# start / stop log codes
+LOG_STOPPED_AUTO        = 0x2A
+LOG_RUNNING_UTILITY_LOSS= 0x2B
+LOG_RUNNING_REMOTE      = 0x2D
+LOG_RUNNING_EXERCISE    = 0x2E
+LOG_STOPPED_ALARM       = 0x2F
+LOG_ALARM               = 0x47      # alarm log code used for simulated alarms
+
+COOLDOWN_TIME           = 5         # seconds the engine cools down after utility returns
+
+# remote commands, the value written to index register 0003
+REMOTE_STOP             = 0x0000
+REMOTE_START            = 0x0001
+REMOTE_START_TRANSFER   = 0x0002
+REMOTE_START_EXERCISE   = 0x0003
+
+#------------------- ParseEvents -----------------#
+# parse a scripted event list "seconds:event[:value],...", i.e.
+# "30:outage,120:utility,200:alarm:2720,300:clearalarm,400:exercise,460:stop"
+# returns a list of [Seconds, Event, Value] sorted by time
+def ParseEvents(EventString):
+
+    Events = []
+    if EventString == None:
+        return Events
+    for Item in EventString.split(","):
+        Item = Item.strip()
+        if not len(Item):
+            continue
+        Fields = Item.split(":")
+        if len(Fields) < 2:
+            raise ValueError("Invalid simulator event: " + Item)
+        Value = 0
+        if len(Fields) > 2:
+            Value = int(Fields[2])
+        Events.append([float(Fields[0]), Fields[1].strip().lower(), Value])
+    Events.sort(key = lambda Event: Event[0])
+    return Events
+
+#------------ ControllerSimulator class ---------------------------------------
+# Opens a pseudo-terminal and answers modbus read (0x03) and write (0x10)
+# requests like a generator controller. PortName is the device name genmon (or
+# any other master) opens. The register values are updated every second to
+# follow the generator state, which changes with remote commands written by
+# the master and with scripted events (utility outage, alarm, exercise).
+class ControllerSimulator:
+    def __init__(self, Product = "evoac", address = 0x9d, Latency = 0.03, Jitter = 0.0, CrcErrorRate = 0.0, Events = None, NoiseRate = 0.0, loglocation = "/var/log/"):
+
+        if not Product in PRODUCT_CODES:
+            raise ValueError("Unknown product: %s, valid products are %s" % (Product, ", ".join(sorted(PRODUCT_CODES.keys()))))
+        self.ProductCode = PRODUCT_CODES[Product]
+        self.EvolutionController = self.ProductCode in [0x09, 0x0c]
+        self.LiquidCooled = self.ProductCode in [0x06, 0x0c]
+        self.Address = address
+        self.Latency = Latency              # seconds before each response is sent
+        self.Jitter = Jitter                # random extra seconds (0 - Jitter) added to the latency
+        self.CrcErrorRate = CrcErrorRate    # fraction of responses sent with a bad CRC
+        self.NoiseRate = NoiseRate          # fraction of responses sent after a burst of noise
+        self.Events = ParseEvents(Events)
+
+        self.Memory = array('H', [0] * MEMORY_SIZE)
+        self.Lock = threading.RLock()       # protects Memory and the generator state
+        self.Threads = {}
+        self.StartTime = time.time()
+        self.EngineState = ENGINE_OFF
+        self.SwitchState = SWITCH_AUTO
+        self.Outage = False
+        self.Transfer = False               # transfer switch engaged by a remote command
+        self.CooldownTime = 0               # time the cool down ends
+        self.RunSeconds = 360000.0          # engine run time
+        self.LogEntryNumbers = {}           # log base register : last entry number
+
+        # stats
+        self.Requests = 0
+        self.WriteRequests = 0
+        self.RequestCrcErrors = 0
+        self.CorruptedResponses = 0
+        self.NoiseBursts = 0
+        self.DiscardedBytes = 0
+
+        self.log = mylog.SetupLogger("mysimulator", loglocation + "mysimulator.log")
+
+        self.MasterFD, self.SlaveFD = os.openpty()
+        tty.setraw(self.SlaveFD)
+        self.PortName = os.ttyname(self.SlaveFD)
+
+        self.InitRegisters()
+
+    # ---------- ControllerSimulator::Start------------------
+    def Start(self):
+
+        self.StartTime = time.time()
+        self.Threads["SimulatorSerialThread"] = mythread.MyThread(self.SerialThread, Name = "SimulatorSerialThread")
+        self.Threads["SimulatorStateThread"] = mythread.MyThread(self.StateThread, Name = "SimulatorStateThread")
+
+    # ---------- ControllerSimulator::Close------------------
+    def Close(self):
+
+        for Name, MyThreadObj in self.Threads.items():
+            if MyThreadObj.IsAlive():
+                MyThreadObj.Stop()
+                MyThreadObj.WaitForThreadToEnd()
+        os.close(self.MasterFD)
+        os.close(self.SlaveFD)
+
+    # ---------- ControllerSimulator::IsStopSignaled------------------
+    def IsStopSignaled(self, Name):
+
+        Thread = self.Threads.get(Name, None)
+        if Thread == None:
+            return False        # the thread may start before it is added to the list
+        return Thread.StopSignaled()
+
+    # ---------- ControllerSimulator::SetRegister------------------
+    def SetRegister(self, Register, Value):
+        self.Memory[Register] = Value & 0xffff
+
+    # ---------- ControllerSimulator::InitRegisters------------------
+    def InitRegisters(self):
+
+        with self.Lock:
+            self.SetRegister(0x0000, self.ProductCode)
+            self.SetRegister(0x0005, (10 << 8) | 30)    # exercise time 10:30
+            self.SetRegister(0x0006, (2 << 8) | 1)      # exercise Tuesday, quiet mode
+            self.SetRegister(0x000a, 137)               # battery 13.7V
+            self.SetRegister(0x0011, 143)               # utility threshold voltage
+            self.SetRegister(0x001a, 120)               # hours until service A
+            self.SetRegister(0x001e, 240)               # hours until service B
+            self.SetRegister(0x002a, (104 << 8) | 133)  # hardware V1.04, firmware V1.33
+            self.SetRegister(0x002c, (10 << 8) | 30)
+            self.SetRegister(0x002e, 2)
+            self.SetRegister(0x002f, 1)
+            self.SetRegister(0x023b, 190)               # pickup voltage
+            self.SetRegister(0x023e, 12)                # exercise duration
+            # serial number, one digit in the low nibble of each byte
+            for Index, Digits in enumerate(["12", "34", "56", "78", "90"]):
+                self.SetRegister(MODEL_REG + Index, (ord(Digits[0]) << 8) | ord(Digits[1]))
+
+            self.AddLogEntry(START_LOG_STARTING_REG, START_LOG_STRIDE, LOG_RUNNING_EXERCISE, datetime.datetime.now() - datetime.timedelta(days = 7))
+            self.AddLogEntry(START_LOG_STARTING_REG, START_LOG_STRIDE, LOG_STOPPED_AUTO, datetime.datetime.now() - datetime.timedelta(days = 7, minutes = -12))
+            if self.EvolutionController:
+                self.AddLogEntry(SERVICE_LOG_STARTING_REG, SERVICE_LOG_STRIDE, 0x3D, datetime.datetime.now() - datetime.timedelta(days = 30))
+
+            self.UpdateRegisters()
+
+    # ---------- ControllerSimulator::AddLogEntry------------------
+    # the newest entry is at the log base register, older entries move up by
+    # one stride and the oldest entry is dropped
+    def AddLogEntry(self, LogBase, Stride, Code, Time = None, AlarmCode = None):
+
+        if Time == None:
+            Time = datetime.datetime.now()
+
+        with self.Lock:
+            Entry = (self.LogEntryNumbers.get(LogBase, 0) + 1) & 0xff
+            self.LogEntryNumbers[LogBase] = Entry
+            End = LogBase + Stride * LOG_DEPTH
+            self.Memory[LogBase + Stride:End] = self.Memory[LogBase:End - Stride]
+            Words = [(Code << 8) | Entry,
+                     (Time.minute << 8) | Time.hour,
+                     (Time.month << 8) | Time.second,
+                     ((Time.year % 100) << 8) | Time.day]
+            if Stride == 5:
+                Words.append(0 if AlarmCode == None else AlarmCode)
+            self.Memory[LogBase:LogBase + Stride] = array('H', Words)
+
+    # ---------- ControllerSimulator::AddAlarmLogEntry------------------
+    def AddAlarmLogEntry(self, AlarmCode):
+
+        if self.EvolutionController:
+            self.AddLogEntry(ALARM_LOG_STARTING_REG, ALARM_LOG_STRIDE, LOG_ALARM, AlarmCode = AlarmCode)
+        else:
+            self.AddLogEntry(NEXUS_ALARM_LOG_STARTING_REG, NEXUS_ALARM_LOG_STRIDE, LOG_ALARM)
+
+    # ---------- ControllerSimulator::SetEngineState------------------
+    def SetEngineState(self, State, LogCode = None):
+
+        with self.Lock:
+            if State == self.EngineState:
+                return
+            self.EngineState = State
+            if not self.Running():
+                self.Transfer = False
+            if LogCode != None:
+                self.AddLogEntry(START_LOG_STARTING_REG, START_LOG_STRIDE, LogCode)
+
+    # ---------- ControllerSimulator::Running------------------
+    def Running(self):
+        return self.EngineState in [ENGINE_RUNNING, ENGINE_EXERCISING, ENGINE_COOLDOWN]
+
+    # ---------- ControllerSimulator::UpdateRegisters------------------
+    # update the registers that follow the time and generator state
+    def UpdateRegisters(self):
+
+        with self.Lock:
+            Now = datetime.datetime.now()
+            self.SetRegister(0x000e, (Now.hour << 8) | Now.minute)
+            self.SetRegister(0x000f, (Now.month << 8) | Now.day)
+            self.SetRegister(0x0010, (((Now.weekday() + 1) % 7) << 8) | (Now.year % 100))
+
+            Hours = int(self.RunSeconds / 3600)
+            self.SetRegister(0x000b, Hours >> 16)
+            self.SetRegister(0x000c, Hours)
+            Minutes = int(self.RunSeconds / 60)
+            self.SetRegister(0x005e, Minutes >> 16)
+            self.SetRegister(0x005f, Minutes)
+
+            self.SetRegister(0x0001, self.EngineState)
+            self.SetRegister(0x0002, self.SwitchState)
+            self.SetRegister(0x0009, 0 if self.Outage else random.randint(238, 242))
+
+            if self.Running():
+                # frequency is in tenths of Hz on Evolution liquid cooled and half the frequency on Nexus liquid cooled
+                if self.EvolutionController and self.LiquidCooled:
+                    Frequency = 600
+                elif self.LiquidCooled:
+                    Frequency = 30
+                else:
+                    Frequency = 60
+                self.SetRegister(0x0007, random.randint(3595, 3605))
+                self.SetRegister(0x0008, Frequency)
+                self.SetRegister(0x0012, random.randint(239, 241))
+                self.SetRegister(0x000a, random.randint(138, 141))
+            else:
+                self.SetRegister(0x0007, 0)
+                self.SetRegister(0x0008, 0)
+                self.SetRegister(0x0012, 0)
+                self.SetRegister(0x000a, random.randint(136, 137))
+
+            # Evo LC output relays, bit 0 is the transfer switch
+            self.SetRegister(0x0053, 0x01 if (self.Outage or self.Transfer) and self.Running() else 0x00)
+
+    # ---------- ControllerSimulator::StateThread------------------
+    # runs the scripted events and updates the registers once a second
+    def StateThread(self):
+
+        LastTime = time.time()
+        while True:
+            if self.IsStopSignaled("SimulatorStateThread"):
+                return
+            Now = time.time()
+            with self.Lock:
+                if self.Running():
+                    self.RunSeconds += Now - LastTime
+                if self.EngineState == ENGINE_COOLDOWN and Now >= self.CooldownTime:
+                    self.SetEngineState(ENGINE_OFF, LOG_STOPPED_AUTO)
+                while len(self.Events) and self.Events[0][0] <= Now - self.StartTime:
+                    Seconds, Event, Value = self.Events.pop(0)
+                    self.ProcessEvent(Event, Value)
+                self.UpdateRegisters()
+            LastTime = Now
+            time.sleep(1)
+
+    # ---------- ControllerSimulator::ProcessEvent------------------
+    def ProcessEvent(self, Event, Value = 0):
+
+        with self.Lock:
+            self.log.error("Simulator event: %s %d" % (Event, Value))
+            if Event == "outage":
+                self.Outage = True
+                if self.SwitchState == SWITCH_AUTO:
+                    self.SetEngineState(ENGINE_RUNNING, LOG_RUNNING_UTILITY_LOSS)
+            elif Event == "utility":
+                self.Outage = False
+                if self.Running():
+                    self.CooldownTime = time.time() + COOLDOWN_TIME
+                    self.SetEngineState(ENGINE_COOLDOWN)
+            elif Event == "alarm":
+                self.SwitchState = SWITCH_ALARM
+                self.SetRegister(0x05f1, Value)
+                self.AddAlarmLogEntry(Value)
+                if self.Running():
+                    self.SetEngineState(ENGINE_STOPPED_ALARM, LOG_STOPPED_ALARM)
+                else:
+                    self.SetEngineState(ENGINE_STOPPED_ALARM)
+            elif Event == "clearalarm":
+                self.SwitchState = SWITCH_AUTO
+                self.SetEngineState(ENGINE_OFF)
+            elif Event == "exercise":
+                self.SetEngineState(ENGINE_EXERCISING, LOG_RUNNING_EXERCISE)
+            elif Event == "start":
+                self.SetEngineState(ENGINE_RUNNING, LOG_RUNNING_REMOTE)
+            elif Event == "stop":
+                if self.Running():
+                    self.SetEngineState(ENGINE_OFF, LOG_STOPPED_AUTO)
+            else:
+                self.log.error("Unknown simulator event: " + Event)
+            self.UpdateRegisters()
+
+    # ---------- ControllerSimulator::SerialThread------------------
+    def SerialThread(self):
+
+        Buffer = bytearray()
+        while True:
+            if self.IsStopSignaled("SimulatorSerialThread"):
+                return
+            try:
+                Readable, Writable, Error = select.select([self.MasterFD], [], [], 0.05)
+                if not len(Readable):
+                    continue
+                Buffer += bytearray(os.read(self.MasterFD, 512))
+                Buffer = self.ProcessBuffer(Buffer)
+            except Exception as e1:
+                self.log.error("Error in SerialThread: " + str(e1))
+                Buffer = bytearray()
+                time.sleep(0.05)
+
+    # ---------- ControllerSimulator::ProcessBuffer------------------
+    # respond to all complete requests in the buffer, returns the remaining data
+    def ProcessBuffer(self, Buffer):
+
+        while len(Buffer) >= 8:
+            if Buffer[0] != self.Address or not Buffer[1] in [MBUS_CMD_READ_REGS, MBUS_CMD_WRITE_REGS]:
+                Buffer = Buffer[1:]
+                self.DiscardedBytes += 1
+                continue
+            if Buffer[1] == MBUS_CMD_READ_REGS:
+                Length = 8
+            else:
+                Length = 9 + Buffer[6]
+                if len(Buffer) < Length:
+                    break
+            Request = Buffer[:Length]
+            Buffer = Buffer[Length:]
+            if not mycrc.CheckFrame(Request):
+                self.RequestCrcErrors += 1          # a controller does not answer a bad frame
+                continue
+            self.Requests += 1
+            Response = self.ProcessRequest(Request)
+            if Response == None:
+                continue
+            Delay = self.Latency + random.uniform(0, self.Jitter)
+            if Delay > 0:
+                time.sleep(Delay)
+            if self.CrcErrorRate > 0 and random.random() < self.CrcErrorRate:
+                Response[-1] ^= 0xff
+                self.CorruptedResponses += 1
+            if self.NoiseRate > 0 and random.random() < self.NoiseRate:
+                # noise that starts like a response, as seen on long cable runs
+                Noise = bytearray([self.Address] + [random.randint(0, 255) for Index in range(random.randint(0, NOISE_MAX_LENGTH - 1))])
+                os.write(self.MasterFD, bytes(Noise))
+                self.NoiseBursts += 1
+                time.sleep(NOISE_GAP)
+            os.write(self.MasterFD, bytes(Response))
+        return Buffer
+
+    # ---------- ControllerSimulator::ProcessRequest------------------
+    # returns the response frame (with CRC) or None if there is no response
+    def ProcessRequest(self, Request):
+
+        Register = (Request[2] << 8) | Request[3]
+        Count = (Request[4] << 8) | Request[5]
+        if not Count or Count > MAX_READ_LENGTH or Register + Count > MEMORY_SIZE:
+            return None
+
+        with self.Lock:
+            if Request[1] == MBUS_CMD_READ_REGS:
+                Response = bytearray([self.Address, MBUS_CMD_READ_REGS, Count * 2])
+                for Word in self.Memory[Register:Register + Count]:
+                    Response.append(Word >> 8)
+                    Response.append(Word & 0xff)
+            else:
+                self.WriteRequests += 1
+                if Request[6] != Count * 2:
+                    return None
+                for Index in range(0, Count):
+                    self.WriteRegister(Register + Index, (Request[7 + Index * 2] << 8) | Request[8 + Index * 2])
+                Response = bytearray(Request[0:6])
+
+        CRCValue = mycrc.CRC16(Response)
+        Response.append(CRCValue & 0x00FF)
+        Response.append(CRCValue >> 8)
+        return Response
+
+    # ---------- ControllerSimulator::WriteRegister------------------
+    # index register 0003 is written last for remote commands (see
+    # GeneratorDevice::SetGeneratorRemoteStartStop)
+    def WriteRegister(self, Register, Value):
+
+        self.SetRegister(Register, Value)
+        if Register != 0x0003:
+            return
+        if Value == REMOTE_STOP:
+            self.ProcessEvent("stop")
+        elif Value == REMOTE_START:
+            self.ProcessEvent("start")
+        elif Value == REMOTE_START_TRANSFER:
+            self.ProcessEvent("start")
+            self.Transfer = True
+            self.UpdateRegisters()
+        elif Value == REMOTE_START_EXERCISE:
+            self.ProcessEvent("exercise")
+
+    # ---------- ControllerSimulator::GetStats------------------
+    def GetStats(self):
+
+        Stats = []
+        Stats.append("Requests: %d" % self.Requests)
+        Stats.append("Write Requests: %d" % self.WriteRequests)
+        Stats.append("Request CRC Errors: %d" % self.RequestCrcErrors)
+        Stats.append("Corrupted Responses: %d" % self.CorruptedResponses)
+        Stats.append("Noise Bursts: %d" % self.NoiseBursts)
+        Stats.append("Discarded Bytes: %d" % self.DiscardedBytes)
+        return Stats
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: mytcp.py
+# PURPOSE: Modbus RTU over TCP transport (serial to ethernet converters)
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import socket, select, time, datetime, errno, os
+import mytransport
+
+DEFAULT_TCP_PORT        = 502
+TCP_CONNECT_TIMEOUT     = 5         # seconds to wait for a connection
+TCP_READ_TIMEOUT        = 0.05      # small timeout so the read thread can check if it should exit
+TCP_RETRY_MIN           = 1         # seconds before the first reconnect attempt
+TCP_RETRY_MAX           = 60        # max seconds between reconnect attempts
+TCP_KEEPALIVE_IDLE      = 30        # seconds idle before keep-alive probes are sent
+TCP_KEEPALIVE_INTERVAL  = 10        # seconds between keep-alive probes
+TCP_KEEPALIVE_COUNT     = 3         # failed probes before the connection is dropped
+
+#------------ TcpDevice class -----------------------------------------------
+# Raw modbus RTU frames (with CRC) sent over a TCP connection to a serial to
+# ethernet converter, i.e. the converter passes the bytes to and from the
+# controller serial port unchanged. This is not Modbus TCP (no MBAP header).
+# The connection uses TCP keep-alive so a dead converter is detected while the
+# bus is idle. If the connection fails it is re-established with a back off
+# between attempts, the protocol layer sees the time without a connection as
+# timeouts. When serviced by an event loop the connection is made without
+# blocking the loop.
+class TcpDevice(mytransport.TransportDevice):
+    def __init__(self, host, port = DEFAULT_TCP_PORT, loglocation = "/var/log/"):
+
+        self.Host = host
+        self.Port = port
+        self.Socket = None
+        self.RetryDelay = TCP_RETRY_MIN
+        self.NextConnectTime = 0            # time.time() of the next connection attempt
+        self.Connects = 0
+        self.Disconnects = 0
+        self.ConnectFailures = 0
+        self.ConnectTime = None             # datetime of the current connection
+        self.PendingSocket = None           # socket being connected by the event loop
+        self.ConnectTimer = None            # event loop timer of the next connection attempt, or the connect timeout
+        mytransport.TransportDevice.__init__(self, "%s:%d" % (host, port), loglocation, "mytcp")
+
+    # ---------- TcpDevice::OpenDevice------------------
+    # the converter may not be reachable when genmon starts, this does not fail,
+    # the connection is retried by the read thread
+    def OpenDevice(self):
+
+        self.Connect()
+
+    # ---------- TcpDevice::Connect------------------
+    def Connect(self):
+
+        self.NextConnectTime = time.time() + self.RetryDelay
+        try:
+            Socket = socket.create_connection((self.Host, self.Port), TCP_CONNECT_TIMEOUT)
+            self.ConfigureSocket(Socket)
+        except Exception as e1:
+            self.ConnectFailed(e1)
+            return False
+
+        self.Connected(Socket)
+        return True
+
+    # ---------- TcpDevice::ConfigureSocket------------------
+    def ConfigureSocket(self, Socket):
+
+        Socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        Socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # keep-alive timing is not available on all platforms
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            Socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPALIVE_IDLE)
+            Socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, TCP_KEEPALIVE_INTERVAL)
+            Socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, TCP_KEEPALIVE_COUNT)
+        Socket.settimeout(TCP_READ_TIMEOUT)
+
+    # ---------- TcpDevice::Connected------------------
+    def Connected(self, Socket):
+
+        self.Socket = Socket
+        self.RetryDelay = TCP_RETRY_MIN
+        self.Connects += 1
+        self.ConnectTime = datetime.datetime.now()
+
+    # ---------- TcpDevice::ConnectFailed------------------
+    def ConnectFailed(self, Error):
+
+        self.ConnectFailures += 1
+        self.RetryDelay = min(self.RetryDelay * 2, TCP_RETRY_MAX)
+        self.LogError("Error connecting to %s: " % self.DeviceName + str(Error))
+        self.ScheduleConnect()
+
+    # ---------- TcpDevice::ScheduleConnect------------------
+    # with an event loop, connect again at NextConnectTime
+    def ScheduleConnect(self):
+
+        if self.Loop == None or self.ConnectTimer != None or self.PendingSocket != None:
+            return
+        self.ConnectTimer = self.Loop.CallLater(self.NextConnectTime - time.time(), self.LoopConnect)
+
+    # ---------- TcpDevice::LoopConnect------------------
+    # start a connection without blocking the event loop, LoopConnectDone is
+    # called when the socket is writable (connected or failed) or on timeout.
+    # Note the host name lookup may block if host is not an address
+    def LoopConnect(self):
+
+        self.ConnectTimer = None
+        if self.Loop == None or self.Socket != None or self.PendingSocket != None:
+            return
+        self.NextConnectTime = time.time() + self.RetryDelay
+        try:
+            Family, Type, Protocol, Name, Address = socket.getaddrinfo(self.Host, self.Port, 0, socket.SOCK_STREAM)[0]
+            Socket = socket.socket(Family, Type, Protocol)
+            Socket.setblocking(0)
+            Error = Socket.connect_ex(Address)
+            if not Error in [0, errno.EINPROGRESS, errno.EWOULDBLOCK]:
+                Socket.close()
+                raise socket.error(Error, os.strerror(Error))
+        except Exception as e1:
+            self.ConnectFailed(e1)
+            return
+        self.PendingSocket = Socket
+        self.Loop.AddWriter(Socket.fileno(), self.LoopConnectDone)
+        self.ConnectTimer = self.Loop.CallLater(TCP_CONNECT_TIMEOUT, self.LoopConnectDone, True)
+
+    # ---------- TcpDevice::LoopConnectDone------------------
+    def LoopConnectDone(self, TimedOut = False):
+
+        Socket = self.PendingSocket
+        if Socket == None or self.Loop == None:
+            return
+        self.PendingSocket = None
+        self.Loop.RemoveWriter(Socket.fileno())
+        if self.ConnectTimer != None:
+            self.ConnectTimer.Cancel()
+            self.ConnectTimer = None
+        try:
+            if TimedOut:
+                raise socket.timeout("timed out")
+            Error = Socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if Error:
+                raise socket.error(Error, os.strerror(Error))
+            self.ConfigureSocket(Socket)
+        except Exception as e1:
+            Socket.close()
+            self.ConnectFailed(e1)
+            return
+        self.Connected(Socket)
+        self.LoopAddReader()
+
+    # ---------- TcpDevice::Disconnect------------------
+    def Disconnect(self):
+
+        if self.Socket == None:
+            return
+        if self.Loop != None:
+            self.LoopRemoveReader()
+        try:
+            self.Socket.close()
+        except Exception as e1:
+            pass
+        self.Socket = None
+        self.ConnectTime = None
+        self.Disconnects += 1
+        self.ScheduleConnect()
+
+    # ---------- TcpDevice::AttachLoop------------------
+    def AttachLoop(self, Loop, DataCallback):
+
+        mytransport.TransportDevice.AttachLoop(self, Loop, DataCallback)
+        if self.Socket == None:
+            Loop.RunInLoop(self.ScheduleConnect)
+
+    # ---------- TcpDevice::DetachLoop------------------
+    # stop connecting, the connection is closed by Close
+    def DetachLoop(self):
+
+        if self.Loop != None:
+            self.Loop.RunInLoop(self.LoopStopConnect)
+        mytransport.TransportDevice.DetachLoop(self)
+
+    # ---------- TcpDevice::LoopStopConnect------------------
+    def LoopStopConnect(self):
+
+        if self.ConnectTimer != None:
+            self.ConnectTimer.Cancel()
+            self.ConnectTimer = None
+        if self.PendingSocket != None:
+            self.Loop.RemoveWriter(self.PendingSocket.fileno())
+            self.PendingSocket.close()
+            self.PendingSocket = None
+
+    # ---------- TcpDevice::GetFileno------------------
+    def GetFileno(self):
+
+        if self.Socket == None:
+            return None
+        return self.Socket.fileno()
+
+    # ---------- TcpDevice::Reopen------------------
+    def Reopen(self):
+
+        self.Disconnect()
+        self.Connect()
+
+    # ---------- TcpDevice::Read------------------
+    def Read(self):
+
+        if self.Socket == None:
+            if time.time() < self.NextConnectTime:
+                time.sleep(TCP_READ_TIMEOUT)
+                return b""
+            if not self.Connect():
+                return b""
+        try:
+            Data = self.Socket.recv(512)
+        except socket.timeout:
+            return b""
+        except Exception as e1:
+            self.LogError("Error reading from %s: " % self.DeviceName + str(e1))
+            self.Disconnect()
+            return b""
+
+        if not len(Data):
+            # the converter closed the connection
+            self.LogError("Connection closed by %s" % self.DeviceName)
+            self.Disconnect()
+        return Data
+
+    # ---------- TcpDevice::ReadAvailable------------------
+    def ReadAvailable(self):
+
+        if self.Socket == None:
+            return b""
+        return self.Read()
+
+    # ---------- TcpDevice::Write-----------------
+    def Write(self, data):
+
+        if self.Socket == None:
+            return 0
+        try:
+            self.Socket.sendall(bytes(data))
+        except Exception as e1:
+            self.LogError("Error writing to %s: " % self.DeviceName + str(e1))
+            self.Disconnect()
+            return 0
+        return len(data)
+
+    # ---------- TcpDevice::Flush------------------
+    # discard data waiting in the socket as well as the receive buffer
+    def Flush(self):
+
+        try:
+            while self.Socket != None:
+                Readable, Writable, Error = select.select([self.Socket], [], [], 0)
+                if not len(Readable):
+                    break
+                if not len(self.Socket.recv(512)):
+                    self.Disconnect()
+        except Exception as e1:
+            self.LogError("Error in TcpDevice:Flush : " + self.DeviceName + ":" + str(e1))
+            self.Disconnect()
+
+        mytransport.TransportDevice.Flush(self)
+
+    # ---------- TcpDevice::Close------------------
+    def Close(self):
+
+        mytransport.TransportDevice.Close(self)
+        self.Disconnect()
+
+    # ---------- TcpDevice::GetTransportName------------------
+    def GetTransportName(self):
+        return "TCP " + self.DeviceName
+
+    # ---------- TcpDevice::GetStats------------------
+    def GetStats(self):
+
+        Stats = []
+        if self.ConnectTime != None:
+            Stats.append(("TCP Connection", "Connected since %s" % self.ConnectTime.strftime("%Y-%m-%d %H:%M:%S")))
+        else:
+            Stats.append(("TCP Connection", "Not Connected, retry in %d sec" % max(0, self.NextConnectTime - time.time())))
+        Stats.append(("TCP Connects", "%d" % self.Connects))
+        Stats.append(("TCP Disconnects", "%d" % self.Disconnects))
+        Stats.append(("TCP Connect Failures", "%d" % self.ConnectFailures))
+        return Stats
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: mytransport.py
+# PURPOSE: Base class for the modbus transports (serial, TCP)
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import datetime, threading, time, collections
+import mylog, mythread
+
+RX_BUFFER_SIZE = 4096       # initial size of the receive ring buffer, grows if needed
+MAX_FRAME_STARTS = 64       # receive positions after a silent interval that are kept
+
+#------------ RingBuffer class ----------------------------------------------
+# fixed storage receive buffer. Bytes are added at the tail by the read thread
+# and removed from the head by the protocol layer without moving the rest of the
+# buffer. Indexing returns the byte value as an int (python 2 and 3)
+class RingBuffer:
+    def __init__(self, size = RX_BUFFER_SIZE):
+        self.Data = bytearray(size)
+        self.Head = 0
+        self.Count = 0
+
+    # ---------- RingBuffer::__len__------------------
+    def __len__(self):
+        return self.Count
+
+    # ---------- RingBuffer::__getitem__------------------
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += self.Count
+        if index < 0 or index >= self.Count:
+            raise IndexError("RingBuffer index out of range")
+        return self.Data[(self.Head + index) % len(self.Data)]
+
+    # ---------- RingBuffer::Write------------------
+    # append data (str, bytes or bytearray) to the tail of the buffer
+    def Write(self, data):
+
+        Length = len(data)
+        if not Length:
+            return
+        if self.Count + Length > len(self.Data):
+            self.Grow(self.Count + Length)
+        Size = len(self.Data)
+        Tail = (self.Head + self.Count) % Size
+        First = min(Length, Size - Tail)
+        self.Data[Tail:Tail + First] = data[:First]
+        if First < Length:
+            self.Data[0:Length - First] = data[First:]
+        self.Count += Length
+
+    # ---------- RingBuffer::Peek------------------
+    # return count bytes starting offset bytes from the head of the buffer as a
+    # bytearray without removing them
+    def Peek(self, count, offset = 0):
+
+        offset = min(offset, self.Count)
+        count = min(count, self.Count - offset)
+        Size = len(self.Data)
+        Start = (self.Head + offset) % Size
+        End = Start + count
+        if End <= Size:
+            return self.Data[Start:End]
+        return self.Data[Start:] + self.Data[:End - Size]
+
+    # ---------- RingBuffer::Read------------------
+    # remove count bytes from the head of the buffer and return them as a bytearray
+    def Read(self, count):
+
+        Data = self.Peek(count)
+        self.Discard(count)
+        return Data
+
+    # ---------- RingBuffer::Discard------------------
+    def Discard(self, count = 1):
+
+        count = min(count, self.Count)
+        self.Head = (self.Head + count) % len(self.Data)
+        self.Count -= count
+        if not self.Count:
+            self.Head = 0
+
+    # ---------- RingBuffer::Clear------------------
+    def Clear(self):
+        self.Head = 0
+        self.Count = 0
+
+    # ---------- RingBuffer::Grow------------------
+    # re-allocate the storage, this only happens if data is not being removed
+    def Grow(self, size):
+
+        NewSize = len(self.Data)
+        while NewSize < size:
+            NewSize *= 2
+        Data = self.Read(self.Count)
+        self.Data = bytearray(NewSize)
+        self.Data[0:len(Data)] = Data
+        self.Count = len(Data)
+
+#------------ TransportDevice class -----------------------------------------
+# A transport moves bytes between the modbus protocol layer and the controller.
+# This class holds the receive buffer, the read thread and the comms stats. A
+# transport implements OpenDevice, Read, Write, Flush, Close and Reopen and may
+# add its own stats with GetStats. Read must return within about 50ms when no
+# data arrives so the read thread can check the stop signal and deadlines.
+# A transport that can be serviced by an event loop (myeventloop) instead of a
+# read thread also implements GetFileno and ReadAvailable.
+class TransportDevice:
+    def __init__(self, name, loglocation = "/var/log/", logname = "mytransport"):
+        self.DeviceName = name
+        self.Thread = None
+        self.Buffer = RingBuffer()
+        # re-entrant so the protocol layer can hold the lock while parsing a packet
+        self.BufferLock = threading.RLock()
+        # signaled by the read thread when a waiting thread has enough data or timed out
+        self.BufferCondition = threading.Condition(self.BufferLock)
+        self.RxWaitCount = 0                # number of bytes a waiting thread needs, zero if none
+        self.RxDeadline = 0                 # time (time.time()) when the waiting thread times out
+        # receive timing, used to find where frames start
+        self.CharTime = 0                   # seconds to receive one character, set by SetFrameGap
+        self.FrameGap = 0                   # seconds of silence between frames, zero if not known
+        self.LastRxTime = 0                 # time (time.time()) data was last received
+        self.RxTotal = 0                    # bytes added to the buffer since the transport was opened
+        self.FrameStarts = collections.deque(maxlen = MAX_FRAME_STARTS)   # RxTotal positions received after a silent interval
+
+        self.RxPacketCount = 0
+        self.LastRxPacketTime = 0           # time (time.time()) the last valid packet was received
+        self.TxPacketCount = 0
+        self.ComTimoutError = 0
+        self.TotalElapsedPacketeTime = 0
+        self.MinPacketTime = 0              # fastest transaction time (seconds)
+        self.MaxPacketTime = 0              # slowest transaction time (seconds)
+        self.CrcError = 0
+        self.DiscardedBytes = 0
+        self.Resyncs = 0                    # frames found in the buffer after invalid data
+        self.Restarts = 0
+        self.SerialStartTime = datetime.datetime.now()     # used for com metrics
+        self.Loop = None                    # myeventloop.EventLoop if serviced by an event loop instead of the read thread
+        self.LoopFileno = None              # descriptor registered with the event loop
+        self.DataCallback = None            # called on the loop thread after data is added to the buffer
+
+        # log errors in this module to a file
+        self.log = mylog.SetupLogger(logname, loglocation + logname + ".log")
+
+        self.OpenDevice()
+
+        self.Flush()
+
+    # ---------- TransportDevice::OpenDevice------------------
+    def OpenDevice(self):
+        raise NotImplementedError("OpenDevice")
+
+    # ---------- TransportDevice::SetFrameGap------------------
+    # CharTime is the seconds to receive one character, FrameGap the seconds of
+    # silence that separate two frames (3.5 characters for modbus RTU)
+    def SetFrameGap(self, CharTime, FrameGap):
+
+        self.CharTime = CharTime
+        self.FrameGap = FrameGap
+
+    # ---------- TransportDevice::ResetSerialStats------------------
+    def ResetSerialStats(self):
+        # resets status that are time based (affected by a time change)
+        self.SerialStartTime = datetime.datetime.now()     # used for com metrics
+        self.RxPacketCount = 0
+        self.TxPacketCount = 0
+        self.TotalElapsedPacketeTime = 0
+        self.MinPacketTime = 0
+        self.MaxPacketTime = 0
+
+    # ---------- TransportDevice::UpdatePacketTime------------------
+    # record the elapsed time (seconds) of a completed transaction
+    def UpdatePacketTime(self, Elapsed):
+
+        self.TotalElapsedPacketeTime += Elapsed
+        if self.MinPacketTime == 0 or Elapsed < self.MinPacketTime:
+            self.MinPacketTime = Elapsed
+        if Elapsed > self.MaxPacketTime:
+            self.MaxPacketTime = Elapsed
+
+    # ---------- TransportDevice::StartReadThread------------------
+    def StartReadThread(self):
+
+        # start read thread to monitor incoming data commands
+        self.Thread = mythread.MyThread(self.ReadThread, Name = "SerialReadThread")
+
+        return self.Thread
+
+    # ---------- TransportDevice::IsStopSignaled------------------
+    def IsStopSignaled(self):
+
+        if self.Thread == None:
+            return False        # the thread may start before StartReadThread returns
+        return self.Thread.StopSignaled()
+
+    # ---------- TransportDevice::ReadThread------------------
+    def ReadThread(self):
+        try:
+            self.ReadLoop()
+        finally:
+            # release any thread waiting on data, there is no more data coming
+            with self.BufferLock:
+                self.RxWaitCount = 0
+                self.BufferCondition.notify_all()
+
+    # ---------- TransportDevice::ReadLoop------------------
+    def ReadLoop(self):
+        while True:
+            try:
+                self.Flush()
+                while True:
+                    Data = self.Read()
+                    with self.BufferLock:
+                        self.AddData(Data)
+                        # wake a waiting thread if it has its data, or it has timed out
+                        self.SignalWaiter()
+                    if self.IsStopSignaled():
+                        return
+
+            except Exception as e1:
+                self.LogError( "Resetting TransportDevice:ReadThread Error: " + self.DeviceName + ":"+ str(e1))
+                self.Restarts += 1
+                self.Reopen()
+
+    #------------TransportDevice::AddData------------
+    # add received data to the buffer. The data starts a frame if the line was
+    # silent for FrameGap before it, i.e. the time since the last data is longer
+    # than the time to receive this data plus the gap. The timing is only as good
+    # as the OS and adapter buffering, frame starts are used as hints and frames
+    # are always checked with the CRC. GapBefore overrides the timing, the
+    # BufferLock must be held by the caller
+    def AddData(self, Data, GapBefore = None):
+
+        if not len(Data):
+            return
+        Now = time.time()
+        if GapBefore == None:
+            GapBefore = self.FrameGap > 0 and (Now - self.LastRxTime - (len(Data) * self.CharTime)) > self.FrameGap
+        if GapBefore:
+            self.FrameStarts.append(self.RxTotal)
+        self.LastRxTime = Now
+        self.RxTotal += len(Data)
+        self.Buffer.Write(Data)
+
+    #------------TransportDevice::GetFrameStarts------------
+    # return the offsets (from the head of the buffer, after the first byte) of
+    # data received after a silent interval. The BufferLock must be held by the caller
+    def GetFrameStarts(self):
+
+        Head = self.RxTotal - len(self.Buffer)
+        while len(self.FrameStarts) and self.FrameStarts[0] <= Head:
+            self.FrameStarts.popleft()
+        return [Position - Head for Position in self.FrameStarts]
+
+    #------------TransportDevice::SignalWaiter------------
+    # wake the waiting thread once the data it needs has arrived or it has timed out.
+    # BufferLock must be held by the caller
+    def SignalWaiter(self):
+
+        if not self.RxWaitCount:
+            return
+        if len(self.Buffer) >= self.RxWaitCount or time.time() >= self.RxDeadline:
+            self.RxWaitCount = 0
+            self.BufferCondition.notify_all()
+
+    #------------TransportDevice::WaitForData------------
+    # Block until Count bytes are in the receive buffer or Timeout (seconds) expires.
+    # The wait itself does not time out, the read thread wakes the waiting thread
+    # when the data is complete or the deadline has passed. (The read timeout of
+    # each transport, 50ms, bounds the time the deadline is missed by.) This avoids the sleep and
+    # poll loop a timed wait uses on python 2.
+    def WaitForData(self, Count, Timeout):
+
+        with self.BufferLock:
+            if len(self.Buffer) >= Count:
+                return True
+            if Timeout <= 0 or self.Thread == None or not self.Thread.IsAlive():
+                return False
+            self.RxDeadline = time.time() + Timeout
+            self.RxWaitCount = Count
+            self.BufferCondition.wait()
+            self.RxWaitCount = 0
+            return len(self.Buffer) >= Count
+
+    #------------TransportDevice::DiscardByte------------
+    def DiscardByte(self):
+
+        with self.BufferLock:
+            if len(self.Buffer):
+                discard = self.Buffer[0]
+                self.Buffer.Discard(1)
+                self.DiscardedBytes += 1
+                return discard
+
+    #------------TransportDevice::DiscardBytes------------
+    def DiscardBytes(self, Count):
+
+        with self.BufferLock:
+            Count = min(Count, len(self.Buffer))
+            self.Buffer.Discard(Count)
+            self.DiscardedBytes += Count
+
+    #------------TransportDevice::GetPacket------------
+    # remove Count bytes from the receive buffer, returned as a bytearray
+    def GetPacket(self, Count):
+
+        with self.BufferLock:
+            return self.Buffer.Read(Count)
+
+
+    # ---------- TransportDevice::Read------------------
+    # return the data received (may be empty), waiting no more than about 50ms
+    def Read(self):
+        raise NotImplementedError("Read")
+
+    # ---------- TransportDevice::GetFileno------------------
+    # descriptor the event loop waits on, None if the transport can not be
+    # serviced by an event loop (or is not connected)
+    def GetFileno(self):
+        return None
+
+    # ---------- TransportDevice::ReadAvailable------------------
+    # return the data waiting without blocking, called when the descriptor is readable
+    def ReadAvailable(self):
+        raise NotImplementedError("ReadAvailable")
+
+    # ---------- TransportDevice::AttachLoop------------------
+    # service the transport from an event loop instead of the read thread.
+    # DataCallback is called on the loop thread each time data is received
+    def AttachLoop(self, Loop, DataCallback):
+
+        self.Loop = Loop
+        self.DataCallback = DataCallback
+        Loop.RunInLoop(self.LoopAddReader)
+
+    # ---------- TransportDevice::DetachLoop------------------
+    def DetachLoop(self):
+
+        if self.Loop == None:
+            return
+        Loop = self.Loop
+        Loop.RunInLoop(self.LoopRemoveReader)
+        self.Loop = None
+
+    # ---------- TransportDevice::LoopAddReader------------------
+    def LoopAddReader(self):
+
+        self.LoopFileno = self.GetFileno()
+        if self.LoopFileno != None:
+            self.Loop.AddReader(self.LoopFileno, self.LoopRead)
+
+    # ---------- TransportDevice::LoopRemoveReader------------------
+    def LoopRemoveReader(self):
+
+        if self.LoopFileno != None:
+            self.Loop.RemoveReader(self.LoopFileno)
+            self.LoopFileno = None
+
+    # ---------- TransportDevice::LoopRead------------------
+    # the descriptor is readable, called on the loop thread
+    def LoopRead(self):
+
+        try:
+            Data = self.ReadAvailable()
+        except Exception as e1:
+            self.LogError( "Resetting TransportDevice:LoopRead Error: " + self.DeviceName + ":"+ str(e1))
+            self.Restarts += 1
+            self.LoopRemoveReader()
+            self.Reopen()
+            self.LoopAddReader()
+            return
+        if not len(Data):
+            return
+        with self.BufferLock:
+            self.AddData(Data)
+        if self.DataCallback != None:
+            self.DataCallback()
+
+    # ---------- TransportDevice::Write-----------------
+    def Write(self, data):
+        raise NotImplementedError("Write")
+
+    # ---------- TransportDevice::Flush------------------
+    def Flush(self):
+        with self.BufferLock:               # will block if lock is already held
+            self.Buffer.Clear()
+
+    # ---------- TransportDevice::Reopen------------------
+    # called by the read thread after a read error
+    def Reopen(self):
+        pass
+
+    # ---------- TransportDevice::Close------------------
+    def Close(self):
+        self.DetachLoop()
+        if self.Thread != None and self.Thread.IsAlive():
+            self.Thread.Stop()
+            self.Thread.WaitForThreadToEnd()
+
+    # ---------- TransportDevice::GetTransportName------------------
+    def GetTransportName(self):
+        return self.DeviceName
+
+    # ---------- TransportDevice::GetStats------------------
+    # return a list of (name, value) of the stats specific to the transport
+    def GetStats(self):
+        return []
+
+    #---------------------TransportDevice::LogError------------------------
+    def LogError(self, Message):
+        self.log.error(Message)
+    #---------------------TransportDevice::FatalError------------------------
+    def FatalError(self, Message):
+
+        self.log.error(Message)
+        raise Exception(Message)
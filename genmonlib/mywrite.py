@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+#------------------------------------------------------------
+#    FILE: mywrite.py
+# PURPOSE: Write several controller registers as one command
+#
+#  AUTHOR: Jason G Yates
+#    DATE: 19-Apr-2018
+#
+# MODIFICATIONS:
+#------------------------------------------------------------
+
+from __future__ import print_function       # For python 3.x compatibility with print function
+
+import mymodbus
+
+MAX_WRITE_LENGTH        = 123       # modbus limit for registers in one write multiple request
+
+RESULT_NAMES            = {mymodbus.RESULT_OK : "ok", mymodbus.RESULT_ERROR : "invalid response",
+                           mymodbus.RESULT_TIMEOUT : "no response", mymodbus.RESULT_EXCEPTION : "rejected"}
+
+#------------ WriteTransaction class -------------------------------------------
+# The register writes of one command. Writes are sent in the order they are
+# added. A write to the register that follows the last register of the
+# previous write is packed into the same write multiple frame, the controller
+# writes the registers of a frame in ascending order so the order of the
+# writes does not change. A write of a lower register (i.e. an index register
+# written after its data register) starts a new frame. If the controller
+# answers a combined frame with an exception response the writes are sent one
+# at a time and that frame is not combined again.
+#
+# The registers marked for verification are read before the first frame is
+# sent and read back after the last one. If a frame fails, or a register does
+# not read back as written, the verified registers already written are
+# restored to the values read before the command (if Rollback), in the order
+# they were written so a register written last (i.e. one that makes the
+# controller act on the others) is also restored last. GetReport says what was
+# applied and what was restored.
+class WriteTransaction:
+    def __init__(self, ModBus, Name, Combine = True, Rollback = True, Priority = mymodbus.PRIORITY_CONTROL):
+
+        self.ModBus = ModBus
+        self.Name = Name
+        self.Combine = Combine
+        self.Rollback = Rollback
+        self.Priority = Priority
+        self.Writes = []                # [Register (int), Data (list of bytes), Verify]
+        self.Original = {}              # Register (int) : Data (list of 2 bytes) read before the write
+        self.Applied = []               # registers (int) written
+        self.NotApplied = []            # registers (int) not written
+        self.Restored = []              # registers (int) restored to the original value
+        self.NotRestored = []           # registers (int) that could not be restored
+        self.Mismatched = []            # registers (int) that did not read back as written
+        self.Frames = 0                 # write frames sent
+        self.Error = None               # reason the command failed
+
+    # ---------- WriteTransaction::AddWrite------------------
+    # add a write of Data (list of bytes, two per register) at Register (hex
+    # string). Verify is False for registers that do not read back as written,
+    # i.e. the index registers that start a controller command
+    def AddWrite(self, Register, Data, Verify = True):
+
+        if not len(Data) or len(Data) % 2:
+            raise Exception("Invalid data length for register %s: %d" % (Register, len(Data)))
+        self.Writes.append([int(Register, 16), list(Data), Verify])
+
+    # ---------- WriteTransaction::AddValue------------------
+    # add a write of a 16 bit value
+    def AddValue(self, Register, Value, Verify = True):
+
+        self.AddWrite(Register, [(Value >> 8) & 0x00FF, Value & 0x00FF], Verify)
+
+    # ---------- WriteTransaction::GetFrames------------------
+    # pack the writes into frames, returns a list of [Register, Data, [writes]]
+    def GetFrames(self, Writes):
+
+        Frames = []
+        for Write in Writes:
+            Register, Data, Verify = Write
+            if self.Combine and len(Frames):
+                Frame = Frames[-1]
+                Length = len(Frame[1]) // 2
+                if Register == Frame[0] + Length and Length + (len(Data) // 2) <= MAX_WRITE_LENGTH:
+                    Frame[1] = Frame[1] + Data
+                    Frame[2].append(Write)
+                    continue
+            Frames.append([Register, list(Data), [Write]])
+        return Frames
+
+    # ---------- WriteTransaction::Execute------------------
+    # send the writes, returns True if all were written (and verified)
+    def Execute(self):
+
+        if not len(self.Writes):
+            return True
+
+        # read the current values of the verified registers, without them the command can not be rolled back
+        for Register, Data, Writes in self.GetFrames([Write for Write in self.Writes if Write[2]]):
+            Values = self.ReadRegisters(Register, len(Data) // 2)
+            if Values == None:
+                self.Error = "unable to read register %04x before writing" % Register
+                self.NotApplied = [Register for Write in self.Writes for Register in self.GetRegisters(Write)]
+                return False
+            for Index in range(0, len(Values)):
+                self.Original[Register + Index] = Values[Index]
+
+        for Frame in self.GetFrames(self.Writes):
+            Key = (Frame[0], len(Frame[1]) // 2)
+            if len(Frame[2]) > 1 and Key in self.ModBus.RejectedWrites:
+                # rejected before, it is not sent combined again
+                Result, ResultCode = False, mymodbus.RESULT_EXCEPTION
+            else:
+                Result, ResultCode = self.WriteFrame(Frame[0], Frame[1])
+            if not Result and ResultCode == mymodbus.RESULT_EXCEPTION and len(Frame[2]) > 1:
+                # the controller does not accept these registers in one frame, write them one at a time
+                if not Key in self.ModBus.RejectedWrites:
+                    self.ModBus.RejectedWrites.add(Key)
+                    self.ModBus.LogError("Combined write of %04x (length %d) rejected, writing registers separately" % Key)
+                for Write in Frame[2]:
+                    Result, ResultCode = self.WriteFrame(Write[0], Write[1])
+                    if not Result:
+                        break
+                    self.Applied.extend(self.GetRegisters(Write))
+            elif Result:
+                self.ModBus.CombinedWrites += len(Frame[2]) - 1
+                for Write in Frame[2]:
+                    self.Applied.extend(self.GetRegisters(Write))
+            if not Result:
+                self.Error = "write failed (%s)" % RESULT_NAMES.get(ResultCode, "error")
+                break
+
+        self.NotApplied = [Register for Write in self.Writes for Register in self.GetRegisters(Write) if not Register in self.Applied]
+        if self.Error == None:
+            self.Verify()
+        if self.Error != None:
+            self.DoRollback()
+            return False
+        return True
+
+    # ---------- WriteTransaction::GetRegisters------------------
+    # the registers (int) of a write
+    def GetRegisters(self, Write):
+
+        return list(range(Write[0], Write[0] + (len(Write[1]) // 2)))
+
+    # ---------- WriteTransaction::WriteFrame------------------
+    # send one write multiple frame, returns True if written and the result code
+    def WriteFrame(self, Register, Data):
+
+        Transaction = self.ModBus.WriteRegisters("%04x" % Register, Data, Priority = self.Priority)
+        Result = Transaction.Wait()
+        self.Frames += 1
+        return Result, Transaction.ResultCode
+
+    # ---------- WriteTransaction::ReadRegisters------------------
+    # read Length registers at Register, returns a list of [hi, lo] per register or None
+    def ReadRegisters(self, Register, Length):
+
+        Value = self.ModBus.ProcessMasterSlaveTransaction("%04x" % Register, Length, ReturnValue = True, Priority = self.Priority)
+        if not Value or len(Value) != Length * 4:
+            return None
+        Values = []
+        for Index in range(0, Length):
+            Word = int(Value[Index * 4:(Index * 4) + 4], 16)
+            Values.append([Word >> 8, Word & 0x00FF])
+        return Values
+
+    # ---------- WriteTransaction::Verify------------------
+    # read back the verified registers, the values read update the register cache.
+    # Contiguous verified registers are read together
+    def Verify(self):
+
+        for Register, Data, Writes in self.GetFrames([Write for Write in self.Writes if Write[2]]):
+            Values = self.ReadRegisters(Register, len(Data) // 2)
+            if Values == None:
+                self.Error = "unable to read back register %04x" % Register
+                return
+            for Index in range(0, len(Values)):
+                self.ModBus.UpdateRegisterList("%04x" % (Register + Index), "%02x%02x" % tuple(Values[Index]))
+                if Values[Index] != Data[Index * 2:(Index * 2) + 2]:
+                    self.Mismatched.append(Register + Index)
+        if len(self.Mismatched):
+            self.ModBus.WriteVerifyFailures += len(self.Mismatched)
+            self.Error = "register(s) %s did not read back as written" % self.FormatRegisters(self.Mismatched)
+
+    # ---------- WriteTransaction::DoRollback------------------
+    # restore the verified registers already written, in the order they were written
+    def DoRollback(self):
+
+        self.ModBus.LogError("%s: %s" % (self.Name, self.Error))
+        if not self.Rollback:
+            return
+        Restore = [Register for Register in self.Applied if Register in self.Original]
+        if not len(Restore):
+            return
+        self.ModBus.WriteRollbacks += 1
+        for Register in Restore:
+            Result, ResultCode = self.WriteFrame(Register, self.Original[Register])
+            if Result:
+                self.Restored.append(Register)
+            else:
+                self.NotRestored.append(Register)
+        self.ModBus.LogError("%s: rolled back, restored: %s, not restored: %s" % (self.Name, self.FormatRegisters(self.Restored), self.FormatRegisters(self.NotRestored)))
+
+    # ---------- WriteTransaction::FormatRegisters------------------
+    def FormatRegisters(self, Registers):
+
+        if not len(Registers):
+            return "none"
+        return ", ".join("%04x" % Register for Register in sorted(Registers))
+
+    # ---------- WriteTransaction::GetReport------------------
+    # one line describing the outcome, for the command response
+    def GetReport(self):
+
+        if self.Error == None:
+            return "%s: registers %s written in %d frame(s)" % (self.Name, self.FormatRegisters(self.Applied), self.Frames)
+        outstr = "%s failed, %s. Written: %s, not written: %s" % (self.Name, self.Error,
+            self.FormatRegisters(self.Applied), self.FormatRegisters(self.NotApplied))
+        if len(self.Restored) or len(self.NotRestored):
+            outstr += ", restored: %s" % self.FormatRegisters(self.Restored)
+            if len(self.NotRestored):
+                outstr += ", NOT restored: %s" % self.FormatRegisters(self.NotRestored)
+        return outstr
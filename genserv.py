@@ -102,8 +102,13 @@ def ProcessCommand(command):
         "logs", "logs_json", "monitor", "monitor_json", "registers_json", "allregs_json",
         "start_info_json", "gui_status_json", "power_log_json", "power_log_clear",
         "getbase", "getsitename","setexercise", "setquiet", "getexercise", "setremote",
-        "settime", "reload"]:
-        finalcommand = "generator: " + command
+        "settime", "reload", "units_json"]:
+        # /cmd/status_json?unit=2 is sent to unit 2 as generator[2]: status_json
+        unit = request.args.get('unit', 0, type=int)
+        if unit:
+            finalcommand = "generator[%d]: " % unit + command
+        else:
+            finalcommand = "generator: " + command
         try:
             if command == "setexercise":
                 settimestr = request.args.get('setexercise', 0, type=str)
@@ -133,7 +138,7 @@ def ProcessCommand(command):
                 Reload()                # reload Flask App
 
         if command in ["status_json", "outage_json", "maint_json", "monitor_json", "logs_json",
-            "registers_json", "allregs_json", "start_info_json", "gui_status_json", "power_log_json"]:
+            "registers_json", "allregs_json", "start_info_json", "gui_status_json", "power_log_json", "units_json"]:
             return data
         return jsonify(data)
 
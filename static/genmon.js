@@ -28,15 +28,27 @@ var regHistory = {updateTime: {}, _10m: {}, _60m: {}, _24h: {}, historySince: ""
 var kwHistory = {data: [], plot:"", kwDuration: "h", tickInterval: "10 minutes", formatString: "%H:%M"};
 var pathname = window.location.href;
 var baseurl = pathname.concat("cmd/");
+var genUnit = 1;                // selected generator unit
+var genUnits = [];              // units managed by genmon, from units_json
+var registerSnapshot = -1;      // register snapshot sequence from gui_status_json, changes when a register changes
+var maintSnapshot = -1;         // register snapshot the maintenance page was last updated from
 var DaysOfWeekArray = ["Sunday","Monday","Tuesday","Wednesday", "Thursday", "Friday", "Saturday"];
 var MonthsOfYearArray = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"];
 
 vex.defaultOptions.className = 'vex-theme-os'
 
+// send the selected unit with every command, unit 1 is the default
+$.ajaxPrefilter(function(options, originalOptions, jqXHR) {
+    if ((genUnit != 1) && (options.url.indexOf(baseurl) == 0)) {
+        options.data = ((options.data) ? options.data + "&" : "") + "unit=" + genUnit;
+    }
+});
+
 //*****************************************************************************
 // called on window.onload
 //      sets up listener events (click menu) and inits the default page
 //*****************************************************************************
+GetUnits();
 GetGeneratorModel();
 GetBaseStatus();
 SetFavIcon();
@@ -666,6 +678,11 @@ function DisplayMaintenanceUpdate(){
 
     myGenerator["OldExerciseParameters"] = [myGenerator['ExerciseDay'], myGenerator['ExerciseHour'], myGenerator['ExerciseMinute'], myGenerator['QuietMode'], myGenerator['ExerciseFrequency'], myGenerator['EnhancedExerciseEnabled']];
 
+    // the maintenance values only change when a register changes
+    if ((registerSnapshot >= 0) && (registerSnapshot == maintSnapshot))
+        return;
+    maintSnapshot = registerSnapshot;
+
     var url = baseurl.concat("maint_json");
     $.ajax({dataType: "json", url: url, timeout: 4000, error: processAjaxError, success: function(result){
         processAjaxSuccess();
@@ -1876,9 +1893,55 @@ function GetGeneratorModel()
 //*****************************************************************************
 function SetHeaderValues()
 {
-   var HeaderStr = '<table border="0" width="100%" height="30px"><tr><td width="30px"></td><td width="90%">Generator Monitor at ' + myGenerator["sitename"] + '</td><td width="30px"><img id="registers" src="images/registers.png" width="20px" height="20px"></td></tr></table>';
+   var UnitStr = "";
+   if (genUnits.length > 1) {
+      UnitStr = '&nbsp;<select id="unitSelect">';
+      for (var i = 0; i < genUnits.length; i++) {
+         UnitStr += '<option value="' + genUnits[i]["Unit"] + '"' + ((genUnits[i]["Unit"] == genUnit) ? ' selected' : '') + '>Unit ' + genUnits[i]["Unit"] + '</option>';
+      }
+      UnitStr += '</select>';
+   }
+   var HeaderStr = '<table border="0" width="100%" height="30px"><tr><td width="30px"></td><td width="90%">Generator Monitor at ' + myGenerator["sitename"] + UnitStr + '</td><td width="30px"><img id="registers" src="images/registers.png" width="20px" height="20px"></td></tr></table>';
    $("#myheader").html(HeaderStr);
    $("#registers").on('click',  function() {  MenuClick($(this));});
+   $("#unitSelect").on('change',  function() {  SetUnit(parseInt($(this).val()));});
+}
+
+//*****************************************************************************
+// GetUnits - Get the generators managed by genmon, a unit selector is shown
+//            in the header if there is more than one
+//*****************************************************************************
+function GetUnits()
+{
+    url = baseurl.concat("units_json");
+    $.ajax({dataType: "json", url: url, timeout: 4000, error: processAjaxError, success: function(result){
+      processAjaxSuccess();
+
+      genUnits = [];
+      $.each(result["Units"], function(key, value) { genUnits.push(value); });
+      SetHeaderValues();
+    }});
+}
+
+//*****************************************************************************
+// SetUnit - select a generator unit and reload the values displayed
+//*****************************************************************************
+function SetUnit(unit)
+{
+    genUnit = unit;
+    registerSnapshot = -1;
+    maintSnapshot = -1;
+    regHistory = {updateTime: {}, _10m: {}, _60m: {}, _24h: {}, historySince: "", count_60m: 0, count_24h: 0};
+    kwHistory["data"] = [];
+    GetGeneratorModel();
+    GetBaseStatus();
+    GetkWHistory();
+    UpdateRegisters(true, false);
+    if (menuElement == "registers") {
+       DisplayRegistersFull();
+    } else {
+       MenuClick($("#" + menuElement));
+    }
 }
 
 
@@ -1971,6 +2034,9 @@ function GetBaseStatus()
         // NOTE: Last param (True or False) is if enhanced exercise freq is enabled
         var resultsArray = result['Exercise'].split("!");
 
+        if ("Snapshot" in result)
+            registerSnapshot = result['Snapshot'];
+
         if (resultsArray.length == 6){
             myGenerator['ExerciseDay'] = resultsArray[0];
             myGenerator['ExerciseHour'] = resultsArray[1];